@@ -0,0 +1,111 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Benchmark of the path data serialization.
+
+Compares the former formatPath / to_path_string implementations (str() of
+every float, joined by nested comprehensions) with the patron_path builder,
+on path data shaped like the generated templates: time to write the path
+data, its size, and time to parse it back (patron_path.parse_path, standing
+for the downstream svg readers).
+
+usage:
+    python benchmarks/bench_format_path.py -n 2000 --precision 3
+-----------------------------------------------
+"""
+
+import optparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import patron_path
+
+
+# ---------------------------------------------------------------- #
+#                     FORMER IMPLEMENTATIONS
+# ---------------------------------------------------------------- #
+def legacy_to_path_string(arr, close=True):
+    return "m %s%s" % (' '.join([','.join([str(c) for c in pt]) for pt in arr]), " z" if close else "")
+
+
+def legacy_format_path(a):
+    return "".join([" %s " % cmd + " ".join([str(p) for p in params]) for cmd, params in a])
+
+
+# ---------------------------------------------------------------- #
+#                            SAMPLES
+# ---------------------------------------------------------------- #
+def sample_piece(rng):
+    """ Outline of a main piece: neckline, shoulder, armhole, side and hem """
+    neck, drop, hip = rng.uniform(60, 90), rng.uniform(20, 90), rng.uniform(600, 800)
+    shoulder, chest = rng.uniform(150, 200), rng.uniform(220, 300)
+    return [
+        ['m', [neck, 0.0]],
+        ['c', [0.0, drop * 0.6, -neck * 0.5, drop, -neck, drop]],
+        ['l', [0.0, hip - drop]],
+        ['l', [chest, 0.0]],
+        ['C', [chest + 0.1, hip * 0.7, chest * 0.97, hip * 0.45, chest, hip * 0.4]],
+        ['c', [-chest * 0.1, -hip * 0.1, -chest * 0.12, -hip * 0.2, -chest * 0.1 + 0.3, -hip * 0.3]],
+        ['L', [shoulder, rng.uniform(10, 40)]],
+        ['Z', []]
+    ]
+
+
+def sample_line(rng):
+    """ Reference dotted lines, as relative point lists """
+    return [(0, 0), (rng.uniform(0, 300), rng.uniform(0, 900))]
+
+
+# ---------------------------------------------------------------- #
+#                             MAIN
+# ---------------------------------------------------------------- #
+def measure(function, samples, repeat):
+    return min(timeit.repeat(lambda: [function(sample) for sample in samples], number=1, repeat=repeat))
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage="usage: %prog [options]")
+    parser.add_option("-n", "--count", type="int", dest="count", default=2000,
+                      help="Number of paths of each kind")
+    parser.add_option("-r", "--repeat", type="int", dest="repeat", default=5,
+                      help="Number of timed runs, the best one is kept")
+    parser.add_option("-p", "--precision", type="int", dest="precision", default=patron_path.PRECISION,
+                      help="Number of decimals of the builder")
+    parser.add_option("--seed", type="int", dest="seed", default=1,
+                      help="Random seed of the sample paths")
+    options, args = parser.parse_args(argv)
+
+    rng = random.Random(options.seed)
+    pieces = [sample_piece(rng) for _ in range(options.count)]
+    lines = [sample_line(rng) for _ in range(options.count)]
+    precision = options.precision
+
+    cases = [
+        ('formatPath', pieces, legacy_format_path,
+         lambda path: patron_path.build_path(path, precision)),
+        ('to_path_string', lines, legacy_to_path_string,
+         lambda points: patron_path.format_points(points, True, precision, relative=True)),
+    ]
+    print('%-16s %-8s %12s %12s %12s' % ('function', '', 'write (s)', 'size (B)', 'parse (s)'))
+    for name, samples, legacy, builder in cases:
+        results = []
+        for label, function in (('legacy', legacy), ('builder', builder)):
+            data = [function(sample) for sample in samples]
+            results.append((measure(function, samples, options.repeat), sum(len(d) for d in data),
+                            measure(patron_path.parse_path, data, options.repeat)))
+            print('%-16s %-8s %12.4f %12d %12.4f' % ((name, label) + results[-1]))
+        (legacy_write, legacy_size, legacy_parse), (write, size, parse) = results
+        print('%-16s %-8s %11.2fx %11.1f%% %11.2fx' % (name, 'ratio', write / legacy_write,
+                                                       100.0 * size / legacy_size, parse / legacy_parse))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
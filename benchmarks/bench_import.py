@@ -0,0 +1,95 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Benchmark of the startup time of the Patron modules.
+
+Each case is run in a fresh python process: the time to import the module,
+then the time to compute one template from the default measurements. The
+patron_core module has no Inkscape nor numpy dependency, while the Patron
+effect (patron) imports inkex.
+
+The inkex modules are looked up in --inkex (the Inkscape extensions directory),
+the effect case is reported as skipped when they can not be imported.
+
+usage:
+    python benchmarks/bench_import.py -r 10 --inkex /usr/share/inkscape/extensions
+-----------------------------------------------
+"""
+
+import json
+import optparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Timed in a fresh process: the import statement, then the computation of one template
+CASE = '''
+import json, sys, time
+start = time.time()
+%s
+imported = time.time()
+%s
+done = time.time()
+sys.stdout.write(json.dumps([imported - start, done - imported]))
+'''
+
+DEFAULTS = ("row = dict(neck=11, shoulder=44, hip=89, waist=79, chest=97, hsp_chest=21, hsp_waist=45, hsp_hip=67, "
+            "bicep=23, top_sleeve=20, bottom_sleeve=17, ease=5, neck_front=0, neck_rear=6, shoulder_drop=3)")
+
+CASES = [
+    ('patron_core', 'import patron_core, patron_path',
+     DEFAULTS + '''
+cm = patron_core.unit_factor('cm')
+geometry = patron_core.compute(patron_core.user_measurements(patron_core.measurements(row), cm, cm), cm)
+patron_path.build_path(geometry['front']['sewing'])'''),
+    ('patron (inkex)', 'import patron',
+     'effect = patron.Patron()'),
+]
+
+
+# ---------------------------------------------------------------- #
+#                             MAIN
+# ---------------------------------------------------------------- #
+def run_case(statement, computation, env):
+    """
+        Run a case in a new interpreter.
+        - return (import seconds, computation seconds), or None if it failed
+    """
+    process = subprocess.Popen([sys.executable, '-c', CASE % (statement, computation)], cwd=ROOT, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    if process.returncode:
+        return None
+    return json.loads(out.decode('utf-8'))
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage="usage: %prog [options]")
+    parser.add_option("-r", "--repeat", type="int", dest="repeat", default=10,
+                      help="Number of fresh processes per case, the best one is kept")
+    parser.add_option("--inkex", type="string", dest="inkex", default='',
+                      help="Directory of the inkex modules (Inkscape extensions directory)")
+    options, args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, options.inkex, env.get('PYTHONPATH')]))
+
+    print('%-16s %12s %12s' % ('module', 'import (ms)', 'compute (ms)'))
+    for name, statement, computation in CASES:
+        results = [run_case(statement, computation, env) for _ in range(options.repeat)]
+        results = [result for result in results if result is not None]
+        if not results:
+            print('%-16s %12s %12s' % (name, 'skipped', ''))
+            continue
+        print('%-16s %12.1f %12.1f' % (name, 1000 * min(result[0] for result in results),
+                                       1000 * min(result[1] for result in results)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
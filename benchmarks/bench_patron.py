@@ -0,0 +1,256 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Benchmark and regression check of the template generation hot paths.
+
+Runs without Inkscape: the minimal inkex and simplestyle modules of
+benchmarks/stubs are used, unless the directory of the real ones is given
+(--inkex). The cases:
+ - Patron.effect on the 'perso' template, grid on and off, print and cut styles
+ - Patron.saved_template for every type and size of 'patron.xml'
+ - formatPath and to_path_string on generated template paths
+ - points_to_bbox on large point lists
+
+Each case is run once to warm up, then timed --repeat times (the best wall time
+is kept), then run once more under tracemalloc for its peak memory (the python
+allocations only, not the lxml ones, and none on python 2). The element
+count and output bytes are those of the produced svg tree or path data.
+
+The results can be saved as a baseline (--save), and are otherwise compared to
+it: the run fails (exit status 1) when a case gets slower, bigger or uses more
+memory than the baseline by more than --threshold.
+
+usage:
+    python benchmarks/bench_patron.py --save          # record the baseline
+    python benchmarks/bench_patron.py -t 0.2          # compare to it
+    python benchmarks/bench_patron.py -k saved -r 20  # only the saved templates
+-----------------------------------------------
+"""
+
+import json
+import optparse
+import os
+import random
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None  # python 2, no peak memory
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stubs')
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+METRICS = ('wall', 'memory', 'elements', 'bytes')
+
+# Absolute slack on the wall time comparison (seconds), below the timer noise of the shortest cases
+TIME_SLACK = 0.0002
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+# ---------------------------------------------------------------- #
+#                             CASES
+# ---------------------------------------------------------------- #
+def tree_size(element, etree):
+    """ - return (element count, serialized bytes) of an svg element """
+    return sum(1 for _ in element.iter()), len(etree.tostring(element))
+
+
+def effect_cases():
+    """ Patron.effect on a blank document, the way patron_batch renders a row """
+    import patron_batch
+
+    patron_batch.init_worker(None, patron_batch.BLANK_DOCUMENT)
+    etree = patron_batch._worker['etree']
+    cases = []
+    for style in ('print', 'cut'):
+        for grid in (True, False):
+            row = {'type': 'perso', 'style': style, 'grid': grid}
+            cases.append(('effect perso %s %s' % (style, 'grid' if grid else 'nogrid'), None,
+                          lambda row=row: patron_batch.render(row),
+                          lambda document: tree_size(document.getroot(), etree)))
+    return cases
+
+
+def saved_template_cases():
+    """ Patron.saved_template for every stored type and size """
+    import patron
+    import patron_batch
+    import patron_store
+
+    effect = patron_batch._worker['effect']
+    etree = patron_batch._worker['etree']
+    store = patron_store.open_store(patron.TEMPLATES_FILE)
+
+    def prepare(template_id):
+        effect.getoptions(['--type=%s' % template_id])
+        effect.document = etree.ElementTree(etree.fromstring(patron_batch.BLANK_DOCUMENT))
+        effect.getposinfo()
+        effect.styles = effect.output_styles()
+
+    cases = []
+    for category in store.types():
+        for size in sorted(store.sizes(category), key=float):
+            template_id = '%s_%s' % (category, size)
+            cases.append(('saved_template %s' % template_id, lambda template_id=template_id: prepare(template_id),
+                          lambda template_id=template_id: effect.saved_template(template_id),
+                          lambda group: tree_size(group, etree)))
+    return cases
+
+
+def path_cases(count, seed):
+    """ formatPath and to_path_string, on the sample paths of bench_format_path """
+    import bench_format_path
+    import patron
+
+    rng = random.Random(seed)
+    pieces = [bench_format_path.sample_piece(rng) for _ in range(count)]
+    lines = [bench_format_path.sample_line(rng) for _ in range(count)]
+    describe = lambda data: (len(data), sum(len(d) for d in data))
+    return [
+        ('formatPath x%d' % count, None, lambda: [patron.formatPath(piece) for piece in pieces], describe),
+        ('to_path_string x%d' % count, None, lambda: [patron.to_path_string(line) for line in lines], describe),
+    ]
+
+
+def bbox_cases(sizes, seed):
+    """ points_to_bbox on large point lists """
+    import patron_path
+
+    rng = random.Random(seed)
+    cases = []
+    for size in sizes:
+        points = [(rng.uniform(-1000, 1000), rng.uniform(-1000, 1000)) for _ in range(size)]
+        cases.append(('points_to_bbox %d' % size, None, lambda points=points: patron_path.points_to_bbox(points),
+                      lambda bbox, size=size: (size, None)))
+    return cases
+
+
+# ---------------------------------------------------------------- #
+#                          MEASUREMENT
+# ---------------------------------------------------------------- #
+def measure(prepare, function, describe, repeat):
+    """
+        Run a case: a warm up run, the timed runs, and a traced run.
+        - return a dict of the METRICS (memory is None without tracemalloc)
+    """
+    if prepare is not None:
+        prepare()
+    elements, size = describe(function())
+    wall = None
+    for _ in range(repeat):
+        if prepare is not None:
+            prepare()
+        start = timer()
+        function()
+        elapsed = timer() - start
+        wall = elapsed if wall is None else min(wall, elapsed)
+
+    memory = None
+    if tracemalloc is not None:
+        if prepare is not None:
+            prepare()
+        tracemalloc.start()
+        try:
+            result = function()
+            memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        del result
+    return {'wall': wall, 'memory': memory, 'elements': elements, 'bytes': size}
+
+
+def regressions(result, base, threshold):
+    """
+        Compare a case to its baseline.
+        - return the list of the metrics over the threshold, as (metric, base, current)
+    """
+    found = []
+    for metric in METRICS:
+        current, previous = result.get(metric), base.get(metric)
+        if current is None or previous is None:
+            continue
+        limit = previous * (1 + threshold) + (TIME_SLACK if metric == 'wall' else 0)
+        if current > limit:
+            found.append((metric, previous, current))
+    return found
+
+
+def format_change(current, previous):
+    if current is None or not previous:
+        return ''
+    return '%+.1f%%' % (100.0 * (current - previous) / previous)
+
+
+# ---------------------------------------------------------------- #
+#                             MAIN
+# ---------------------------------------------------------------- #
+def main(argv=None):
+    parser = optparse.OptionParser(usage="usage: %prog [options]")
+    parser.add_option("-r", "--repeat", type="int", dest="repeat", default=5,
+                      help="Number of timed runs per case, the best one is kept")
+    parser.add_option("-k", "--filter", type="string", dest="filter", default='',
+                      help="Only run the cases whose name contains this text")
+    parser.add_option("-n", "--count", type="int", dest="count", default=2000,
+                      help="Number of paths of the formatPath and to_path_string cases")
+    parser.add_option("--points", type="string", dest="points", default='10000,1000000',
+                      help="Point list sizes of the points_to_bbox cases")
+    parser.add_option("--seed", type="int", dest="seed", default=1,
+                      help="Random seed of the sample paths and points")
+    parser.add_option("--inkex", type="string", dest="inkex", default='',
+                      help="Directory of the inkex modules (Inkscape extensions directory), instead of the stubs")
+    parser.add_option("-b", "--baseline", type="string", dest="baseline", default=BASELINE_FILE,
+                      help="Baseline file")
+    parser.add_option("--save", action="store_true", dest="save", default=False,
+                      help="Save the results as the baseline instead of comparing them")
+    parser.add_option("-t", "--threshold", type="float", dest="threshold", default=0.25,
+                      help="Allowed relative increase of each metric over the baseline")
+    options, args = parser.parse_args(argv)
+
+    sys.path[:0] = [ROOT, options.inkex or STUBS]
+
+    cases = (effect_cases() + saved_template_cases() + path_cases(options.count, options.seed) +
+             bbox_cases([int(size) for size in options.points.split(',')], options.seed))
+    cases = [case for case in cases if options.filter in case[0]]
+
+    baseline = {}
+    if not options.save and os.path.exists(options.baseline):
+        with open(options.baseline) as stream:
+            baseline = json.load(stream)['cases']
+
+    results = {}
+    failures = []
+    print('%-28s %10s %8s %12s %9s %10s %8s' % ('case', 'wall (ms)', '', 'memory (KB)', 'elements', 'bytes', ''))
+    for name, prepare, function, describe in cases:
+        result = results[name] = measure(prepare, function, describe, options.repeat)
+        base = baseline.get(name, {})
+        print('%-28s %10.3f %8s %12s %9s %10s %8s' % (
+            name, 1000 * result['wall'], format_change(result['wall'], base.get('wall')),
+            '%.1f' % (result['memory'] / 1024.0) if result['memory'] is not None else '-',
+            result['elements'] if result['elements'] is not None else '-',
+            result['bytes'] if result['bytes'] is not None else '-',
+            format_change(result['bytes'], base.get('bytes'))))
+        failures.extend((name,) + found for found in regressions(result, base, options.threshold))
+
+    if options.save:
+        with open(options.baseline, 'w') as stream:
+            json.dump({'python': sys.version.split()[0], 'repeat': options.repeat, 'cases': results}, stream,
+                      indent=2, sort_keys=True)
+        sys.stderr.write('baseline saved to %s\n' % options.baseline)
+        return 0
+    if not baseline:
+        sys.stderr.write('no baseline to compare to, run with --save first\n')
+        return 0
+    for name, metric, previous, current in failures:
+        sys.stderr.write('REGRESSION %s: %s %s -> %s (threshold %+.0f%%)\n'
+                         % (name, metric, previous, current, 100 * options.threshold))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Minimal stand-in of the Inkscape 0.92 inkex module, for the benchmarks.
+
+Only the part of the API used by the Patron extension is provided: the Effect
+base class (options, document parsing and output, unit conversion), addNS,
+the lxml etree, localize and errormsg. Like inkex 0.92, the module has no
+unittouu function, so Patron.getunittouu falls back on Effect.unittouu.
+
+It is only put on the path by the benchmarks when the real inkex modules are
+not given (see --inkex).
+-----------------------------------------------
+"""
+
+import copy
+import optparse
+import re
+import sys
+
+from lxml import etree
+
+NSS = {
+    'svg': 'http://www.w3.org/2000/svg',
+    'inkscape': 'http://www.inkscape.org/namespaces/inkscape',
+    'sodipodi': 'http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd',
+    'xlink': 'http://www.w3.org/1999/xlink'
+}
+
+# Pixels (96dpi user units) per unit
+UUCONV = {'in': 96.0, 'pt': 96.0 / 72.0, 'px': 1.0, 'mm': 96.0 / 25.4, 'cm': 96.0 / 2.54, 'm': 96.0 / 0.0254,
+          'km': 96.0 / 0.0000254, 'pc': 16.0, 'yd': 96.0 * 36.0, 'ft': 96.0 * 12.0}
+LENGTH = re.compile(r'\s*([-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?)\s*([a-z%]*)')
+
+
+def localize():
+    pass
+
+
+def addNS(tag, ns=None):
+    return '{%s}%s' % (NSS[ns], tag) if ns else tag
+
+
+def errormsg(msg):
+    sys.stderr.write(str(msg) + '\n')
+
+
+def check_inkbool(option, opt, value):
+    if str(value).capitalize() == 'True':
+        return True
+    if str(value).capitalize() == 'False':
+        return False
+    raise optparse.OptionValueError("option %s: invalid inkbool value: %s" % (opt, value))
+
+
+class InkOption(optparse.Option):
+    TYPES = optparse.Option.TYPES + ('inkbool',)
+    TYPE_CHECKER = copy.copy(optparse.Option.TYPE_CHECKER)
+    TYPE_CHECKER['inkbool'] = check_inkbool
+
+
+class Effect(object):
+    """
+        Base class of the effects: options, document and unit handling.
+    """
+
+    def __init__(self):
+        self.document = None
+        self.current_layer = None
+        self.selected = {}
+        self.doc_ids = {}
+        self.options = self.args = None
+        self.OptionParser = optparse.OptionParser(usage="usage: %prog [options] SVGfile", option_class=InkOption)
+        self.OptionParser.add_option("--id", action="append", type="string", dest="ids", default=[],
+                                     help="id attribute of object to manipulate")
+
+    def getoptions(self, args=sys.argv[1:]):
+        self.options, self.args = self.OptionParser.parse_args(args)
+
+    def parse(self, filename=None):
+        if filename is None and self.args:
+            filename = self.args[-1]
+        self.document = etree.parse(filename if filename else sys.stdin)
+
+    def getposinfo(self):
+        self.current_layer = self.document.getroot()
+
+    def getselected(self):
+        self.selected = {}
+        for element_id in self.options.ids:
+            for node in self.document.getroot().iter():
+                if node.get('id') == element_id:
+                    self.selected[element_id] = node
+
+    def getdocids(self):
+        self.doc_ids = dict((node.get('id'), 1) for node in self.document.getroot().iter() if node.get('id'))
+
+    def output(self):
+        self.document.write(getattr(sys.stdout, 'buffer', sys.stdout))
+
+    def affect(self, args=sys.argv[1:], output=True):
+        self.getoptions(args)
+        self.parse()
+        self.getposinfo()
+        self.getselected()
+        self.getdocids()
+        self.effect()
+        if output:
+            self.output()
+
+    def getDocumentScale(self):
+        """ Pixels per user unit of the document, from its width and viewBox """
+        root = self.document.getroot()
+        view_box = root.get('viewBox')
+        width = LENGTH.match(root.get('width') or '')
+        if not view_box or width is None:
+            return 1.0
+        view_width = float(view_box.replace(',', ' ').split()[2])
+        return float(width.group(1)) * UUCONV.get(width.group(2), 1.0) / view_width
+
+    def unittouu(self, string):
+        match = LENGTH.match(string)
+        if match is None:
+            return 0.0
+        return float(match.group(1)) * UUCONV.get(match.group(2) or 'px', 1.0) / self.getDocumentScale()
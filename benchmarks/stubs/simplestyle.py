@@ -0,0 +1,21 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Minimal stand-in of the Inkscape 0.92 simplestyle module, for the benchmarks.
+-----------------------------------------------
+"""
+
+
+def parseStyle(s):
+    """ Create a dictionary from the value of an inline style attribute """
+    if s is None:
+        return {}
+    return dict([[part.strip() for part in item.split(':', 1)] for item in s.split(';') if len(item.strip())])
+
+
+def formatStyle(a):
+    """ Format an inline style attribute from a dictionary """
+    return ';'.join([attribute + ':' + str(value) for attribute, value in a.items()])
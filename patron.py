@@ -32,31 +32,74 @@ along with this program; if not, write to the Free Software
 Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 """
 
-import xml.etree.ElementTree as Etree
+import os
+import sys
 
 import inkex
 import simplestyle
 
+# The other patron modules are imported by the runs that use them (cache, nesting, toolpath, profiling...)
+import patron_core
+import patron_path
+from patron_path import points_to_bbox, points_to_bbox_center
+
 __version__ = '1'
 
-inkex.localize()
+TEMPLATES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'patron.xml')
+
+# Ids of the shared definitions of the 'shared' output mode
+STYLES_ID = 'patron-styles'
+VERTEX_SYMBOL = 'patron-vertex'
+
+# Options stored on the template groups, describing how they were rendered
+RENDER_OPTIONS = ('type', 'units', 'style') + patron_core.FIELDS + ('flatness', 'grid', 'temp', 'toolpath')
+
+# Stages recorded by the profiler (--profile), by owner: the effect, this module and the core modules
+PROFILED_METHODS = ('getoptions', 'parse', 'effect', 'output_styles', 'render_template', 'main_piece', 'sleeve',
+                    'saved_template', 'finish_group', 'place_template', 'getunittouu', 'calc_unit_factor',
+                    'vertex_marker', 'output')
+PROFILED_FUNCTIONS = ('draw_svg_line', 'draw_svg_square', 'draw_svg_circle', 'draw_svg_use', 'draw_svg_ellipse',
+                      'draw_svg_cubic_curve', 'add_text', 'share_transforms', 'formatPath', 'to_path_string')
+PROFILED_CORE = ('user_measurements', 'main_piece', 'sleeve_piece')
+PROFILED_PATH = ('offset_path', 'build_path')
+
+
+def setup_inkex():
+    """ Localize inkex and register the namespaces written by the extension, once per process """
+    if not getattr(setup_inkex, 'done', False):
+        import patron_update
+
+        inkex.localize()
+        inkex.etree.register_namespace('patron', patron_update.PATRON_NS)
+        setup_inkex.done = True
 
 
 # ---------------------------------------------------------------- #
 #                       UTILITY FUNCTIONS
 # ---------------------------------------------------------------- #
-def add_text(parent, text, transform='', text_height=12, color='#000000'):
+def style_attribs(style):
     """
-        Create and insert a single line of text into the svg document under parent.
+        Presentation attributes of an element: an inline style from a style dict,
+        or a class attribute from a css class name (shared output mode).
     """
-    text_style = {'font-size': '%dpx' % text_height, 'font-style': 'normal', 'font-weight': 'normal',
-                  'fill': color, 'font-family': 'Bitstream Vera Sans,sans-serif',
-                  'text-anchor': 'middle', 'text-align': 'center'}
+    if isinstance(style, dict):
+        return {'style': simplestyle.formatStyle(style)}
+    return {'class': style}
 
-    text_attribs = {
-        inkex.addNS('label', 'inkscape'): 'Annotation',
-        'style': simplestyle.formatStyle(text_style)
-    }
+
+def text_style(text_height=12, color='#000000'):
+    return {'font-size': '%dpx' % text_height, 'font-style': 'normal', 'font-weight': 'normal',
+            'fill': color, 'font-family': 'Bitstream Vera Sans,sans-serif',
+            'text-anchor': 'middle', 'text-align': 'center'}
+
+
+def add_text(parent, text, transform='', text_height=12, color='#000000', style=None):
+    """
+        Create and insert a single line of text into the svg document under parent.
+        - style overrides the text style built from text_height and color
+    """
+    text_attribs = {inkex.addNS('label', 'inkscape'): 'Annotation'}
+    text_attribs.update(style_attribs(style if style is not None else text_style(text_height, color)))
     if transform != "translate(0,0)":
         text_attribs['transform'] = transform
     text_node = inkex.etree.SubElement(parent, inkex.addNS('text', 'svg'), text_attribs)
@@ -67,9 +110,9 @@ def draw_svg_line(points_list, parent, style):
     """
         Draw an SVG line segment between the given points under parent
     """
-    line_attribs = {'style': simplestyle.formatStyle(style),
-                    inkex.addNS('label', 'inkscape'): 'line',
+    line_attribs = {inkex.addNS('label', 'inkscape'): 'line',
                     'd': to_path_string(points_list, False)}
+    line_attribs.update(style_attribs(style))
 
     inkex.etree.SubElement(parent, inkex.addNS('path', 'svg'), line_attribs)
 
@@ -92,25 +135,35 @@ def draw_svg_square(w, h, x, y, parent):
 
 def draw_svg_circle(radius, center, parent, style, transform=''):
     circ_attribs = {
-        'style': simplestyle.formatStyle(style),
         'cx': str(center[0]),
         'cy': str(center[1]),
         'r': str(radius),
         'transform': transform
     }
+    circ_attribs.update(style_attribs(style))
     inkex.etree.SubElement(parent, inkex.addNS('circle', 'svg'), circ_attribs)
 
 
+def draw_svg_use(symbol_id, position, parent):
+    """
+        Place a copy of a symbol defined in the document at position under parent
+    """
+    use_attribs = {inkex.addNS('href', 'xlink'): '#' + symbol_id,
+                   'x': str(position[0]),
+                   'y': str(position[1])}
+    inkex.etree.SubElement(parent, inkex.addNS('use', 'svg'), use_attribs)
+
+
 def draw_svg_ellipse(start, radius, center, end, parent, style, transform=''):
     sx, sy = start
     rx, ry = radius
     cx, cy = center
     ex, ey = end
     circ_attribs = {
-        'style': simplestyle.formatStyle(style),
         'd': 'm {} {} a {} {} {} {} 0 {} {}'.format(sx, sy, rx, ry, cx, cy, ex, ey),
         'transform': transform
     }
+    circ_attribs.update(style_attribs(style))
     inkex.etree.SubElement(parent, inkex.addNS('path', 'svg'), circ_attribs)
 
 
@@ -120,50 +173,41 @@ def draw_svg_cubic_curve(curve_start, pt1, pt2, curve_end, parent, style, transf
     dx, dy = pt2
     ex, ey = curve_end
     curve_attribs = {
-        'style': simplestyle.formatStyle(style),
         inkex.addNS('label', 'inkscape'): 'cubic curve',
         'transform': transform,
         'd': 'M {} {} c {} {}, {} {}, {} {}'.format(sx, sy, cx, cy, dx, dy, ex, ey)
     }
+    curve_attribs.update(style_attribs(style))
     inkex.etree.SubElement(parent, inkex.addNS('path', 'svg'), curve_attribs)
 
 
-def to_path_string(arr, close=True):
-    return "m %s%s" % (' '.join([','.join([str(c) for c in pt]) for pt in arr]), " z" if close else "")
+def share_transforms(element):
+    """
+        Deduplicate the transform attributes under element: identity transforms
+        are dropped, and a transform shared by all the children of a group is
+        moved onto the group.
+    """
+    children = [child for child in element if isinstance(child.tag, str)]
+    for child in children:
+        share_transforms(child)
+    transform = element.get('transform')
+    if transform is not None and patron_path.parse_transform(transform) == patron_path.IDENTITY:
+        del element.attrib['transform']
+    transforms = set(child.get('transform') for child in children)
+    if element.tag.rsplit('}', 1)[-1] == 'g' and len(children) > 1 and len(transforms) == 1 and None not in transforms:
+        element.set('transform', ' '.join(filter(None, [element.get('transform'), transforms.pop()])))
+        for child in children:
+            del child.attrib['transform']
 
 
-def formatPath(a):
-    """Format SVG path data from an array"""
-    return "".join([" %s " % cmd + " ".join([str(p) for p in params]) for cmd, params in a])
+def to_path_string(arr, close=True, precision=patron_path.PRECISION):
+    """Format SVG path data from a list of relative points"""
+    return patron_path.format_points(arr, close, precision, relative=True)
 
 
-def points_to_bbox(p):
-    """ 
-        from a list of points (x,y pairs)
-        - return the lower-left xy and upper-right xy
-    """
-    llx = urx = p[0][0]
-    lly = ury = p[0][1]
-    for x in p[1:]:
-        if x[0] < llx:
-            llx = x[0]
-        elif x[0] > urx:
-            urx = x[0]
-        if x[1] < lly:
-            lly = x[1]
-        elif x[1] > ury:
-            ury = x[1]
-    return llx, lly, urx, ury
-
-
-def points_to_bbox_center(p):
-    """ 
-        from a list of points (x,y pairs)
-        - find midpoint of bounding box around all points
-        - return (x,y)
-    """
-    bbox = points_to_bbox(p)
-    return (bbox[0] + bbox[2]) / 2.0, (bbox[1] + bbox[3]) / 2.0
+def formatPath(a, precision=patron_path.PRECISION):
+    """Format SVG path data from an array"""
+    return patron_path.build_path(a, precision)
 
 
 # ----------------------------------------------------------------#
@@ -181,9 +225,14 @@ class Patron(inkex.Effect):
             Define how the options are mapped from the inx file
             and initialize class attributes
         """
+        import patron_profile
+
+        setup_inkex()
         inkex.Effect.__init__(self)
 
         self.doc_center = None
+        self.styles = {}
+        self.lengths = {}
         self.normal_line = {
             'stroke': '#000000',  # black
             'fill': 'none',  # no fill - just a line
@@ -242,6 +291,42 @@ class Patron(inkex.Effect):
                                      help="Height of the rear neck drop")
         self.OptionParser.add_option("--shoulder_drop", type="float", dest="shoulder_drop", default=3,
                                      help="height of the shoulder")
+        self.OptionParser.add_option("--flatness", type="float", dest="flatness", default=0.1,
+                                     help="Tolerance of the seam allowance curves flattening, in mm")
+        self.OptionParser.add_option("--nest", type="inkbool", dest="nest", default=False,
+                                     help="Nest the template pieces onto sheets")
+        self.OptionParser.add_option("--sheet_width", type="float", dest="sheet_width", default=1189,
+                                     help="Width of the nesting sheets in mm")
+        self.OptionParser.add_option("--sheet_height", type="float", dest="sheet_height", default=841,
+                                     help="Height of the nesting sheets in mm")
+        self.OptionParser.add_option("--nest_gap", type="float", dest="nest_gap", default=5,
+                                     help="Space between the nested pieces in mm")
+        self.OptionParser.add_option("--nest_rotations", type="string", dest="nest_rotations", default='0,90,180,270',
+                                     help="Allowed rotations of the nested pieces, a 'm' suffix for mirrored")
+        self.OptionParser.add_option("--nest_time", type="float", dest="nest_time", default=1,
+                                     help="Time budget of the nesting in seconds")
+        self.OptionParser.add_option("--toolpath", type="inkbool", dest="toolpath", default=False,
+                                     help="Reorder the cut paths to minimise the travel of the cutter")
+        self.OptionParser.add_option("--toolpath_time", type="float", dest="toolpath_time", default=1,
+                                     help="Time budget of the toolpath ordering in seconds")
+        self.OptionParser.add_option("--output_mode", type="string", dest="output_mode", default='inline',
+                                     help="SVG output: 'inline' styles, or 'shared' css classes and vertex symbol")
+        self.OptionParser.add_option("--update", type="inkbool", dest="update", default=True,
+                                     help="Update the selected template of a previous run instead of adding a new one")
+        self.OptionParser.add_option("--cache", type="inkbool", dest="cache", default=False,
+                                     help="Reuse the templates already rendered for the same quantized measurements")
+        self.OptionParser.add_option("--cache_step", type="float", dest="cache_step", default=0.5,
+                                     help="Quantization step of the cached measurements, in the user units")
+        self.OptionParser.add_option("--cache_dir", type="string", dest="cache_dir", default='',
+                                     help="Render cache directory (default: the user cache directory)")
+        self.OptionParser.add_option("--cache_size", type="float", dest="cache_size", default=64,
+                                     help="Maximum size of the render cache in MB")
+        self.OptionParser.add_option("--profile", type="string", dest="profile", default='',
+                                     help="Write the stage timings of the run to a json file, or stderr if '-' "
+                                          "(or set %s)" % patron_profile.PROFILE_ENV)
+        self.OptionParser.add_option("--profile_cprofile", type="string", dest="profile_cprofile", default='',
+                                     help="Also run cProfile and dump it to this pstats file and as folded stacks "
+                                          "(or set %s)" % patron_profile.CPROFILE_ENV)
         self.OptionParser.add_option("--grid", type="inkbool", dest="grid", default=True,
                                      help="Display the Reference Grid ")
         self.OptionParser.add_option("--temp", type="inkbool", dest="temp", default=True,
@@ -254,91 +339,250 @@ class Patron(inkex.Effect):
     # ----------------------------------------------------------------#
     @staticmethod
     def neckline(um, neck_drop):
-        return ['c', [0, 0.6 * neck_drop, -0.5 * um['neck'], neck_drop, -um['neck'], neck_drop]]
+        return patron_core.neckline(um, neck_drop)
 
     @staticmethod
     def hipline(um):
-        return 'l {},{} z'.format(-um['hip'], 0)
+        return 'l {},{} z'.format(*patron_core.hipline(um)[1])
 
     @staticmethod
     def shoulder_line(um):
-        return 'l {},{}'.format(um['shoulder'] - um['neck'], um['shoulder_drop'])
+        return 'l {},{}'.format(*patron_core.shoulder_line(um)[1])
 
     @staticmethod
     def waist_curve(um):
-        ctrl_p1 = (0, -0.4 * um['chest_to_waist'])
-        ctrl_p2 = (-(um['hip'] - um['waist']), -um['waist_to_hip'])
-        curve_end = (um['chest'] - um['hip'], -um['chest_to_hip'])
-        return ['c', [ctrl_p1[0], ctrl_p1[1], ctrl_p2[0], ctrl_p2[1], curve_end[0], curve_end[1]]]
+        return patron_core.waist_curve(um)
 
     def sleeve_curve(self, um):
-        ctrl_p1 = (-self.getunittouu('5cm'), 0)
-        ctrl_p2 = (-self.getunittouu('5cm'), -um['shoulder_to_chest'] / 2)
-        curve_end = (um['shoulder'] - um['chest'], -(um['hsp_chest'] - um['shoulder_drop']))
-        return ['c', [ctrl_p1[0], ctrl_p1[1], ctrl_p2[0], ctrl_p2[1], curve_end[0], curve_end[1]]]
+        return patron_core.sleeve_curve(um, self.getunittouu('1cm'))
 
     def getunittouu(self, param):
-        """for 0.48 and 0.91 compatibility"""
+        """
+            for 0.48 and 0.91 compatibility
+            - the lengths are converted once per run, then memoized (the document scale
+              can only change between two runs)
+        """
         if type(param) is tuple:
             return tuple([self.getunittouu(val) for val in param])
-        try:
-            return inkex.unittouu(param)
-        except AttributeError:
-            return self.unittouu(param)
+        length = self.lengths.get(param)
+        if length is None:
+            try:
+                length = inkex.unittouu(param)
+            except AttributeError:
+                length = self.unittouu(param)
+            self.lengths[param] = length
+        return length
 
     def calc_unit_factor(self, ui_unit):
         """ 
             return the scale factor for all dimension conversions.
             - The document units are always irrelevant as
               everything in inkscape is expected to be in 90dpi pixel units
+            - memoized per unit, like every getunittouu length
         """
         # namedView = self.document.getroot().find(inkex.addNS('namedview', 'sodipodi'))
         # doc_units = self.getunittouu(str(1.0) + namedView.get(inkex.addNS('document-units', 'inkscape')))
         unit_factor = self.getunittouu(str(1.0) + ui_unit)
         return unit_factor
 
+    def shared_definition(self, tag, definition_id):
+        """ Find or create an element of the document <defs> by its id """
+        root = self.document.getroot()
+        defs = root.find(inkex.addNS('defs', 'svg'))
+        if defs is None:
+            defs = inkex.etree.Element(inkex.addNS('defs', 'svg'))
+            root.insert(0, defs)
+        for element in defs:
+            if element.get('id') == definition_id:
+                return element
+        return inkex.etree.SubElement(defs, inkex.addNS(tag, 'svg'), {'id': definition_id})
+
+    def output_styles(self):
+        """
+            Styles of the rendered elements, by name.
+            - inline output mode: the style dicts, written on every element
+            - shared output mode: css classes declared once in a <style> of the
+              document <defs>, next to the vertex marker <symbol>
+        """
+        styles = {'normal_line': self.normal_line, 'cut_line': self.cut_line,
+                  'doted_line': self.doted_line, 'text': text_style(15)}
+        if self.options.output_mode != 'shared':
+            return styles
+
+        sheet = self.shared_definition('style', STYLES_ID)
+        sheet.set('type', 'text/css')
+        rules = [rule for rule in (sheet.text or '').splitlines() if rule.strip()]
+        for name in sorted(styles):
+            css_class = 'patron-' + name.replace('_', '-')
+            rules = [rule for rule in rules if not rule.startswith('.%s{' % css_class)]
+            rules.append('.%s{%s}' % (css_class, simplestyle.formatStyle(styles[name])))
+            styles[name] = css_class
+        sheet.text = '\n'.join(rules) + '\n'
+
+        symbol = self.shared_definition('symbol', VERTEX_SYMBOL)
+        symbol.set('style', 'overflow:visible')
+        marker = symbol.find(inkex.addNS('circle', 'svg'))
+        if marker is None:
+            marker = inkex.etree.SubElement(symbol, inkex.addNS('circle', 'svg'))
+        marker.attrib.update({'cx': '0', 'cy': '0', 'r': str(self.getunittouu('4mm')), 'class': styles['normal_line']})
+        return styles
+
+    def vertex_marker(self, parent, vertex):
+        """ Mark a vertex of the template structure with a circle """
+        if self.options.output_mode == 'shared':
+            draw_svg_use(VERTEX_SYMBOL, vertex, parent)
+        else:
+            draw_svg_circle(self.getunittouu('4mm'), vertex, parent, self.styles['normal_line'])
+
     # ------------------------------------------------------------ #
     #                            MAIN
     # ------------------------------------------------------------ #
+    def affect(self, args=sys.argv[1:], output=True):
+        """
+            Run the effect, with its stages profiled if asked by --profile,
+            --profile_cprofile or their environment variables.
+        """
+        import patron_profile
+
+        target, cprofile_target = patron_profile.requested(args)
+        if not target and not cprofile_target:
+            return inkex.Effect.affect(self, args, output)
+
+        profiler = patron_profile.Profiler(cprofile_target)
+        if target:
+            profiler.instrument(self, PROFILED_METHODS, 'Patron')
+            profiler.instrument(sys.modules[__name__], PROFILED_FUNCTIONS, 'patron')
+            profiler.instrument(patron_core, PROFILED_CORE)
+            profiler.instrument(patron_path, PROFILED_PATH)
+            import patron_store
+            profiler.instrument(patron_store.TemplateStore, ('get',))
+        profiler.start()
+        try:
+            inkex.Effect.affect(self, args, output)
+        finally:
+            profiler.stop()
+            profiler.write(target)
+
     def effect(self):
+        # A warm effect (batch, server) renders on a new document for every run
+        self.lengths = {}
+        self.styles = self.output_styles()
 
-        # Render Saved Template
+        # Look the template up in the render cache, the measurements being quantized first
+        cache = key = template_group = None
         template_id = self.options.type
+        if self.options.cache:
+            import patron_cache
+            cache = patron_cache.RenderCache(self.options.cache_dir or None, int(self.options.cache_size * (1 << 20)))
+            if template_id == 'perso':
+                for name in patron_core.FIELDS:
+                    setattr(self.options, name, patron_cache.quantize(getattr(self.options, name),
+                                                                      self.options.cache_step))
+            key = patron_cache.cache_key(self.cache_params())
+            data = cache.get(key)
+            template_group = inkex.etree.fromstring(data) if data is not None else None
+        if template_group is None:
+            template_group = self.render_template(template_id)
+            if template_group is None:
+                if cache is not None:
+                    cache.flush()
+                return
+            if not self.options.nest:
+                self.finish_group(template_group)
+            if cache is not None:
+                cache.put(key, inkex.etree.tostring(template_group))
+        if cache is not None:
+            cache.flush()
+
+        # Pack the pieces of the templates onto sheet layers
+        if self.options.nest:
+            import patron_nesting
+
+            # Not inside a sheet layer of a previous nesting, it would be taken for a piece
+            sheet = self.current_layer
+            while sheet is not None and not patron_nesting.is_sheet(sheet):
+                sheet = sheet.getparent()
+            (self.current_layer if sheet is None else sheet.getparent()).append(template_group)
+            scale = self.getunittouu('1mm')
+            groups = patron_nesting.nest(self.document.getroot(),
+                                         self.options.sheet_width * scale, self.options.sheet_height * scale,
+                                         patron_nesting.parse_orientations(self.options.nest_rotations),
+                                         self.options.nest_gap * scale, self.options.nest_time)
+            for group in groups:
+                self.finish_group(group)
+        else:
+            self.place_template(template_group)
+
+    def cache_params(self):
+        """ Normalized inputs of the render, hashed into the render cache key """
+        # A nested template is stored before its toolpath ordering and shared transforms (see finish_group)
+        names = RENDER_OPTIONS + ('output_mode', 'nest')
+        params = {'version': __version__, 'scale': self.getunittouu('1cm')}
+        if self.options.type != 'perso':
+            # Saved templates do not depend on the measurements, but on the 'patron.xml' content
+            names = [name for name in names if name not in patron_core.FIELDS and name != 'units']
+            stat = os.stat(TEMPLATES_FILE)
+            params['source'] = [stat.st_mtime, stat.st_size]
+        for name in names:
+            params[name] = getattr(self.options, name)
+        return params
+
+    def render_template(self, template_id):
+        """
+            Render the template of the options in a detached group.
+            - return the group, or None if the saved template does not exist
+        """
         if template_id != "perso":
-            self.saved_template(template_id)
+            template_group = self.saved_template(template_id)
         else:
             # Gather incoming measurements and convert it to internal unit (96dpi pixels)
-            ease = self.getunittouu(str(self.options.ease) + self.options.units)
-            user = {
-                'ease': ease,
-                'shoulder_drop': self.getunittouu(str(self.options.shoulder_drop) + self.options.units),
-                'neck_front': self.getunittouu(str(self.options.neck_front) + self.options.units),
-                'neck_rear': self.getunittouu(str(self.options.neck_rear) + self.options.units),
-                'neck': (ease + float(self.getunittouu(str(self.options.neck) + self.options.units))) / 2,
-                'shoulder': (ease + float(self.getunittouu(str(self.options.shoulder) + self.options.units))) / 2,
-                'hip': (ease + float(self.getunittouu(str(self.options.hip) + self.options.units))) / 4,
-                'waist': (ease + float(self.getunittouu(str(self.options.waist) + self.options.units))) / 4,
-                'chest': (ease + float(self.getunittouu(str(self.options.chest) + self.options.units))) / 4,
-                'hsp_chest': ease + self.getunittouu(str(self.options.hsp_chest) + self.options.units),
-                'hsp_waist': self.getunittouu(str(self.options.hsp_waist) + self.options.units),
-                'hsp_hip': self.getunittouu(str(self.options.hsp_hip) + self.options.units),
-                'bicep': (ease + float(self.getunittouu(str(self.options.bicep) + self.options.units))) / 2,
-                'top_sleeve': self.getunittouu(str(self.options.top_sleeve) + self.options.units),
-                'under_sleeve': self.getunittouu(str(self.options.bottom_sleeve) + self.options.units)-self.getunittouu('2cm')
-            }
-            user['shoulder_to_chest'] = user['hsp_chest'] - user['shoulder_drop']
-            user['chest_to_waist'] = user['hsp_waist'] - user['hsp_chest']
-            user['chest_to_hip'] = user['hsp_hip'] - user['hsp_chest']
-            user['waist_to_hip'] = user['hsp_hip'] - user['hsp_waist']
+            # The physical constraints are checked before anything is drawn
+            user = patron_core.user_measurements(patron_core.measurements(self.options),
+                                                 self.calc_unit_factor(self.options.units),
+                                                 self.getunittouu('1cm')).validate()
 
-            # Main group for the Template
+            # Main group for the Template, rendered detached from the document
             info = 'Patron_T-shirt_%s_%s_%s' % (self.options.hip, self.options.waist, self.options.chest)
-            template_group = inkex.etree.SubElement(self.current_layer, 'g', {inkex.addNS('label', 'inkscape'): info})
+            template_group = inkex.etree.Element('g', {inkex.addNS('label', 'inkscape'): info})
 
             self.main_piece(template_group, user, info + '_front', True)
             self.main_piece(template_group, user, info + '_back', False)
             self.sleeve(template_group, user, info+'_sleeve')
 
+        if template_group is not None:
+            import patron_update
+            template_group.set(patron_update.TYPE, template_id)
+            template_group.set(patron_update.PARAMS, patron_update.template_params(self.options, RENDER_OPTIONS))
+        return template_group
+
+    def finish_group(self, group):
+        """ Order the cut paths of a template or sheet group, and share its transforms in shared mode """
+        if self.options.toolpath and self.options.style == 'cut':
+            import patron_nesting
+            import patron_toolpath
+
+            scale = self.getunittouu('1mm')
+            before, after = patron_toolpath.optimize(group, self.options.toolpath_time,
+                                                     symbols=patron_nesting.find_symbols(self.document.getroot()))
+            inkex.errormsg("%s: travel %.0fmm -> %.0fmm" % (group.get(inkex.addNS('label', 'inkscape')),
+                                                          before / scale, after / scale))
+        if self.options.output_mode == 'shared':
+            share_transforms(group)
+
+    def place_template(self, template_group):
+        """
+            Update in place the selected template group rendered by a previous run,
+            or add the new template group to the current layer.
+        """
+        if self.options.update:
+            import patron_update
+            previous = patron_update.find_template(self.selected.values())
+            if previous is not None:
+                patron_update.reconcile(previous, template_group)
+                return previous
+        self.current_layer.append(template_group)
+        return template_group
+
     # -------------------------------------------------------------- #
     #                          MAIN PIECE
     # -------------------------------------------------------------- #
@@ -351,60 +595,39 @@ class Patron(inkex.Effect):
                                               'transform': '' if front else 'matrix(-1,0,0,1,-34.745039,0)'})
 
         # The template main vertexes absolute positions
-        neck_drop = um['neck_rear'] if not front else um['neck_front'] if um['neck_front'] > 0 else um['neck']
-        vertexes = {
-            'neck': (um['neck'], 0),
-            'neck_drop': (0, neck_drop),
-            'shoulder': (um['shoulder'], um['shoulder_drop']),
-            'chest': (um['chest'], um['hsp_chest']),
-            'waist': (um['waist'], um['hsp_waist']),
-            'hip': (um['hip'], um['hsp_hip'])
-        }
+        geometry = patron_core.main_piece(um, front, self.getunittouu('1cm'))
+        vertexes = dict(zip(patron_core.MAIN_VERTEXES, geometry['vertexes']))
 
         # The Template structure reference
         if self.options.grid:
             reference = inkex.etree.SubElement(piece_group, 'g',
                                                {inkex.addNS('label', 'inkscape'): info + "_structure"})
 
-            draw_svg_line([(0, 0), (0, um['hsp_hip'])], reference, self.doted_line)
-            draw_svg_line([(0, 0), (um['neck'], 0)], reference, self.doted_line)
-            draw_svg_line([(um['neck'], 0), (0, um['hsp_hip'])], reference, self.doted_line)
-            draw_svg_line([(0, um['shoulder_drop']), (um['shoulder'], 0)], reference, self.doted_line)
-            draw_svg_line([(0, um['hsp_chest']), (um['chest'], 0)], reference, self.doted_line)
-            draw_svg_line([(0, um['hsp_waist']), (um['waist'], 0)], reference, self.doted_line)
-            draw_svg_line([(0, um['hsp_hip']), (um['hip'], 0)], reference, self.doted_line)
+            for line in geometry['reference']:
+                draw_svg_line(line, reference, self.styles['doted_line'])
 
             for name, vertex in vertexes.items():
-                draw_svg_circle(self.getunittouu('4mm'), vertex, reference, self.normal_line)
+                self.vertex_marker(reference, vertex)
 
         # Template edge paths
         if self.options.temp:
 
-            line_style = self.normal_line if self.options.style == 'print' else self.cut_line
+            line_style = self.styles['normal_line' if self.options.style == 'print' else 'cut_line']
             edge = inkex.etree.SubElement(piece_group, 'g', {inkex.addNS('label', 'inkscape'): info + "_edge"})
 
             # Building the path string description 'd'
-            path = [['m', vertexes['neck']]]
-            path.append(Patron.neckline(um, neck_drop))
-            path.append(['l', [0, um['hsp_hip'] - neck_drop]])
-            path.append(['l', [um['hip'], 0]])
-            path.append(Patron.waist_curve(um))
-            path.append(self.sleeve_curve(um))
-            path.append(['Z', []])
-
             sewing_attribs = {
-                'style': simplestyle.formatStyle(self.normal_line),
                 inkex.addNS('label', 'inkscape'): info + '_sewing',
-                'd': formatPath(path)}
+                'd': formatPath(geometry['sewing'])}
+            sewing_attribs.update(style_attribs(self.styles['normal_line']))
             inkex.etree.SubElement(edge, inkex.addNS('path', 'svg'), sewing_attribs)
 
-            path[2][1] = [0, um['hsp_hip'] + self.getunittouu('1.5cm') - neck_drop]
-            path[3][1] = [um['hip'], 0, 0, -self.getunittouu('1.5cm')]
-            offset_attribs = {'style': simplestyle.formatStyle(line_style),
-                              inkex.addNS('type', 'sodipodi'): 'inkscape:offset',
-                              inkex.addNS('radius', 'inkscape'): str(self.getunittouu('1cm')),
-                              inkex.addNS('original', 'inkscape'): formatPath(path)
-                              }
+            # The seam allowance is computed here as a static path instead of a live inkscape offset
+            offset = patron_path.offset_path(geometry['offset'], geometry['offset_radius'],
+                                             self.getunittouu(str(self.options.flatness) + 'mm'))
+            offset_attribs = {inkex.addNS('label', 'inkscape'): info + '_offset',
+                              'd': offset}
+            offset_attribs.update(style_attribs(line_style))
             inkex.etree.SubElement(edge, inkex.addNS('path', 'svg'), offset_attribs)
 
     # -------------------------------------------------------------- #
@@ -418,91 +641,89 @@ class Patron(inkex.Effect):
         piece_group = inkex.etree.SubElement(parent, 'g', sleeve_attribs)
 
         # The template main vertexes absolute positions
-        vertexes = {
-            'shoulder': (0, 0),
-            'sleeve_middle': (0, um['top_sleeve']-um['under_sleeve']),
-            'armpit': (um['bicep'], um['top_sleeve'] - um['under_sleeve']),
-            'sleeve_top': (0, um['top_sleeve']),
-            'sleeve_bottom': (um['bicep']-0.5*um['ease'],um['top_sleeve']),
-        }
+        geometry = patron_core.sleeve_piece(um)
+        vertexes = dict(zip(patron_core.SLEEVE_VERTEXES, geometry['vertexes']))
         if self.options.grid:
             reference = inkex.etree.SubElement(piece_group, 'g',{inkex.addNS('label', 'inkscape'): info + "_structure"})
-            draw_svg_line([vertexes['shoulder'],(0, um['top_sleeve']),(um['bicep']-0.5*um['ease'],0)], reference, self.doted_line)
-            draw_svg_line([vertexes['sleeve_middle'], (um['bicep'],0)], reference, self.doted_line)
+            for line in geometry['reference']:
+                draw_svg_line(line, reference, self.styles['doted_line'])
             for name, vertex in vertexes.items():
-                draw_svg_circle(self.getunittouu('4mm'), vertex, reference, self.normal_line)
+                self.vertex_marker(reference, vertex)
 
     # ---------------------------------------------------------------------- #
     #                        RENDER SAVED TEMPLATES
     # ---------------------------------------------------------------------- #
     def saved_template(self, template_id):
         """
-            Read 'patron.xml' file and get the saved templates data
-            Then render the selected template in the document.
+            Read the saved templates data from the compiled 'patron.xml' store
+            Then render the selected template in a detached group and return it.
         """
 
         # From user params get the wanted type and size
         category, size = template_id.split('_')
 
-        # Parse the xml file
-        template_tree = Etree.parse("patron.xml")
-        root = template_tree.getroot()
-
         # Find The selected template
-        for template in root.findall("./type[@name='%s']/template[@size='%s']" % (category, size)):
-            # Find useful data
-            info = 'T-shirt_template_%s_%s' % (category, size)
-            transform = template.find('transform')
-
-            # Creation of a main group for the Template
-            template_attribs = {
-                inkex.addNS('label', 'inkscape'): info,
-                'transform': transform.text if transform is not None else ''
+        import patron_store
+        template = patron_store.open_store(TEMPLATES_FILE).get(category, size)
+        if template is None:
+            # The sizes between or beyond the stored ones are graded (numpy is only imported then)
+            import patron_grading
+            template = patron_grading.get_template(TEMPLATES_FILE, category, size)
+            if template is not None and template['skipped']:
+                inkex.errormsg("%s: not graded: %s" % (template_id, ', '.join(template['skipped'])))
+        if template is None:
+            return None
+
+        # Creation of a main group for the Template
+        info = 'T-shirt_template_%s_%s' % (category, size)
+        template_attribs = {
+            inkex.addNS('label', 'inkscape'): info,
+            'transform': template['transform']
+        }
+        template_group = inkex.etree.Element('g', template_attribs)
+
+        # For each pieces of the template
+        for piece in template['pieces']:
+            # Create a group for the piece
+            pieceinfo = info + "_" + piece['name']
+            piece_attribs = {
+                inkex.addNS('label', 'inkscape'): pieceinfo,
+                'transform': piece['transform']
             }
-            template_group = inkex.etree.SubElement(self.current_layer, 'g', template_attribs)
-
-            # For each pieces of the template
-            for piece in template.findall('piece'):
-                # Find useful data
-                pieceinfo = info + "_" + piece.find('name').text
-                transform = piece.find('transform')
-
-                # Create a group for the piece
-                piece_attribs = {
-                    inkex.addNS('label', 'inkscape'): pieceinfo,
-                    'transform': transform.text if transform is not None else ''
+            piece_group = inkex.etree.SubElement(template_group, 'g', piece_attribs)
+
+            # Add a text to display the piece info
+            add_text(piece_group, pieceinfo.replace('_', ' '), piece['info'], style=self.styles['text'])
+
+            # For each paths of the piece
+            for part in piece['parts']:
+                # Create a group for the shape
+                label = part['name']
+                partinfo = pieceinfo + "_" + label
+                part_attribs = {
+                    inkex.addNS('label', 'inkscape'): partinfo,
+                    'transform': part['transform']
                 }
-                piece_group = inkex.etree.SubElement(template_group, 'g', piece_attribs)
-
-                # Add a text to display the piece info
-                add_text(piece_group, pieceinfo.replace('_', ' '), piece.find('info').text, 15)
-
-                # For each paths of the piece
-                for part in piece.findall('part'):
-                    # Find useful data
-                    label = part.find('name').text
-                    partinfo = pieceinfo + "_" + label
-                    transform = part.find('transform')
-
-                    # Create a group for the shape
-                    part_attribs = {
-                        inkex.addNS('label', 'inkscape'): partinfo,
-                        'transform': transform.text if transform is not None else ''
-                    }
-                    part_group = inkex.etree.SubElement(piece_group, 'g', part_attribs)
-
-                    # Add the path to the group
-                    style = self.normal_line if self.options.style == 'print' or label != 'offset' else self.cut_line
-                    path_attribs = {
-                        inkex.addNS('label', 'inkscape'): partinfo,
-                        'style': simplestyle.formatStyle(style),
-                        'd': part.find('path').text
-                    }
-                    inkex.etree.SubElement(part_group, inkex.addNS('path', 'svg'), path_attribs)
+                part_group = inkex.etree.SubElement(piece_group, 'g', part_attribs)
+
+                # Add the path to the group
+                style = self.styles['normal_line' if self.options.style == 'print' or label != 'offset' else 'cut_line']
+                path_attribs = {
+                    inkex.addNS('label', 'inkscape'): partinfo,
+                    'd': part['d']
+                }
+                path_attribs.update(style_attribs(style))
+                inkex.etree.SubElement(part_group, inkex.addNS('path', 'svg'), path_attribs)
+
+        return template_group
 
 
 if __name__ == '__main__':
     e = Patron()
-    e.affect()
+    try:
+        e.affect()
+    except patron_core.MeasurementError as error:
+        inkex.errormsg(str(error))
+        sys.exit(1)
 
     # Notes
@@ -0,0 +1,346 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Headless batch mode for the Patron extension.
+
+Read many measurement rows from a CSV or JSON Lines file and render one svg
+template per row, outside of Inkscape. The rows are spread over a pool of worker
+processes, each one keeping its own warm Patron effect so the inkex startup is
+only paid once per worker instead of once per customer (see also patron_server).
+
+Every column (or json key) is matched against the Patron options, either by its
+destination name ('hsp_chest', 'top_sleeve', ...) or by its long option name
+('hsptochest', 'upersleeve', ...). Unknown columns are ignored, except 'id' which
+is used to name the output file: reduced to a safe file name, and suffixed with
+the row number when two rows share the same id.
+
+With --sheet, all the templates are streamed into a single svg document instead
+(see patron_stream): each template is written as soon as it is rendered, so the
+memory use stays flat however many rows there are, and the output can be a pipe.
+
+usage:
+    python patron_batch.py measurements.csv -o out/ -j 8 --manifest out/manifest.json
+    python patron_batch.py measurements.csv --sheet - -j 8 | gzip > sheet.svgz
+-----------------------------------------------
+"""
+
+import csv
+import io
+import json
+import multiprocessing
+import optparse
+import os
+import re
+import sys
+import time
+
+__version__ = '1'
+
+# Blank A0 landscape document used as a support for every rendered template
+BLANK_DOCUMENT = b'''<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<svg xmlns="http://www.w3.org/2000/svg"
+     xmlns:svg="http://www.w3.org/2000/svg"
+     xmlns:sodipodi="http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd"
+     xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"
+     width="1189mm" height="841mm" viewBox="0 0 1189 841" version="1.1">
+  <sodipodi:namedview id="base" inkscape:document-units="mm"/>
+</svg>
+'''
+
+# Characters not allowed in the output file names
+UNSAFE_CHARACTERS = re.compile(r'[^\w.-]')
+
+# Per worker state, filled by init_worker
+_worker = {}
+
+
+# ---------------------------------------------------------------- #
+#                       READING MEASUREMENTS
+# ---------------------------------------------------------------- #
+def read_rows(path):
+    """
+        Read the measurement rows from a CSV (.csv) or a JSON Lines (.jsonl, .json) file.
+        - yield a dict per row
+    """
+    if path == '-':
+        stream = sys.stdin
+        is_json = False
+    else:
+        stream = io.open(path, 'r', encoding='utf-8', newline='')
+        is_json = os.path.splitext(path)[1].lower() in ('.jsonl', '.json', '.ndjson')
+    try:
+        if is_json:
+            for line in stream:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            for row in csv.DictReader(stream):
+                yield dict((key.strip(), value.strip()) for key, value in row.items()
+                           if key is not None and value is not None and value.strip() != '')
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def safe_name(row_id):
+    """
+        Reduce a row id to a file name that stays in the output directory.
+        - return the id with its unsafe characters and '..' replaced by '_'
+    """
+    name = UNSAFE_CHARACTERS.sub('_', row_id).replace('..', '_').strip('.')
+    return name or '_'
+
+
+def row_jobs(rows):
+    """
+        Number the rows and give each one a distinct output file name.
+        - yield (index, row, name) jobs for render_row
+    """
+    names = set()
+    for index, row in enumerate(rows):
+        name = safe_name(str(row.get('id', index)))
+        while name in names:
+            name = '%s_%d' % (name, index)
+        names.add(name)
+        yield index, row, name
+
+
+def row_to_args(parser, row, allowed=None):
+    """
+        Translate a measurement row into a Patron command line argument list.
+        - the row keys can be option destinations or long option names
+        - allowed: the option destinations taken from the row, all of them if None
+    """
+    args = []
+    for option in parser.option_list:
+        if option.dest is None or not option.takes_value():
+            continue
+        if allowed is not None and option.dest not in allowed:
+            continue
+        long_name = option.get_opt_string().lstrip('-')
+        for key in (option.dest, long_name):
+            if key in row:
+                value = row[key]
+                if isinstance(value, bool):
+                    value = 'true' if value else 'false'
+                args.append('%s=%s' % (option.get_opt_string(), value))
+                break
+    return args
+
+
+# ---------------------------------------------------------------- #
+#                           WORKERS
+# ---------------------------------------------------------------- #
+def option_error(message):
+    """ Error handler of the worker options parser: raise instead of exiting the worker process """
+    raise ValueError(message)
+
+
+def init_worker(output_dir, document):
+    """
+        Pool initializer, import the extension once per worker process
+        and keep a warm Patron effect and saved templates store.
+    """
+    import patron
+    import patron_store
+    from inkex import etree
+
+    _worker['patron'] = patron
+    _worker['etree'] = etree
+    _worker['effect'] = patron.Patron()
+    _worker['effect'].OptionParser.error = option_error
+    _worker['document'] = document
+    _worker['output_dir'] = output_dir
+    patron_store.open_store(patron.TEMPLATES_FILE).types()
+
+
+def render(row, allowed=None):
+    """
+        Render a measurement row on a new base document, with the warm Patron effect of the worker.
+        - allowed: the option destinations taken from the row (see row_to_args)
+        - return the rendered document tree
+        - raise ValueError for an invalid option value
+    """
+    etree = _worker['etree']
+    effect = _worker['effect']
+    effect.getoptions(row_to_args(effect.OptionParser, row, allowed))
+    effect.document = etree.ElementTree(etree.fromstring(_worker['document']))
+    effect.getposinfo()
+    effect.getselected()
+    effect.getdocids()
+    effect.effect()
+    return effect.document
+
+
+def render_row(job):
+    """
+        Render a single measurement row to its own svg file.
+        - job: (index, row, file name) as given by row_jobs
+        - return a manifest entry describing the result
+    """
+    index, row, name = job
+    entry = {'id': str(row.get('id', index)), 'row': index}
+    start = time.time()
+    try:
+        document = render(row)
+        filename = os.path.join(_worker['output_dir'], 'patron_%s.svg' % name)
+        document.write(filename, encoding='UTF-8', xml_declaration=True)
+        entry['file'] = filename
+        entry['bytes'] = os.path.getsize(filename)
+    except (Exception, SystemExit) as error:
+        # a worker process that exits is never replaced, and the pool waits for its rows forever
+        entry['error'] = '%s: %s' % (type(error).__name__, error)
+    entry['seconds'] = round(time.time() - start, 4)
+    return entry
+
+
+def render_group(job):
+    """
+        Render a single measurement row to a serialized template group, for a streamed sheet.
+        - return a manifest entry, with the template group ('svg'), the shared
+          definitions ('defs') and the template bounding box ('bbox')
+    """
+    import patron_nesting
+    import patron_path
+
+    index, row = job
+    entry = {'id': str(row.get('id', index)), 'row': index}
+    start = time.time()
+    try:
+        etree = _worker['etree']
+        root = render(row).getroot()
+        group = root[-1]
+        points = patron_nesting.element_points(group, patron_path.IDENTITY,
+                                               symbols=patron_nesting.find_symbols(root))
+        entry['bbox'] = patron_path.points_to_bbox(points) if points else None
+        entry['svg'] = etree.tostring(group)
+        entry['defs'] = b''.join(etree.tostring(element) for element in root
+                                 if patron_nesting._local_name(element.tag) == 'defs')
+        entry['bytes'] = len(entry['svg'])
+    except (Exception, SystemExit) as error:
+        # a worker process that exits is never replaced, and the pool waits for its rows forever
+        entry['error'] = '%s: %s' % (type(error).__name__, error)
+    entry['seconds'] = round(time.time() - start, 4)
+    return entry
+
+
+# ---------------------------------------------------------------- #
+#                             MAIN
+# ---------------------------------------------------------------- #
+def run(rows, output_dir, jobs=None, document=BLANK_DOCUMENT, chunksize=8):
+    """
+        Render every row over a pool of worker processes.
+        - return the list of manifest entries, in input order
+    """
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    pool = multiprocessing.Pool(jobs, init_worker, (output_dir, document))
+    try:
+        entries = list(pool.imap(render_row, row_jobs(rows), chunksize))
+    finally:
+        pool.close()
+        pool.join()
+    return entries
+
+
+def run_sheet(rows, output, jobs=None, document=BLANK_DOCUMENT, chunksize=8, columns=10, gap=10.0):
+    """
+        Render every row over a pool of worker processes, streaming the templates
+        into a single svg document as they come, in input order.
+        - output: the output file name, '-' for stdout
+        - return the list of manifest entries
+    """
+    import patron_stream
+
+    if output == '-':
+        stream = getattr(sys.stdout, 'buffer', sys.stdout)
+    else:
+        stream = open(output, 'wb')
+    entries = []
+    pool = multiprocessing.Pool(jobs, init_worker, (None, document))
+    try:
+        with patron_stream.SvgStream(stream, document, columns, gap) as sheet:
+            for entry in pool.imap(render_group, enumerate(rows), chunksize):
+                if 'error' not in entry:
+                    sheet.write_defs(entry.pop('defs'))
+                    sheet.write_template(entry.pop('svg'), entry.pop('bbox'))
+                    if output != '-':
+                        entry['file'] = output
+                entries.append(entry)
+    finally:
+        pool.close()
+        pool.join()
+        if stream is not getattr(sys.stdout, 'buffer', sys.stdout):
+            stream.close()
+    return entries
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage="usage: %prog [options] measurements.(csv|jsonl)")
+    parser.add_option("-o", "--output", type="string", dest="output", default='patrons',
+                      help="Output directory of the rendered svg files")
+    parser.add_option("-j", "--jobs", type="int", dest="jobs", default=None,
+                      help="Number of worker processes (default: one per cpu)")
+    parser.add_option("--chunksize", type="int", dest="chunksize", default=8,
+                      help="Number of rows sent to a worker at once")
+    parser.add_option("--document", type="string", dest="document", default=None,
+                      help="Base svg document used for each template")
+    parser.add_option("--sheet", type="string", dest="sheet", default=None,
+                      help="Stream all the templates into this single svg file ('-' for stdout) instead of one file "
+                           "per row")
+    parser.add_option("--columns", type="int", dest="columns", default=10,
+                      help="Number of templates per row of the sheet")
+    parser.add_option("--gap", type="float", dest="gap", default=10,
+                      help="Space between the templates of the sheet, in document units")
+    parser.add_option("--nest", type="string", dest="nest", default=None,
+                      help="Also nest the pieces of all the templates onto A0 sheets in this svg file")
+    parser.add_option("--nest-time", type="float", dest="nest_time", default=2.0,
+                      help="Time budget of the nesting in seconds")
+    parser.add_option("--manifest", type="string", dest="manifest", default=None,
+                      help="Write a json manifest of the rendered files")
+    options, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("a single measurements file is expected")
+    if options.nest and options.sheet == '-':
+        parser.error("--nest reads the rendered templates back, it can not follow --sheet -")
+
+    document = BLANK_DOCUMENT
+    if options.document:
+        with open(options.document, 'rb') as stream:
+            document = stream.read()
+
+    start = time.time()
+    if options.sheet:
+        entries = run_sheet(read_rows(args[0]), options.sheet, options.jobs, document, options.chunksize,
+                            options.columns, options.gap)
+    else:
+        entries = run(read_rows(args[0]), options.output, options.jobs, document, options.chunksize)
+    elapsed = time.time() - start
+
+    failed = [entry for entry in entries if 'error' in entry]
+    for entry in failed:
+        sys.stderr.write('row %s (%s): %s\n' % (entry['row'], entry['id'], entry['error']))
+    sys.stderr.write('%d templates rendered in %.2fs (%d failed)\n' % (len(entries) - len(failed), elapsed, len(failed)))
+
+    if options.nest:
+        import patron_nesting
+        templates = [entry['file'] for entry in entries if 'file' in entry]
+        if templates:
+            # With --sheet, every template is in the same file
+            rendered = sorted(set(templates))
+            sheets = patron_nesting.nest_files(rendered, options.nest, time_budget=options.nest_time)
+            sys.stderr.write('%d templates nested on %d sheets\n' % (len(templates), sheets))
+
+    if options.manifest:
+        with open(options.manifest, 'w') as stream:
+            json.dump({'elapsed': round(elapsed, 4), 'templates': entries}, stream, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
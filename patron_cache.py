@@ -0,0 +1,258 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Content addressed on-disk cache of the rendered Patron templates.
+
+Many measurements round to the same values and the standard sizes are asked
+over and over: the rendered template groups are kept on disk, keyed by a hash
+of everything the render depends on:
+ - the measurements, quantized to a configurable step (in the user units)
+ - the units, style, grid, temp and template type, and the other rendering
+   options (flatness, toolpath, output mode)
+ - the document scale and the extension version
+A hit gives the serialized template group back, without any geometry or tree
+building.
+
+The cache directory is shared by all the processes (Inkscape runs, batch and
+server workers):
+ - every entry is written to a temporary file then atomically renamed, so a
+   reader never sees a partial entry and concurrent writers of the same key
+   simply replace each other's identical value
+ - an entry modification time is refreshed on every hit, and the least
+   recently used entries are removed once the directory exceeds its size
+ - the hit / miss statistics are kept in a small json file, updated under a
+   file lock where the platform has one
+
+usage:
+    python patron_cache.py            # print the statistics
+    python patron_cache.py --clear    # empty the cache
+-----------------------------------------------
+"""
+
+import hashlib
+import json
+import optparse
+import os
+import sys
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+__version__ = '1'
+
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                         'patron')
+MAX_SIZE = 64 << 20
+SUFFIX = '.svg'
+STATS_FILE = 'stats.json'
+LOCK_FILE = 'stats.lock'
+COUNTERS = ('hits', 'misses', 'stores', 'evictions')
+
+
+# ---------------------------------------------------------------- #
+#                       UTILITY FUNCTIONS
+# ---------------------------------------------------------------- #
+def quantize(value, step):
+    """
+        Round a measurement to the nearest multiple of step.
+        - return the value unchanged if step is not positive
+    """
+    if not step or step <= 0:
+        return value
+    quantized = round(round(value / float(step)) * step, 10)
+    return value if quantized == value else quantized
+
+
+def cache_key(params):
+    """ Hash of the normalized render inputs (a json-serializable dict) """
+    text = json.dumps(params, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _write_atomic(path, data):
+    """ Write data to path through a temporary file renamed over it """
+    handle, temp_path = tempfile.mkstemp(prefix='.patron_cache_', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(handle, 'wb') as stream:
+            stream.write(data)
+        os.chmod(temp_path, 0o644)
+        try:
+            os.replace(temp_path, path)
+        except AttributeError:
+            # python 2, atomic on posix only
+            if os.name != 'posix' and os.path.exists(path):
+                os.remove(path)
+            os.rename(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+# ---------------------------------------------------------------- #
+#                             CACHE
+# ---------------------------------------------------------------- #
+class RenderCache(object):
+    """
+        On-disk LRU cache of serialized template groups, by content key.
+    """
+
+    def __init__(self, directory=None, max_size=MAX_SIZE):
+        self.directory = directory or CACHE_DIR
+        self.max_size = max_size
+        self.counts = dict.fromkeys(COUNTERS, 0)
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + SUFFIX)
+
+    def get(self, key):
+        """
+            Read an entry and mark it as recently used.
+            - return the serialized template group, or None on a miss
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as stream:
+                data = stream.read()
+            os.utime(path, None)
+        except (IOError, OSError):
+            data = None
+        self.counts['hits' if data is not None else 'misses'] += 1
+        return data
+
+    def put(self, key, data):
+        """ Store an entry, then evict the least recently used ones over the size limit """
+        path = self.path(key)
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+        except OSError:
+            if not os.path.isdir(os.path.dirname(path)):
+                raise
+        _write_atomic(path, data)
+        self.counts['stores'] += 1
+        self.evict()
+
+    def entries(self):
+        """
+            List the cache entries.
+            - return a list of (mtime, size, path), the least recently used first
+        """
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for name in os.listdir(self.directory):
+            folder = os.path.join(self.directory, name)
+            if len(name) != 2 or not os.path.isdir(folder):
+                continue
+            for entry in os.listdir(folder):
+                if not entry.endswith(SUFFIX):
+                    continue
+                path = os.path.join(folder, entry)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # evicted meanwhile by another process
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        return entries
+
+    def evict(self, max_size=None):
+        """
+            Remove the least recently used entries until the cache fits in max_size bytes.
+            - return the number of removed entries
+        """
+        max_size = self.max_size if max_size is None else max_size
+        entries = self.entries()
+        total = sum(size for mtime, size, path in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            if total <= max_size:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass  # already removed by a concurrent eviction
+            total -= size
+        self.counts['evictions'] += removed
+        return removed
+
+    def clear(self):
+        return self.evict(0)
+
+    # -------------------------------------------------------------- #
+    #                          STATISTICS
+    # -------------------------------------------------------------- #
+    def _read_stats(self):
+        try:
+            with open(os.path.join(self.directory, STATS_FILE)) as stream:
+                stats = json.load(stream)
+        except (IOError, OSError, ValueError):
+            stats = {}
+        return dict((name, int(stats.get(name, 0))) for name in COUNTERS)
+
+    def flush(self):
+        """
+            Add the counts of this process to the statistics file and reset them.
+            - return the updated statistics
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        lock = open(os.path.join(self.directory, LOCK_FILE), 'a')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            stats = self._read_stats()
+            for name in COUNTERS:
+                stats[name] += self.counts[name]
+            _write_atomic(os.path.join(self.directory, STATS_FILE), json.dumps(stats).encode('utf-8'))
+        finally:
+            lock.close()
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        return stats
+
+    def stats(self):
+        """
+            Statistics of all the processes, including the counts not flushed yet.
+            - return a dict of the counters, hit rate, entry count and size in bytes
+        """
+        stats = self._read_stats()
+        for name in COUNTERS:
+            stats[name] += self.counts[name]
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(float(stats['hits']) / lookups, 4) if lookups else None
+        entries = self.entries()
+        stats['entries'] = len(entries)
+        stats['size'] = sum(size for mtime, size, path in entries)
+        return stats
+
+
+# ---------------------------------------------------------------- #
+#                             MAIN
+# ---------------------------------------------------------------- #
+def main(argv=None):
+    parser = optparse.OptionParser(usage="usage: %prog [options]")
+    parser.add_option("-d", "--dir", type="string", dest="directory", default=CACHE_DIR,
+                      help="Cache directory")
+    parser.add_option("--clear", action="store_true", dest="clear", default=False,
+                      help="Remove all the cached templates")
+    options, args = parser.parse_args(argv)
+
+    cache = RenderCache(options.directory)
+    if options.clear:
+        sys.stdout.write('%d entries removed\n' % cache.clear())
+        cache.flush()
+    json.dump(cache.stats(), sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
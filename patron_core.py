@@ -0,0 +1,320 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Measurement to geometry core of the T-shirt template, free of any Inkscape
+(and numpy) dependency.
+
+The Patron effect is only a thin adapter around this module, building the svg
+elements, so batch jobs, servers or scripts can import and compute a template
+in a few milliseconds:
+
+    um = patron_core.user_measurements(patron_core.measurements(row),
+                                       patron_core.unit_factor('cm'), patron_core.unit_factor('cm'))
+    geometry = patron_core.compute(um, patron_core.unit_factor('cm'))
+    patron_path.build_path(geometry['front']['sewing'])
+
+The measurements are held by a compact Measurements model: the values are
+converted to internal units once, the derived lengths are only computed when
+first used, and the physical constraints (e.g. hsp_chest < hsp_waist < hsp_hip)
+can be checked up front with validate().
+
+Paths are lists of [command, params] pairs, like the ones given to formatPath.
+-----------------------------------------------
+"""
+
+import re
+
+__version__ = '1'
+
+# Measurement options of the Patron extension, in record column order
+FIELDS = ('neck', 'shoulder', 'hip', 'waist', 'chest', 'hsp_chest', 'hsp_waist', 'hsp_hip', 'bicep',
+          'top_sleeve', 'bottom_sleeve', 'ease', 'neck_front', 'neck_rear', 'shoulder_drop')
+
+MAIN_VERTEXES = ('neck', 'neck_drop', 'shoulder', 'chest', 'waist', 'hip')
+SLEEVE_VERTEXES = ('shoulder', 'sleeve_middle', 'armpit', 'sleeve_top', 'sleeve_bottom')
+
+# Pixels (96dpi user units) per unit, as in inkex
+UNITS = {'in': 96.0, 'pt': 96.0 / 72.0, 'px': 1.0, 'mm': 96.0 / 25.4, 'cm': 96.0 / 2.54, 'm': 96.0 / 0.0254,
+         'km': 96.0 / 0.0000254, 'pc': 16.0, 'yd': 96.0 * 36.0, 'ft': 96.0 * 12.0}
+LENGTH = re.compile(r'\s*([-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?)\s*([a-z]*)\s*$')
+
+
+# ---------------------------------------------------------------- #
+#                            UNITS
+# ---------------------------------------------------------------- #
+def unit_factor(unit, document_scale=1.0):
+    """
+        Document user units for one unit.
+        - document_scale: pixels per user unit of the document (its viewBox scale)
+    """
+    return UNITS[unit] / document_scale
+
+
+def unittouu(length, document_scale=1.0):
+    """ Convert a length text such as '1.5cm' to document user units, like inkex.unittouu """
+    match = LENGTH.match(length)
+    if match is None:
+        raise ValueError("Invalid length '%s'" % length)
+    return float(match.group(1)) * unit_factor(match.group(2) or 'px', document_scale)
+
+
+# ---------------------------------------------------------------- #
+#                         MEASUREMENTS
+# ---------------------------------------------------------------- #
+def measurements(row):
+    """
+        Read the measurements of a row.
+        - a row is a dict or an object (e.g. Patron options) holding the FIELDS
+        - return a dict of floats in the user interface units
+    """
+    get = row.get if isinstance(row, dict) else lambda field: getattr(row, field)
+    return dict((field, float(get(field))) for field in FIELDS)
+
+
+class MeasurementError(ValueError):
+    """ Measurements violating a physical constraint of the template """
+
+
+class _Derived(object):
+    """ Length derived from the measurements, computed on first use and memoized in the '_<name>' slot """
+
+    def __init__(self, function):
+        self.function = function
+        self.slot = '_' + function.__name__
+        self.__doc__ = function.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = getattr(instance, self.slot)
+        if value is None:
+            value = self.function(instance)
+            setattr(instance, self.slot, value)
+        return value
+
+
+def _holds(condition):
+    """ Whether a constraint holds, for every customer when the values are arrays """
+    return bool(condition.all()) if hasattr(condition, 'all') else bool(condition)
+
+
+class Measurements(object):
+    """
+        Measurements of a template in internal units, with the ease applied.
+        - the values are floats (one template) or numpy arrays (one value per customer)
+        - the values can also be read by name, um['neck'] being um.neck
+    """
+    __slots__ = ('ease', 'shoulder_drop', 'neck_front', 'neck_rear', 'neck', 'shoulder', 'hip', 'waist', 'chest',
+                 'hsp_chest', 'hsp_waist', 'hsp_hip', 'bicep', 'top_sleeve', 'under_sleeve',
+                 '_shoulder_to_chest', '_chest_to_waist', '_chest_to_hip', '_waist_to_hip')
+    NAMES = __slots__[:15]
+    DERIVED = ('shoulder_to_chest', 'chest_to_waist', 'chest_to_hip', 'waist_to_hip')
+
+    # Physical constraints of the template: (description, test). The tests run on the internal values, the
+    # descriptions state them on the user interface measurements, the ease included
+    LENGTHS = ('ease', 'shoulder_drop', 'neck_front', 'neck_rear', 'hsp_waist', 'hsp_hip', 'top_sleeve')
+    GIRTHS = ('neck', 'shoulder', 'hip', 'waist', 'chest')
+    CONSTRAINTS = (
+        ('%s >= 0' % ', '.join(LENGTHS), lambda um: [um[name] >= 0 for name in Measurements.LENGTHS]),
+        ('%s + ease >= 0' % ', '.join(GIRTHS), lambda um: [um[name] >= 0 for name in Measurements.GIRTHS]),
+        ('neck < shoulder', lambda um: [um.neck < um.shoulder]),
+        ('shoulder_drop < hsp_chest + ease', lambda um: [um.shoulder_to_chest > 0]),
+        ('hsp_chest + ease < hsp_waist < hsp_hip', lambda um: [um.chest_to_waist > 0, um.waist_to_hip > 0]),
+        ('2cm < bottom_sleeve < top_sleeve + 2cm', lambda um: [um.under_sleeve > 0, um.under_sleeve < um.top_sleeve]),
+        ('bicep > 0', lambda um: [um.bicep - 0.5 * um.ease > 0]),
+    )
+
+    def __init__(self, m, unit_factor, cm_factor):
+        """
+            Convert measurements to internal units, with the ease applied.
+            - m: a dict of the FIELDS in user interface units
+            - unit_factor: internal units for one user interface unit
+            - cm_factor: internal units for one centimeter
+        """
+        ease = m['ease'] * unit_factor
+        self.ease = ease
+        self.shoulder_drop = m['shoulder_drop'] * unit_factor
+        self.neck_front = m['neck_front'] * unit_factor
+        self.neck_rear = m['neck_rear'] * unit_factor
+        self.neck = (ease + m['neck'] * unit_factor) / 2
+        self.shoulder = (ease + m['shoulder'] * unit_factor) / 2
+        self.hip = (ease + m['hip'] * unit_factor) / 4
+        self.waist = (ease + m['waist'] * unit_factor) / 4
+        self.chest = (ease + m['chest'] * unit_factor) / 4
+        self.hsp_chest = ease + m['hsp_chest'] * unit_factor
+        self.hsp_waist = m['hsp_waist'] * unit_factor
+        self.hsp_hip = m['hsp_hip'] * unit_factor
+        self.bicep = (ease + m['bicep'] * unit_factor) / 2
+        self.top_sleeve = m['top_sleeve'] * unit_factor
+        self.under_sleeve = m['bottom_sleeve'] * unit_factor - 2 * cm_factor
+        self._shoulder_to_chest = self._chest_to_waist = self._chest_to_hip = self._waist_to_hip = None
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    @_Derived
+    def shoulder_to_chest(self):
+        return self.hsp_chest - self.shoulder_drop
+
+    @_Derived
+    def chest_to_waist(self):
+        return self.hsp_waist - self.hsp_chest
+
+    @_Derived
+    def chest_to_hip(self):
+        return self.hsp_hip - self.hsp_chest
+
+    @_Derived
+    def waist_to_hip(self):
+        return self.hsp_hip - self.hsp_waist
+
+    def as_dict(self):
+        """ - return the measurements and derived lengths by name """
+        return dict((name, getattr(self, name)) for name in self.NAMES + self.DERIVED)
+
+    def violations(self):
+        """ - return the descriptions of the constraints which do not hold """
+        return [description for description, test in self.CONSTRAINTS
+                if not all(_holds(condition) for condition in test(self))]
+
+    def validate(self):
+        """
+            Check the physical constraints of the template.
+            - raise MeasurementError if one does not hold
+            - return the measurements
+        """
+        violations = self.violations()
+        if violations:
+            raise MeasurementError('Invalid measurements: %s' % '; '.join(violations))
+        return self
+
+
+def user_measurements(m, unit_factor, cm_factor):
+    """
+        Convert measurements to internal units, with the ease applied.
+        - m: a dict of the FIELDS in user interface units
+        - unit_factor: internal units for one user interface unit
+        - cm_factor: internal units for one centimeter
+        - return a Measurements
+    """
+    return Measurements(m, unit_factor, cm_factor)
+
+
+# ---------------------------------------------------------------- #
+#                           CURVES
+# ---------------------------------------------------------------- #
+def neck_drop(um, front=True):
+    """ Height of the neck drop of the front or back piece (for a single template) """
+    if not front:
+        return um.neck_rear
+    return um.neck_front if um.neck_front > 0 else um.neck
+
+
+def neckline(um, neck_drop):
+    return ['c', [0, 0.6 * neck_drop, -0.5 * um.neck, neck_drop, -um.neck, neck_drop]]
+
+
+def hipline(um):
+    return ['l', [-um.hip, 0]]
+
+
+def shoulder_line(um):
+    return ['l', [um.shoulder - um.neck, um.shoulder_drop]]
+
+
+def waist_curve(um):
+    ctrl_p1 = (0, -0.4 * um.chest_to_waist)
+    ctrl_p2 = (-(um.hip - um.waist), -um.waist_to_hip)
+    curve_end = (um.chest - um.hip, -um.chest_to_hip)
+    return ['c', [ctrl_p1[0], ctrl_p1[1], ctrl_p2[0], ctrl_p2[1], curve_end[0], curve_end[1]]]
+
+
+def sleeve_curve(um, cm_factor):
+    ctrl_p1 = (-5 * cm_factor, 0)
+    ctrl_p2 = (-5 * cm_factor, -um.shoulder_to_chest / 2)
+    curve_end = (um.shoulder - um.chest, -(um.hsp_chest - um.shoulder_drop))
+    return ['c', [ctrl_p1[0], ctrl_p1[1], ctrl_p2[0], ctrl_p2[1], curve_end[0], curve_end[1]]]
+
+
+# ---------------------------------------------------------------- #
+#                           PIECES
+# ---------------------------------------------------------------- #
+def main_piece(um, front, cm_factor, drop=None):
+    """
+        Geometry of the front or back main piece.
+        - 'vertexes': main vertexes absolute positions, in MAIN_VERTEXES order
+        - 'reference': the structure lines, as lists of relative points
+        - 'sewing': the sewing path
+        - 'offset': the seam allowance source path, with a 1.5cm hem extension,
+          to be offset by 'offset_radius'
+    """
+    if drop is None:
+        drop = neck_drop(um, front)
+    vertexes = [
+        (um.neck, 0.0),
+        (0.0, drop),
+        (um.shoulder, um.shoulder_drop),
+        (um.chest, um.hsp_chest),
+        (um.waist, um.hsp_waist),
+        (um.hip, um.hsp_hip)
+    ]
+    reference = [
+        [(0, 0), (0, um.hsp_hip)],
+        [(0, 0), (um.neck, 0)],
+        [(um.neck, 0), (0, um.hsp_hip)],
+        [(0, um.shoulder_drop), (um.shoulder, 0)],
+        [(0, um.hsp_chest), (um.chest, 0)],
+        [(0, um.hsp_waist), (um.waist, 0)],
+        [(0, um.hsp_hip), (um.hip, 0)]
+    ]
+
+    sewing = [['m', list(vertexes[0])],
+              neckline(um, drop),
+              ['l', [0, um.hsp_hip - drop]],
+              ['l', [um.hip, 0]],
+              waist_curve(um),
+              sleeve_curve(um, cm_factor),
+              ['Z', []]]
+
+    hem = 1.5 * cm_factor
+    offset = list(sewing)
+    offset[2] = ['l', [0, um.hsp_hip + hem - drop]]
+    offset[3] = ['l', [um.hip, 0, 0, -hem]]
+
+    return {'neck_drop': drop, 'vertexes': vertexes, 'reference': reference, 'sewing': sewing, 'offset': offset,
+            'offset_radius': cm_factor}
+
+
+def sleeve_piece(um):
+    """
+        Geometry of the sleeve piece.
+        - 'vertexes': main vertexes absolute positions, in SLEEVE_VERTEXES order
+        - 'reference': the structure lines, as lists of relative points
+    """
+    middle = um.top_sleeve - um.under_sleeve
+    vertexes = [
+        (0.0, 0 * middle),
+        (0.0, middle),
+        (um.bicep, middle),
+        (0.0, um.top_sleeve),
+        (um.bicep - 0.5 * um.ease, um.top_sleeve)
+    ]
+    reference = [
+        [vertexes[0], (0, um.top_sleeve), (um.bicep - 0.5 * um.ease, 0)],
+        [vertexes[1], (um.bicep, 0)]
+    ]
+    return {'vertexes': vertexes, 'reference': reference}
+
+
+def compute(um, cm_factor):
+    """
+        Compute the geometry of every piece of a template.
+    """
+    return {
+        'front': main_piece(um, True, cm_factor),
+        'back': main_piece(um, False, cm_factor),
+        'sleeve': sleeve_piece(um)
+    }
@@ -0,0 +1,640 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Grading engine of the saved templates: intermediate and extrapolated sizes
+(e.g. 'fem_37' or 'fem_43') interpolated from the sizes of 'patron.xml'.
+
+The grading model is compiled once from the template store, next to it, and
+recompiled as soon as 'patron.xml' changes:
+ - every part path of every size is flattened and resampled by arc length to
+   the same number of points, so the points of consecutive sizes correspond
+ - the pieces are laid out differently in each size: each piece is registered
+   onto the previous size (rigid transform, mirrored or not) with its longest
+   contour, trying every start point and direction of the closed contours;
+   the other contours of the piece then get their best start and direction
+ - the per point grade vectors between consecutive sizes are stored, with the
+   points of every size in the frame of the first size
+
+A size is then one linear combination over the whole template:
+points = points[k] + (size - sizes[k]) * grades[k], k being the stored interval
+containing (or nearest to) the size. The graded contours are then fitted back
+to cubic curves within TOLERANCE (Schneider's algorithm), split at their
+corners, so that they stay as light as the stored sizes. The graded pieces are
+placed like the nearest stored size, with its texts. The sizes are only graded
+up to one size step beyond the stored ones (MARGIN): further away, there is no
+template, like for an unknown saved size.
+
+The parts that do not exist in every size (by name and rank) are not graded,
+the graded templates list them in 'skipped'.
+
+usage:
+    python patron_grading.py             # compile and print the grading report
+    python patron_grading.py -s fem_37   # print the path data of a graded size
+-----------------------------------------------
+"""
+
+import json
+import math
+import optparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+import patron_path
+import patron_store
+
+__version__ = '1'
+
+TEMPLATES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'patron.xml')
+FORMAT_VERSION = 1
+
+SPACING = 2.0       # resampling step along the contours, in template user units
+TOLERANCE = 0.25    # flattening tolerance of the curves, in template user units
+CLOSED_GAP = 0.01   # open contours whose ends are closer than this ratio of their length are closed
+PRECISION = 2       # decimals of the graded path data
+MARGIN = 1.0        # sizes graded below and beyond the stored ones, in size steps of the end intervals
+CORNER_ANGLE = 30   # turn of a graded contour, in degrees, from which its curves are split
+
+# Graded models already opened in this process, keyed by source path
+_models = {}
+
+
+# ---------------------------------------------------------------- #
+#                       UTILITY FUNCTIONS
+# ---------------------------------------------------------------- #
+def _size_value(size):
+    value = float(size)
+    if math.isnan(value) or math.isinf(value):
+        raise ValueError("Invalid size '%s'" % size)
+    return value
+
+
+def _ordered(items):
+    """ Distinct items, in order of first appearance """
+    seen = set()
+    return [item for item in items if not (item in seen or seen.add(item))]
+
+
+def _contours(template):
+    """
+        Flatten the parts of a stored template, in the coordinates of the template group.
+        - return a list of pieces {'name', 'info', 'matrix', 'parts': [(key, [(points, closed)])]}
+          where key is the (name, rank) of the part in its piece
+    """
+    pieces = []
+    for piece in template['pieces']:
+        piece_matrix = patron_path.parse_transform(piece['transform'])
+        ranks = {}
+        parts = []
+        for part in piece['parts']:
+            matrix = patron_path.compose_transform(piece_matrix, patron_path.parse_transform(part['transform']))
+            rank = ranks[part['name']] = ranks.get(part['name'], -1) + 1
+            contours = [(np.array(patron_path.apply_transform(matrix, points)), closed)
+                        for points, closed in patron_path.flatten_path(part['path'], TOLERANCE) if len(points) > 1]
+            parts.append(((part['name'], rank), contours))
+        pieces.append({'name': piece['name'], 'info': piece['info'], 'matrix': piece_matrix, 'parts': parts})
+    return pieces
+
+
+def _length(points, closed):
+    if closed:
+        points = np.vstack([points, points[:1]])
+    return float(np.hypot(*np.diff(points, axis=0).T).sum())
+
+
+def resample(points, closed, count):
+    """
+        Resample a polyline to count points evenly spaced along its length.
+        - a closed polyline starts at its first point and does not repeat it
+    """
+    if closed:
+        points = np.vstack([points, points[:1]])
+    lengths = np.hypot(*np.diff(points, axis=0).T)
+    keep = np.concatenate([[True], lengths > 1e-12])
+    points = points[keep]
+    position = np.concatenate([[0.0], np.cumsum(lengths[keep[1:]])])
+    total = position[-1]
+    if closed:
+        targets = np.arange(count) * (total / count)
+    else:
+        targets = np.linspace(0.0, total, count)
+    return np.stack([np.interp(targets, position, points[:, 0]), np.interp(targets, position, points[:, 1])], -1)
+
+
+def _correlation(a, b):
+    """ Circular correlation of two point arrays: c[s] = sum_i a[i + s] . b[i], for every shift s """
+    fa, fb = np.fft.rfft(a, axis=0), np.fft.rfft(b, axis=0)
+    return np.fft.irfft(fa * np.conj(fb), len(a), axis=0)
+
+
+def _cross_correlation(a, b):
+    """ c[s] = sum_i a[i + s] x b[i] (2d cross products), for every shift s """
+    return (_correlation(a[:, :1], b[:, 1:]) - _correlation(a[:, 1:], b[:, :1]))[:, 0]
+
+
+def _candidates(points, closed):
+    """ Start point and direction variants of a contour, as (reversed, points) """
+    yield False, points
+    yield True, points[::-1]
+
+
+def register(reference, points, closed):
+    """
+        Best rigid transform (rotation, possibly mirrored, and translation)
+        and point correspondence of a contour onto a reference contour.
+        - return (matrix, points) where matrix is the (a, b, c, d, e, f)
+          transform of the contour onto the reference, and points are the
+          contour points reordered to match the reference ones
+    """
+    p_center = reference.mean(axis=0)
+    p = reference - p_center
+    best = None
+    for mirror in (1.0, -1.0):
+        for reverse, candidate in _candidates(points * [1.0, mirror], closed):
+            q_center = candidate.mean(axis=0)
+            q = candidate - q_center
+            if closed:
+                dot = _correlation(q, p).sum(axis=1)
+                cross = _cross_correlation(q, p)
+            else:
+                dot = np.array([(q * p).sum()])
+                cross = np.array([(q[:, 0] * p[:, 1] - q[:, 1] * p[:, 0]).sum()])
+            score = np.hypot(dot, cross)
+            shift = int(np.argmax(score))
+            if best is None or score[shift] > best[0]:
+                best = (score[shift], mirror, reverse, shift, math.atan2(cross[shift], dot[shift]), q_center)
+
+    score, mirror, reverse, shift, angle, q_center = best
+    cos, sin = math.cos(angle), math.sin(angle)
+    linear = (cos, sin, -sin * mirror, cos * mirror)
+    origin = (points[:, 0].mean(), points[:, 1].mean())
+    translation = (p_center[0] - (linear[0] * origin[0] + linear[2] * origin[1]),
+                   p_center[1] - (linear[1] * origin[0] + linear[3] * origin[1]))
+    matrix = linear + translation
+    if reverse:
+        points = points[::-1]
+    return matrix, np.roll(points, -shift, axis=0)
+
+
+def match(reference, points, closed):
+    """ Reorder the points of a contour (start point and direction) to best match a reference contour """
+    best = None
+    for reverse, candidate in _candidates(points, closed):
+        if closed:
+            distances = (candidate ** 2).sum() - 2 * _correlation(candidate, reference).sum(axis=1)
+        else:
+            distances = np.array([((candidate - reference) ** 2).sum()])
+        shift = int(np.argmin(distances))
+        if best is None or distances[shift] < best[0]:
+            best = (distances[shift], np.roll(candidate, -shift, axis=0))
+    return best[1]
+
+
+def _apply(matrix, points):
+    a, b, c, d, e, f = matrix
+    return np.stack([a * points[:, 0] + c * points[:, 1] + e, b * points[:, 0] + d * points[:, 1] + f], -1)
+
+
+def _invert(matrix):
+    a, b, c, d, e, f = matrix
+    det = a * d - b * c
+    return (d / det, -b / det, -c / det, a / det, (c * f - d * e) / det, (b * e - a * f) / det)
+
+
+# ---------------------------------------------------------------- #
+#                         CURVE FITTING
+# ---------------------------------------------------------------- #
+def _unit(vector):
+    norm = np.hypot(*vector)
+    return vector / norm if norm > 1e-12 else vector
+
+
+def _bernstein(u):
+    """ Cubic Bernstein polynomials at the parameters u, as four (len(u), 1) columns """
+    u = u[:, None]
+    v = 1 - u
+    return v * v * v, 3 * v * v * u, 3 * v * u * u, u * u * u
+
+
+def _derivatives(curve, u):
+    """ First and second derivatives of a cubic curve (4, 2) at the parameters u """
+    p0, p1, p2, p3 = curve
+    u = u[:, None]
+    v = 1 - u
+    first = 3 * (v * v * (p1 - p0) + 2 * v * u * (p2 - p1) + u * u * (p3 - p2))
+    second = 6 * (v * (p2 - 2 * p1 + p0) + u * (p3 - 2 * p2 + p1))
+    return first, second
+
+
+def _fit_cubic(points, left, right, b):
+    """ Least squares cubic curve through points, with the Bernstein values b of their parameters and the end tangents """
+    p0, p3 = points[0], points[-1]
+    a1, a2 = b[1] * left, b[2] * right
+    rest = points - ((b[0] + b[1]) * p0 + (b[2] + b[3]) * p3)
+    c = np.array([[(a1 * a1).sum(), (a1 * a2).sum()], [(a1 * a2).sum(), (a2 * a2).sum()]])
+    x = np.array([(a1 * rest).sum(), (a2 * rest).sum()])
+    chord = np.hypot(*(p3 - p0))
+    det = c[0, 0] * c[1, 1] - c[0, 1] * c[1, 0]
+    alphas = None
+    if abs(det) > 1e-12:
+        alphas = ((x[0] * c[1, 1] - x[1] * c[0, 1]) / det, (c[0, 0] * x[1] - c[1, 0] * x[0]) / det)
+    if alphas is None or min(alphas) < 1e-6 * chord:
+        alphas = (chord / 3, chord / 3)
+    return np.array([p0, p0 + alphas[0] * left, p3 + alphas[1] * right, p3])
+
+
+def _fit_run(points, left, right, tolerance, curves):
+    """ Append to curves the cubic curves fitting a run of points, split where the error is the largest """
+    if len(points) == 2:
+        chord = np.hypot(*(points[1] - points[0])) / 3
+        curves.append(np.array([points[0], points[0] + chord * left, points[1] + chord * right, points[1]]))
+        return
+    lengths = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(points, axis=0).T))])
+    u = lengths / lengths[-1]
+    for attempt in range(4):
+        b = _bernstein(u)
+        curve = _fit_cubic(points, left, right, b)
+        fitted = b[0] * curve[0] + b[1] * curve[1] + b[2] * curve[2] + b[3] * curve[3]
+        errors = ((fitted - points) ** 2).sum(axis=1)
+        split = int(np.argmax(errors))
+        if errors[split] <= tolerance * tolerance:
+            curves.append(curve)
+            return
+        if errors[split] > 16 * tolerance * tolerance or attempt == 3:
+            break
+        # Newton step on the parameters before trying again
+        first, second = _derivatives(curve, u)
+        delta = fitted - points
+        denominator = (first * first).sum(axis=1) + (delta * second).sum(axis=1)
+        step = np.where(np.abs(denominator) > 1e-12, (delta * first).sum(axis=1) / np.where(
+            denominator == 0, 1, denominator), 0.0)
+        u = np.clip(u - step, 0.0, 1.0)
+    split = min(max(split, 1), len(points) - 2)
+    center = _unit(points[split - 1] - points[split + 1])
+    _fit_run(points[:split + 1], left, center, tolerance, curves)
+    _fit_run(points[split:], -center, right, tolerance, curves)
+
+
+def fit_contour(points, closed, tolerance=TOLERANCE):
+    """
+        Fit a contour with cubic curves, split at its corners.
+        - return the path as [command, params] pairs
+    """
+    count = len(points)
+    if closed:
+        points = np.vstack([points, points[:1]])
+    incoming = np.diff(points, axis=0)
+    if closed:
+        # turn at every point, the start included
+        before, after = np.roll(incoming, 1, axis=0), incoming
+    else:
+        before, after = incoming[:-1], incoming[1:]
+    cosines = (before * after).sum(axis=1) / np.maximum(np.hypot(*before.T) * np.hypot(*after.T), 1e-12)
+    turns = np.flatnonzero(cosines < math.cos(math.radians(CORNER_ANGLE)))
+    corners = set(turns.tolist()) if closed else set((turns + 1).tolist())
+    breaks = sorted(corners | {0, count if closed else count - 1})
+
+    def tangent(index, forward):
+        # the last point of a closed contour is its first one again
+        if (index % count if closed else index) in corners or (not closed and index in (0, count - 1)):
+            return _unit(points[index + 1] - points[index]) if forward else _unit(points[index - 1] - points[index])
+        previous = points[index - 1] if index else points[count - 1]
+        following = points[index + 1] if index < count else points[1]
+        return _unit(following - previous) if forward else _unit(previous - following)
+
+    curves = []
+    for first, last in zip(breaks[:-1], breaks[1:]):
+        _fit_run(points[first:last + 1], tangent(first, True), tangent(last, False), tolerance, curves)
+    path = [['M', points[0].tolist()], ['C', [value for curve in curves for value in curve[1:].ravel().tolist()]]]
+    if closed:
+        path.append(['Z', []])
+    return path
+
+
+# ---------------------------------------------------------------- #
+#                           COMPILER
+# ---------------------------------------------------------------- #
+def grade_category(store, category):
+    """
+        Build the grading model of a template type.
+        - return (meta, sizes, points, grades) where points has the shape
+          (sizes, points, 2) and grades (sizes - 1, points, 2), per unit of size
+    """
+    names = sorted(store.sizes(category), key=_size_value)
+    templates = [store.get(category, name) for name in names]
+    shapes = [_contours(template) for template in templates]
+
+    # Pieces and parts graded: the ones with the same contours in every size
+    meta = {'sizes': names, 'pieces': [], 'layouts': [], 'skipped': [], 'residuals': []}
+    pieces = []
+    for name in _ordered(piece['name'] for shape in shapes for piece in shape):
+        same = [[piece for piece in shape if piece['name'] == name] for shape in shapes]
+        if not all(same):
+            meta['skipped'].append(name)
+            continue
+        same = [others[0] for others in same]
+        parts = []
+        for key in _ordered(key for piece in same for key, contours in piece['parts']):
+            found = [dict(piece['parts']).get(key) for piece in same]
+            if not all(found) or len(set(len(contours) for contours in found)) != 1:
+                meta['skipped'].append('%s/%s%d' % (name, key[0], key[1]))
+                continue
+            parts.append((key, found))
+        if parts:
+            pieces.append((name, same, parts))
+
+    point_count = 0
+    layouts = [[] for _ in names]
+    residuals = [[] for _ in names]
+    graded = []
+    for piece_name, same, parts in pieces:
+        # Resample every contour of every size to the same number of points
+        contours = []
+        for key, found in parts:
+            for index in range(len(found[0])):
+                closed = all(c[index][1] or np.hypot(*(c[index][0][0] - c[index][0][-1])) <=
+                             CLOSED_GAP * _length(c[index][0], False) for c in found)
+                length = max(_length(c[index][0], closed) for c in found)
+                count = max(4, int(math.ceil(length / SPACING)))
+                contours.append((key, closed, [resample(c[index][0], closed, count) for c in found]))
+
+        # Register every size onto the previous one with the longest contour, in the frame of the first size
+        main = max(range(len(contours)), key=lambda i: len(contours[i][2][0]))
+        aligned = [[sizes[0] for key, closed, sizes in contours]]
+        matrices = [patron_path.IDENTITY]
+        for index in range(1, len(names)):
+            matrix, main_points = register(aligned[-1][main], contours[main][2][index], contours[main][1])
+            current = []
+            for number, (key, closed, sizes) in enumerate(contours):
+                points = _apply(matrix, main_points if number == main else sizes[index])
+                current.append(points if number == main else match(aligned[-1][number], points, closed))
+            residual = np.sqrt(((current[main] - aligned[-1][main]) ** 2).sum(axis=1).mean())
+            residuals[index].append(round(float(residual), 2))
+            aligned.append(current)
+            matrices.append(matrix)
+
+        part_meta = []
+        for number, (key, closed, sizes) in enumerate(contours):
+            if not part_meta or part_meta[-1]['key'] != list(key):
+                part_meta.append({'key': list(key), 'contours': []})
+            count = len(sizes[0])
+            part_meta[-1]['contours'].append([point_count, count, closed])
+            point_count += count
+        meta['pieces'].append({'name': piece_name, 'parts': part_meta})
+        for index, piece in enumerate(same):
+            # The text of the piece keeps its place once the piece group is transformed back
+            info = patron_path.compose_transform(matrices[index], patron_path.compose_transform(
+                piece['matrix'], patron_path.parse_transform(piece['info'])))
+            layouts[index].append({'info': patron_path.format_transform(info) or 'translate(0,0)',
+                                   'matrix': list(_invert(matrices[index]))})
+        graded.append(np.stack([np.concatenate(size_points) for size_points in aligned]))
+
+    meta['layouts'] = [{'transform': template['transform'], 'pieces': layout}
+                       for template, layout in zip(templates, layouts)]
+    meta['residuals'] = [max(values) if values else 0.0 for values in residuals]
+    sizes = np.array([_size_value(name) for name in names])
+    points = np.concatenate(graded, axis=1) if graded else np.zeros((len(names), 0, 2))
+    grades = np.diff(points, axis=0) / np.diff(sizes)[:, None, None]
+    return meta, sizes, points, grades
+
+
+def compile_grading(source, target):
+    """
+        Compile the grading model of every template type of a 'patron.xml' file.
+    """
+    stat = os.stat(source)
+    store = patron_store.open_store(source)
+    meta = {'version': FORMAT_VERSION, 'mtime': stat.st_mtime, 'size': stat.st_size, 'types': {}}
+    arrays = {}
+    for category in store.types():
+        meta['types'][category], sizes, points, grades = grade_category(store, category)
+        arrays[category + '.sizes'] = sizes
+        arrays[category + '.points'] = points
+        arrays[category + '.grades'] = grades
+    arrays['meta'] = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+
+    # Write to a temporary file first so that concurrent readers never see a partial model
+    handle, temp_path = tempfile.mkstemp(prefix='.patron_grading_', dir=os.path.dirname(target) or '.')
+    with os.fdopen(handle, 'wb') as stream:
+        np.savez(stream, **arrays)
+    os.chmod(temp_path, 0o644)
+    try:
+        os.replace(temp_path, target)
+    except AttributeError:
+        # python 2
+        if os.path.exists(target):
+            os.remove(target)
+        os.rename(temp_path, target)
+
+
+# ---------------------------------------------------------------- #
+#                             MODEL
+# ---------------------------------------------------------------- #
+class GradingModel(object):
+    """
+        Graded sizes of the saved templates, by linear combination of the stored sizes.
+    """
+
+    def __init__(self, source, target=None):
+        self.source = os.path.abspath(source)
+        self.target = target or self.default_target(self.source)
+        self.meta = None
+        self._arrays = {}
+        self._mtime = None
+
+    @staticmethod
+    def default_target(source):
+        """ Next to the compiled store of the source """
+        store_target = patron_store.TemplateStore.default_target(source)
+        return store_target[:-len('.store')] + '.grading.npz'
+
+    def _read_meta(self):
+        try:
+            with np.load(self.target) as data:
+                return json.loads(data['meta'].tobytes().decode('utf-8'))
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+
+    def _load(self):
+        """ Load the model, compiling it first when the source changed """
+        stat = os.stat(self.source)
+        if self.meta is not None and self._mtime == (stat.st_mtime, stat.st_size):
+            return
+        meta = self._read_meta()
+        if meta is None or meta.get('version') != FORMAT_VERSION or \
+                (meta.get('mtime'), meta.get('size')) != (stat.st_mtime, stat.st_size):
+            compile_grading(self.source, self.target)
+            meta = self._read_meta()
+        with np.load(self.target) as data:
+            self._arrays = dict((name, data[name]) for name in data.files if name != 'meta')
+        self.meta = meta
+        self._mtime = (stat.st_mtime, stat.st_size)
+
+    def types(self):
+        self._load()
+        return list(self.meta['types'])
+
+    def report(self, category):
+        """ Stored sizes, skipped parts and registration residual of each size of a template type """
+        self._load()
+        return self.meta['types'].get(category)
+
+    def limits(self, category):
+        """
+            Range of the graded sizes of a template type: the stored sizes, widened by MARGIN size steps.
+            - return (smallest, largest) size
+            - raise ValueError if the template type is unknown or has less than two sizes
+        """
+        self._load()
+        meta = self.meta['types'].get(category)
+        if meta is None or len(meta['sizes']) < 2:
+            raise ValueError("Template type '%s' can not be graded, it needs two stored sizes" % category)
+        sizes = self._arrays[category + '.sizes']
+        return (float(sizes[0] - MARGIN * (sizes[1] - sizes[0])),
+                float(sizes[-1] + MARGIN * (sizes[-1] - sizes[-2])))
+
+    def points(self, category, size):
+        """
+            Points of every graded contour of a template type at a size within its limits.
+            - return an array of shape (points, 2), in the frame of the first stored size
+            - raise ValueError if the size is out of the limits, or the template type can not be graded
+        """
+        self._load()
+        smallest, largest = self.limits(category)
+        if not smallest <= size <= largest:
+            raise ValueError("Size %g out of the graded sizes %g to %g" % (size, smallest, largest))
+        sizes = self._arrays[category + '.sizes']
+        index = min(max(int(np.searchsorted(sizes, size, side='right')) - 1, 0), len(sizes) - 2)
+        return self._arrays[category + '.points'][index] + \
+            (size - sizes[index]) * self._arrays[category + '.grades'][index]
+
+    def _layout(self, category, size):
+        """ Layout of the stored size nearest to size """
+        sizes = self._arrays[category + '.sizes']
+        return self.meta['types'][category]['layouts'][int(np.argmin(np.abs(sizes - _size_value(size))))]
+
+    def frame(self, category, size, piece, anchor=None):
+        """
+            Transform of a piece, as laid out in the stored size nearest to size,
+            onto the same piece of the anchor size, registered on their outlines.
+            - anchor: the size giving the place of the piece, the common frame of
+              the graded sizes (the frame of the first size) if None
+            - return None if the piece is not graded
+        """
+        self._load()
+        meta = self.meta['types'].get(category)
+        if meta is None:
+            return None
+        names = [graded['name'] for graded in meta['pieces']]
+        if piece not in names:
+            return None
+        index = names.index(piece)
+        matrix = _invert(tuple(self._layout(category, size)['pieces'][index]['matrix']))
+        if anchor is not None:
+            matrix = patron_path.compose_transform(tuple(self._layout(category, anchor)['pieces'][index]['matrix']),
+                                                   matrix)
+        return matrix
+
+    def get(self, category, size):
+        """
+            Render a graded template, in the format of patron_store.TemplateStore.get,
+            with the names of the parts left out in 'skipped'.
+            - return None if the template type is unknown or has less than two sizes,
+              or if the size is out of its limits
+        """
+        self._load()
+        meta = self.meta['types'].get(category)
+        if meta is None or len(meta['sizes']) < 2:
+            return None
+        size = _size_value(size)
+        smallest, largest = self.limits(category)
+        if not smallest <= size <= largest:
+            return None
+        points = self.points(category, size)
+
+        # Placed like the nearest stored size
+        layout = self._layout(category, size)
+        template = {'transform': layout['transform'], 'pieces': [], 'skipped': meta['skipped']}
+        for piece, piece_layout in zip(meta['pieces'], layout['pieces']):
+            parts = []
+            for part in piece['parts']:
+                path = []
+                for start, count, closed in part['contours']:
+                    path.extend(fit_contour(points[start:start + count], closed))
+                parts.append({'name': part['key'][0], 'transform': '', 'path': path,
+                              'd': patron_path.build_path(path, PRECISION)})
+            template['pieces'].append({'name': piece['name'], 'info': piece_layout['info'],
+                                       'transform': patron_path.format_transform(tuple(piece_layout['matrix'])),
+                                       'parts': parts})
+        return template
+
+
+def open_grading(source, target=None):
+    """
+        Return the grading model of the given 'patron.xml' file, shared in this process.
+    """
+    source = os.path.abspath(source)
+    model = _models.get(source)
+    if model is None:
+        model = _models[source] = GradingModel(source, target)
+    return model
+
+
+def get_template(source, category, size):
+    """
+        A saved template of 'patron.xml', graded when the size is not stored.
+        - return None if the template type is unknown, or the size invalid or out of the graded sizes
+    """
+    template = patron_store.open_store(source).get(category, size)
+    if template is None:
+        try:
+            _size_value(size)
+        except ValueError:
+            return None
+        template = open_grading(source).get(category, size)
+    return template
+
+
+# ---------------------------------------------------------------- #
+#                             MAIN
+# ---------------------------------------------------------------- #
+def main(argv=None):
+    parser = optparse.OptionParser(usage="usage: %prog [options]")
+    parser.add_option("--source", type="string", dest="source", default=TEMPLATES_FILE,
+                      help="Saved templates file")
+    parser.add_option("-s", "--size", type="string", dest="template_id", default=None,
+                      help="Print the path data of a graded template, e.g. 'fem_37'")
+    options, args = parser.parse_args(argv)
+
+    model = open_grading(options.source)
+    if options.template_id:
+        category, size = options.template_id.split('_')
+        try:
+            template = model.get(category, size)
+        except ValueError as error:
+            parser.error(str(error))
+        if template is None:
+            parser.error("unknown template type '%s' or size out of the graded sizes" % category)
+        for piece in template['pieces']:
+            for part in piece['parts']:
+                sys.stdout.write('%s %s: %s\n' % (piece['name'], part['name'], part['d']))
+        return 0
+
+    for category in model.types():
+        report = model.report(category)
+        sys.stdout.write('%s: sizes %s, %d graded points\n' % (category, ', '.join(report['sizes']),
+                                                              model._arrays[category + '.points'].shape[1]))
+        sys.stdout.write('  registration residual per size: %s\n' % ', '.join(
+            '%s=%.2f' % item for item in zip(report['sizes'], report['residuals'])))
+        if report['skipped']:
+            sys.stdout.write('  not graded: %s\n' % ', '.join(report['skipped']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,468 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Nesting of the template pieces onto fixed size sheets (A0 by default).
+
+The pieces (front, back, sleeve, ...) of one or many rendered templates are
+measured from their paths, then packed on their bounding boxes by a bottom-left
+heuristic using a grid spatial index over the placed boxes. Several piece orders
+are tried until the time budget is spent and the packing using the fewest sheets
+is kept. Each sheet becomes its own Inkscape layer.
+
+Nesting a document again packs the pieces already on its sheet layers together
+with the new templates, and replaces those sheets.
+
+The allowed orientations are rotations by a multiple of 90 degrees, optionally
+mirrored ('90m' is a mirrored quarter turn). A mirrored orientation has the
+footprint of its rotation, so it is only chosen when listed before it.
+
+usage:
+    python patron_nesting.py patron_a.svg patron_b.svg -o sheets.svg --gap 5 --time 2
+-----------------------------------------------
+"""
+
+import math
+import optparse
+import random
+import re
+import sys
+import time
+import xml.etree.ElementTree as Etree
+
+import patron_path
+
+__version__ = '1'
+
+NSS = {
+    'svg': 'http://www.w3.org/2000/svg',
+    'inkscape': 'http://www.inkscape.org/namespaces/inkscape',
+    'sodipodi': 'http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd',
+    'xlink': 'http://www.w3.org/1999/xlink',
+}
+LABEL = '{%s}label' % NSS['inkscape']
+HREF = '{%s}href' % NSS['xlink']
+GROUPMODE = '{%s}groupmode' % NSS['inkscape']
+
+# Labels of the groups rendered by Patron.effect and Patron.saved_template
+TEMPLATE_PREFIXES = ('Patron_T-shirt_', 'T-shirt_template_')
+
+# Label of the sheet layers made by nest
+SHEET_LABEL = 'Sheet %d'
+SHEET_LABEL_PATTERN = re.compile(r'Sheet \d+$')
+
+A0 = (1189.0, 841.0)
+
+
+# ---------------------------------------------------------------- #
+#                         SPATIAL INDEX
+# ---------------------------------------------------------------- #
+class BoxIndex(object):
+    """
+        Uniform grid index over axis aligned boxes (x0, y0, x1, y1).
+    """
+
+    def __init__(self, cell):
+        self.cell = float(cell)
+        self.cells = {}
+        self.boxes = []
+
+    def _cells(self, box):
+        x0, y0 = int(math.floor(box[0] / self.cell)), int(math.floor(box[1] / self.cell))
+        x1, y1 = int(math.floor(box[2] / self.cell)), int(math.floor(box[3] / self.cell))
+        for i in range(x0, x1 + 1):
+            for j in range(y0, y1 + 1):
+                yield i, j
+
+    def insert(self, box):
+        index = len(self.boxes)
+        self.boxes.append(box)
+        for key in self._cells(box):
+            self.cells.setdefault(key, []).append(index)
+
+    def intersects(self, box):
+        for key in self._cells(box):
+            for index in self.cells.get(key, ()):
+                other = self.boxes[index]
+                if other[0] < box[2] and box[0] < other[2] and other[1] < box[3] and box[1] < other[3]:
+                    return True
+        return False
+
+    def query(self, box):
+        """ - return the sorted indexes of the boxes intersecting box (touching included) """
+        found = set()
+        for key in self._cells(box):
+            for index in self.cells.get(key, ()):
+                other = self.boxes[index]
+                if other[0] <= box[2] and box[0] <= other[2] and other[1] <= box[3] and box[1] <= other[3]:
+                    found.add(index)
+        return sorted(found)
+
+
+# ---------------------------------------------------------------- #
+#                            PACKER
+# ---------------------------------------------------------------- #
+class Sheet(object):
+    """ Placed boxes and candidate positions of a single sheet """
+
+    def __init__(self, width, height, cell):
+        self.width = width
+        self.height = height
+        self.index = BoxIndex(cell)
+        self.candidates = [(0.0, 0.0)]
+        self.free_area = width * height
+        self.bottom = 0.0
+
+    def find(self, footprint, gap):
+        """ Top-left most free position for a footprint (w, h), None if it does not fit """
+        w, h = footprint
+        if w * h > self.free_area:
+            return None
+        for y, x in self.candidates:
+            if x + w > self.width or y + h > self.height:
+                continue
+            if not self.index.intersects((x, y, x + w + gap, y + h + gap)):
+                return x, y
+        return None
+
+    def place(self, x, y, footprint, gap):
+        w, h = footprint
+        self.index.insert((x, y, x + w + gap, y + h + gap))
+        self.free_area -= w * h
+        self.bottom = max(self.bottom, y + h)
+        covered = [(cy, cx) for cy, cx in self.candidates if x <= cx < x + w + gap and y <= cy < y + h + gap]
+        for candidate in covered:
+            self.candidates.remove(candidate)
+        for candidate in ((y, x + w + gap), (y + h + gap, x)):
+            if candidate[1] < self.width and candidate[0] < self.height:
+                self.candidates.append(candidate)
+        self.candidates.sort()
+
+
+def _footprints(size, orientations):
+    """ Distinct (orientation, footprint) pairs of a piece of size (w, h) """
+    seen = set()
+    result = []
+    for orientation in orientations:
+        w, h = size if orientation[0] % 180 == 0 else (size[1], size[0])
+        if (w, h) not in seen:
+            seen.add((w, h))
+            result.append((orientation, (w, h)))
+    return result
+
+
+def _pack_order(order, sizes, width, height, orientations, gap, deadline):
+    """
+        Pack the pieces in the given order.
+        - return the list of placements, None if the deadline is reached
+    """
+    cell = max(width, height) / 16.0
+    sheets = []
+    placements = [None] * len(sizes)
+    for count, i in enumerate(order):
+        if deadline is not None and count % 8 == 0 and time.time() > deadline:
+            return None
+        options = _footprints(sizes[i], orientations)
+        placed = False
+        for number, sheet in enumerate(sheets):
+            best = None
+            for orientation, footprint in options:
+                position = sheet.find(footprint, gap)
+                if position is not None and (best is None or (position[1], position[0]) < (best[0][1], best[0][0])):
+                    best = (position, orientation, footprint)
+            if best is not None:
+                sheet.place(best[0][0], best[0][1], best[2], gap)
+                placements[i] = (number, best[0][0], best[0][1], best[1])
+                placed = True
+                break
+        if not placed:
+            sheet = Sheet(width, height, cell)
+            for orientation, footprint in options:
+                if footprint[0] <= width and footprint[1] <= height:
+                    sheet.place(0.0, 0.0, footprint, gap)
+                    placements[i] = (len(sheets), 0.0, 0.0, orientation)
+                    sheets.append(sheet)
+                    break
+            else:
+                raise ValueError("Piece %d of size %gx%g does not fit on a %gx%g sheet"
+                                 % (i, sizes[i][0], sizes[i][1], width, height))
+    return placements, sheets
+
+
+def _orders(sizes, seed=0):
+    """ Piece orders tried by the packer, the deterministic heuristics first """
+    indexes = list(range(len(sizes)))
+    yield sorted(indexes, key=lambda i: -sizes[i][0] * sizes[i][1])
+    yield sorted(indexes, key=lambda i: -max(sizes[i]))
+    yield sorted(indexes, key=lambda i: -sizes[i][1])
+    yield sorted(indexes, key=lambda i: -sizes[i][0])
+    yield sorted(indexes, key=lambda i: -(sizes[i][0] + sizes[i][1]))
+
+    # Then random perturbations of the area order
+    generator = random.Random(seed)
+    base = sorted(indexes, key=lambda i: -sizes[i][0] * sizes[i][1])
+    while True:
+        order = list(base)
+        for _ in range(max(1, len(order) // 4)):
+            a, b = generator.randrange(len(order)), generator.randrange(len(order))
+            order[a], order[b] = order[b], order[a]
+        yield order
+
+
+def pack(sizes, width, height, orientations=((0, False), (90, False)), gap=0.0, time_budget=1.0):
+    """
+        Pack boxes onto as few sheets as possible.
+        - sizes: list of box sizes (w, h)
+        - orientations: allowed (rotation in degrees, mirrored) pairs
+        - return (placements, sheets count), placements[i] being (sheet, x, y, orientation)
+        The first order is always packed, the others only while the time budget allows.
+    """
+    if not sizes:
+        return [], 0
+    deadline = time.time() + time_budget
+    best = best_score = None
+    for attempt, order in enumerate(_orders(sizes)):
+        if attempt and time.time() > deadline:
+            break
+        result = _pack_order(order, sizes, width, height, orientations, gap, deadline if attempt else None)
+        if result is None:
+            break
+        placements, sheets = result
+        score = (len(sheets), sheets[-1].bottom)
+        if best is None or score < best_score:
+            best, best_score = placements, score
+    return best, best_score[0]
+
+
+# ---------------------------------------------------------------- #
+#                         SVG DOCUMENTS
+# ---------------------------------------------------------------- #
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else ''
+
+
+def find_symbols(root):
+    """ Symbols of the document that <use> elements can reference, by id """
+    return dict((element.get('id'), element) for element in root.iter()
+                if _local_name(element.tag) == 'symbol' and element.get('id'))
+
+
+def use_target(element, symbols):
+    """
+        Symbol referenced by a <use> element and the matrix placing it.
+        - return (symbol, matrix) or (None, None) if the symbol is unknown
+    """
+    target = symbols.get((element.get(HREF) or element.get('href') or '').lstrip('#')) if symbols else None
+    if target is None:
+        return None, None
+    return target, (1.0, 0.0, 0.0, 1.0, float(element.get('x', 0)), float(element.get('y', 0)))
+
+
+def element_points(element, matrix, tolerance=1.0, symbols=None):
+    """
+        Points outlining the geometry of an element and its children,
+        in the coordinate system where the element has the given matrix.
+        - symbols: the symbols referenced by <use> elements, by id (see find_symbols)
+    """
+    matrix = patron_path.compose_transform(matrix, patron_path.parse_transform(element.get('transform')))
+    name = _local_name(element.tag)
+    points = []
+    if name == 'path' and element.get('d'):
+        for subpath, closed in patron_path.flatten_path(element.get('d'), tolerance):
+            points.extend(subpath)
+    elif name == 'circle':
+        cx, cy, r = float(element.get('cx', 0)), float(element.get('cy', 0)), float(element.get('r', 0))
+        points.extend((cx + r * math.cos(k * math.pi / 4), cy + r * math.sin(k * math.pi / 4)) for k in range(8))
+    elif name == 'rect':
+        x, y = float(element.get('x', 0)), float(element.get('y', 0))
+        w, h = float(element.get('width', 0)), float(element.get('height', 0))
+        points.extend([(x, y), (x + w, y), (x + w, y + h), (x, y + h)])
+    points = patron_path.apply_transform(matrix, points)
+    if name == 'use':
+        target, placement = use_target(element, symbols)
+        if target is not None:
+            for child in target:
+                points.extend(element_points(child, patron_path.compose_transform(matrix, placement),
+                                             tolerance, symbols))
+    for child in element:
+        points.extend(element_points(child, matrix, tolerance, symbols))
+    return points
+
+
+def is_sheet(element):
+    """ True if element is a sheet layer made by nest """
+    return element.get(GROUPMODE) == 'layer' and SHEET_LABEL_PATTERN.match(element.get(LABEL) or '') is not None
+
+
+def find_pieces(root):
+    """
+        Find the pieces of the Patron templates in the document, the pieces already
+        nested on a sheet layer included.
+        - return a list of (template group or sheet layer, its parent, piece group,
+          matrix of the template in the root space)
+    """
+    pieces = []
+
+    def walk(container, matrix):
+        for child in container:
+            if _local_name(child.tag) != 'g':
+                continue
+            child_matrix = patron_path.compose_transform(matrix, patron_path.parse_transform(child.get('transform')))
+            if is_sheet(child) or (child.get(LABEL) or '').startswith(TEMPLATE_PREFIXES):
+                for piece in child:
+                    if _local_name(piece.tag) == 'g':
+                        pieces.append((child, container, piece, child_matrix))
+            else:
+                walk(child, child_matrix)
+
+    walk(root, patron_path.IDENTITY)
+    return pieces
+
+
+def orientation_matrix(orientation):
+    """ Rotation, possibly mirrored, of an (angle, mirrored) orientation """
+    angle, mirrored = orientation
+    matrix = patron_path.parse_transform('rotate(%g)' % angle)
+    # Remove the rounding noise so that multiples of 90 degrees stay exact
+    matrix = tuple(float(round(value)) if abs(value - round(value)) < 1e-12 else value for value in matrix)
+    if mirrored:
+        matrix = patron_path.compose_transform(matrix, (-1.0, 0.0, 0.0, 1.0, 0.0, 0.0))
+    return matrix
+
+
+def nest(root, width, height, orientations=((0, False), (90, False)), gap=0.0, time_budget=1.0, tolerance=1.0):
+    """
+        Move the pieces of every template found in the document onto sheet layers,
+        replacing the sheet layers of a previous nesting.
+        - width, height, gap and tolerance are in document user units
+        - return the list of sheet layers
+    """
+    pieces = find_pieces(root)
+    symbols = find_symbols(root)
+    boxes = []
+    for template, container, piece, matrix in pieces:
+        points = element_points(piece, matrix, tolerance, symbols)
+        boxes.append(patron_path.points_to_bbox(points) if points else (0.0, 0.0, 0.0, 0.0))
+    sizes = [(box[2] - box[0], box[3] - box[1]) for box in boxes]
+    placements, sheets_count = pack(sizes, width, height, orientations, gap, time_budget)
+
+    layers = []
+    for number in range(sheets_count):
+        layer = root.makeelement('{%s}g' % NSS['svg'], {LABEL: SHEET_LABEL % (number + 1), GROUPMODE: 'layer'})
+        if number:
+            layer.set('style', 'display:none')
+        root.append(layer)
+        layers.append(layer)
+
+    for (template, container, piece, matrix), box, placement in zip(pieces, boxes, placements):
+        number, x, y, orientation = placement
+        rotation = orientation_matrix(orientation)
+        corners = patron_path.apply_transform(rotation, [(box[0], box[1]), (box[2], box[1]),
+                                                         (box[2], box[3]), (box[0], box[3])])
+        llx, lly = patron_path.points_to_bbox(corners)[:2]
+        placed = patron_path.compose_transform((1.0, 0.0, 0.0, 1.0, x - llx, y - lly), rotation)
+        piece_matrix = patron_path.parse_transform(piece.get('transform'))
+        transform = patron_path.format_transform(
+            patron_path.compose_transform(placed, patron_path.compose_transform(matrix, piece_matrix)))
+
+        template.remove(piece)
+        if transform:
+            piece.set('transform', transform)
+        elif 'transform' in piece.attrib:
+            del piece.attrib['transform']
+        layers[number].append(piece)
+
+    # Remove the emptied template groups and sheet layers
+    for template, container, piece, matrix in pieces:
+        if len(template) == 0 and template in list(container):
+            container.remove(template)
+    return layers
+
+
+def parse_orientations(rotations, mirror=False):
+    """
+        Allowed orientations from a comma separated list of angles, a 'm' suffix meaning mirrored.
+        - mirror: also allow the mirrored version of every angle
+    """
+    orientations = []
+    for angle in rotations.split(','):
+        angle = angle.strip()
+        if angle:
+            orientations.append((int(float(angle.rstrip('m'))) % 360, angle.endswith('m')))
+    if mirror:
+        orientations += [(angle, True) for angle, mirrored in orientations if not mirrored]
+    return orientations
+
+
+def document_scale(root):
+    """ Document user units per millimeter """
+    units = {'mm': 1.0, 'cm': 10.0, 'in': 25.4, 'pt': 25.4 / 72, 'pc': 25.4 / 6, 'px': 25.4 / 96, '': 25.4 / 96}
+    width = root.get('width', '')
+    number = patron_path.NUMBER.match(width.strip())
+    view_box = [float(v) for v in patron_path.NUMBER.findall(root.get('viewBox', ''))]
+    if number is None or len(view_box) != 4:
+        return 96 / 25.4
+    unit = width.strip()[number.end():].strip()
+    return view_box[2] / (float(number.group(0)) * units.get(unit, 25.4 / 96))
+
+
+def nest_files(paths, output, sheet=A0, gap=5.0, orientations=((0, False), (90, False)), time_budget=1.0):
+    """
+        Nest the templates of several svg files into a single output file ('-' for stdout).
+        - sheet and gap are in mm, the document units are read from the first file
+        - return the number of sheets
+    """
+    for prefix, uri in NSS.items():
+        Etree.register_namespace('' if prefix == 'svg' else prefix, uri)
+    document = Etree.parse(paths[0])
+    root = document.getroot()
+    for path in paths[1:]:
+        # The shared definitions (styles, symbols) are only kept once
+        known = set(element.get('id') for element in root.iter() if element.get('id'))
+        for element in list(Etree.parse(path).getroot()):
+            if _local_name(element.tag) == 'defs':
+                element[:] = [definition for definition in element if definition.get('id') not in known]
+            root.append(element)
+
+    scale = document_scale(root)
+    sheets = len(nest(root, sheet[0] * scale, sheet[1] * scale, orientations, gap * scale, time_budget))
+
+    if output == '-':
+        document.write(sys.stdout.buffer if hasattr(sys.stdout, 'buffer') else sys.stdout, encoding='UTF-8')
+    else:
+        document.write(output, encoding='UTF-8', xml_declaration=True)
+    return sheets
+
+
+# ---------------------------------------------------------------- #
+#                             MAIN
+# ---------------------------------------------------------------- #
+def main(argv=None):
+    parser = optparse.OptionParser(usage="usage: %prog [options] template.svg [template.svg ...]")
+    parser.add_option("-o", "--output", type="string", dest="output", default='-',
+                      help="Output svg file")
+    parser.add_option("--sheet", type="string", dest="sheet", default='%gx%g' % A0,
+                      help="Sheet size in mm, WIDTHxHEIGHT (default: A0 landscape)")
+    parser.add_option("--gap", type="float", dest="gap", default=5,
+                      help="Space between the pieces in mm")
+    parser.add_option("--rotations", type="string", dest="rotations", default='0,90,180,270',
+                      help="Allowed rotations in degrees")
+    parser.add_option("--mirror", action="store_true", dest="mirror", default=False,
+                      help="Allow mirrored pieces")
+    parser.add_option("--time", type="float", dest="time", default=1.0,
+                      help="Time budget of the packer in seconds")
+    options, args = parser.parse_args(argv)
+    if not args:
+        parser.error("at least one template svg file is expected")
+
+    sheet = [float(v) for v in options.sheet.lower().split('x')]
+    sheets = nest_files(args, options.output, sheet, options.gap,
+                        parse_orientations(options.rotations, options.mirror), options.time)
+    sys.stderr.write('%d sheets\n' % sheets)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
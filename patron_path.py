@@ -0,0 +1,767 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Path utilities of the Patron extension, without any Inkscape dependency.
+
+ - parse_path: SVG path data to a list of [command, params] pairs
+ - path_segments: absolute line and cubic curve segments of a path, arcs included
+ - flatten_path: approximate a path by polylines, within a given tolerance
+ - points_to_bbox: bounding box of a list of points
+ - path_bbox: exact bounding box of a path, curves included
+ - parse_transform / compose_transform / invert_transform / apply_transform: SVG transforms as (a, b, c, d, e, f) matrices
+ - offset_path: static outline of a path at a given distance (the seam allowance),
+   replacing the live 'inkscape:offset' paths that Inkscape recomputes on every redraw
+-----------------------------------------------
+"""
+
+import math
+import re
+
+__version__ = '1'
+
+TRANSFORM_TOKEN = re.compile(r'(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)')
+NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+PATH_TOKEN = re.compile(r'([MmLlHhVvCcSsQqTtAaZz])|([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)')
+
+# Number of parameters consumed by each repetition of a command
+PARAMS_COUNT = {'M': 2, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'S': 4, 'Q': 4, 'T': 2, 'A': 7, 'Z': 0}
+
+# Default number of decimals of the written path data
+PRECISION = 3
+
+# Maximum subdivision depth when flattening a curve
+MAX_DEPTH = 16
+
+# Offset paths already computed in this process, keyed by (path data, radius, tolerance)
+OFFSET_CACHE_SIZE = 256
+_offset_cache = {}
+
+
+# ---------------------------------------------------------------- #
+#                           PARSING
+# ---------------------------------------------------------------- #
+def parse_path(d):
+    """
+        Parse SVG path data into a list of [command, params] pairs,
+        the inverse of patron.formatPath
+    """
+    path = []
+    for command, number in PATH_TOKEN.findall(d):
+        if command:
+            path.append([command, []])
+        elif path:
+            path[-1][1].append(float(number))
+    return path
+
+
+def points_to_bbox(p):
+    """
+        from a list of points (x,y pairs)
+        - return the lower-left xy and upper-right xy
+    """
+    llx = urx = p[0][0]
+    lly = ury = p[0][1]
+    for x in p[1:]:
+        if x[0] < llx:
+            llx = x[0]
+        elif x[0] > urx:
+            urx = x[0]
+        if x[1] < lly:
+            lly = x[1]
+        elif x[1] > ury:
+            ury = x[1]
+    return llx, lly, urx, ury
+
+
+def points_to_bbox_center(p):
+    """
+        from a list of points (x,y pairs)
+        - find midpoint of bounding box around all points
+        - return (x,y)
+    """
+    bbox = points_to_bbox(p)
+    return (bbox[0] + bbox[2]) / 2.0, (bbox[1] + bbox[3]) / 2.0
+
+
+# ---------------------------------------------------------------- #
+#                          TRANSFORMS
+# ---------------------------------------------------------------- #
+def compose_transform(m1, m2):
+    """ Matrix product m1 * m2, m2 being applied first """
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+    return (a1 * a2 + c1 * b2, b1 * a2 + d1 * b2,
+            a1 * c2 + c1 * d2, b1 * c2 + d1 * d2,
+            a1 * e2 + c1 * f2 + e1, b1 * e2 + d1 * f2 + f1)
+
+
+def parse_transform(text):
+    """ Parse an SVG transform attribute into an (a, b, c, d, e, f) matrix """
+    matrix = IDENTITY
+    for name, args in TRANSFORM_TOKEN.findall(text or ''):
+        values = [float(v) for v in NUMBER.findall(args)]
+        if name == 'matrix':
+            current = tuple(values[:6])
+        elif name == 'translate':
+            current = (1.0, 0.0, 0.0, 1.0, values[0], values[1] if len(values) > 1 else 0.0)
+        elif name == 'scale':
+            current = (values[0], 0.0, 0.0, values[1] if len(values) > 1 else values[0], 0.0, 0.0)
+        elif name == 'rotate':
+            angle = math.radians(values[0])
+            cos, sin = math.cos(angle), math.sin(angle)
+            current = (cos, sin, -sin, cos, 0.0, 0.0)
+            if len(values) == 3:
+                cx, cy = values[1], values[2]
+                current = compose_transform((1.0, 0.0, 0.0, 1.0, cx, cy),
+                                            compose_transform(current, (1.0, 0.0, 0.0, 1.0, -cx, -cy)))
+        elif name == 'skewX':
+            current = (1.0, 0.0, math.tan(math.radians(values[0])), 1.0, 0.0, 0.0)
+        else:
+            current = (1.0, math.tan(math.radians(values[0])), 0.0, 1.0, 0.0, 0.0)
+        matrix = compose_transform(matrix, current)
+    return matrix
+
+
+def format_transform(matrix):
+    """ SVG transform attribute of a matrix, empty for the identity """
+    if matrix == IDENTITY:
+        return ''
+    return 'matrix(%s)' % ','.join('%.10g' % value for value in matrix)
+
+
+def invert_transform(matrix):
+    """ Inverse of an (a, b, c, d, e, f) matrix """
+    a, b, c, d, e, f = matrix
+    det = a * d - b * c
+    return (d / det, -b / det, -c / det, a / det, (c * f - d * e) / det, (b * e - a * f) / det)
+
+
+def apply_transform(matrix, points):
+    """ Transform a list of points """
+    a, b, c, d, e, f = matrix
+    return [(a * x + c * y + e, b * x + d * y + f) for x, y in points]
+
+
+# ---------------------------------------------------------------- #
+#                          FLATTENING
+# ---------------------------------------------------------------- #
+def _flatten_cubic(p0, p1, p2, p3, tolerance, points):
+    """
+        Append to points the polyline approximating a cubic bezier curve, p0 excluded.
+        The curve is subdivided until its control points are within tolerance of the chord.
+    """
+    stack = [(p0, p1, p2, p3, 0)]
+    while stack:
+        p0, p1, p2, p3, depth = stack.pop()
+        dx, dy = p3[0] - p0[0], p3[1] - p0[1]
+        chord = dx * dx + dy * dy
+        if chord > 0:
+            d1 = abs((p1[0] - p3[0]) * dy - (p1[1] - p3[1]) * dx)
+            d2 = abs((p2[0] - p3[0]) * dy - (p2[1] - p3[1]) * dx)
+            flat = (d1 + d2) * (d1 + d2) <= tolerance * tolerance * chord
+        else:
+            flat = max(abs(p1[0] - p0[0]) + abs(p1[1] - p0[1]),
+                       abs(p2[0] - p0[0]) + abs(p2[1] - p0[1])) <= tolerance
+        if flat or depth >= MAX_DEPTH:
+            points.append(p3)
+            continue
+
+        # de Casteljau subdivision at t = 0.5, the first half is processed first
+        p01 = ((p0[0] + p1[0]) / 2, (p0[1] + p1[1]) / 2)
+        p12 = ((p1[0] + p2[0]) / 2, (p1[1] + p2[1]) / 2)
+        p23 = ((p2[0] + p3[0]) / 2, (p2[1] + p3[1]) / 2)
+        p012 = ((p01[0] + p12[0]) / 2, (p01[1] + p12[1]) / 2)
+        p123 = ((p12[0] + p23[0]) / 2, (p12[1] + p23[1]) / 2)
+        middle = ((p012[0] + p123[0]) / 2, (p012[1] + p123[1]) / 2)
+        stack.append((middle, p123, p23, p3, depth + 1))
+        stack.append((p0, p01, p012, middle, depth + 1))
+
+
+def arc_segments(start, rx, ry, angle, large, sweep, end):
+    """
+        Cubic curves approximating an elliptical arc, given like the SVG 'A' command.
+        - return a list of ('C', [control1, control2, end]) segments, a single
+          ('L', [end]) segment for a null radius, none for a null arc
+    """
+    if start == end:
+        return []
+    rx, ry = abs(rx), abs(ry)
+    if not rx or not ry:
+        return [('L', [end])]
+    phi = math.radians(angle)
+    cos, sin = math.cos(phi), math.sin(phi)
+
+    # Center of the ellipse (SVG implementation notes, F.6.5), the radii scaled up if too small
+    dx, dy = (start[0] - end[0]) / 2, (start[1] - end[1]) / 2
+    x1, y1 = cos * dx + sin * dy, -sin * dx + cos * dy
+    scale = x1 * x1 / (rx * rx) + y1 * y1 / (ry * ry)
+    if scale > 1:
+        rx, ry = rx * math.sqrt(scale), ry * math.sqrt(scale)
+    numerator = rx * rx * ry * ry - rx * rx * y1 * y1 - ry * ry * x1 * x1
+    factor = math.sqrt(max(numerator, 0) / (rx * rx * y1 * y1 + ry * ry * x1 * x1))
+    if bool(large) == bool(sweep):
+        factor = -factor
+    cx1, cy1 = factor * rx * y1 / ry, -factor * ry * x1 / rx
+    cx = cos * cx1 - sin * cy1 + (start[0] + end[0]) / 2
+    cy = sin * cx1 + cos * cy1 + (start[1] + end[1]) / 2
+
+    # Start angle and sweep of the arc on the unit circle
+    theta = math.atan2((y1 - cy1) / ry, (x1 - cx1) / rx)
+    delta = math.atan2((-y1 - cy1) / ry, (-x1 - cx1) / rx) - theta
+    if sweep and delta < 0:
+        delta += 2 * math.pi
+    elif not sweep and delta > 0:
+        delta -= 2 * math.pi
+
+    # One cubic curve per quarter of ellipse at most
+    count = max(int(math.ceil(abs(delta) / (math.pi / 2) - 1e-9)), 1)
+    step = delta / count
+    k = 4.0 / 3 * math.tan(step / 4)
+
+    def point(t, a, b):
+        x, y = rx * a, ry * b
+        return cx + cos * x - sin * y, cy + sin * x + cos * y
+
+    segments = []
+    for index in range(count):
+        t0, t1 = theta + index * step, theta + (index + 1) * step
+        c0, s0, c1, s1 = math.cos(t0), math.sin(t0), math.cos(t1), math.sin(t1)
+        segments.append(('C', [point(t0, c0 - k * s0, s0 + k * c0), point(t1, c1 + k * s1, s1 - k * c1),
+                               end if index == count - 1 else point(t1, c1, s1)]))
+    return segments
+
+
+def path_segments(path):
+    """
+        Convert a path to absolute line and cubic curve segments.
+        - path: SVG path data or a list of [command, params] pairs
+        - return a list of (start, segments, closed) subpaths, segments being
+          ('L', [end]) or ('C', [control1, control2, end]) tuples
+    """
+    if not isinstance(path, list):
+        path = parse_path(path)
+
+    subpaths = []
+    segments = None
+    current = start = (0.0, 0.0)
+    # Second control point of the last cubic curve, control point of the last quadratic one
+    last_control = last_quadratic = None
+    for command, params in path:
+        cmd = command.upper()
+        relative = command != cmd
+        if cmd == 'Z':
+            if segments is not None:
+                subpaths.append((start, segments, True))
+                segments = None
+            current = start
+            last_control = last_quadratic = None
+            continue
+
+        count = PARAMS_COUNT.get(cmd)
+        if count is None:
+            raise ValueError("Unsupported path command '%s'" % command)
+        for i in range(0, len(params), count):
+            values = params[i:i + count]
+            if len(values) < count:
+                raise ValueError("Missing parameters of the path command '%s'" % command)
+            ox, oy = current if relative else (0.0, 0.0)
+            if cmd == 'M' and i == 0:
+                if segments:
+                    subpaths.append((start, segments, False))
+                current = start = (ox + values[0], oy + values[1])
+                segments = []
+                last_control = last_quadratic = None
+                continue
+            if segments is None:
+                start = current
+                segments = []
+
+            control = quadratic = None
+            if cmd in ('M', 'L'):
+                current = (ox + values[0], oy + values[1])
+                segments.append(('L', [current]))
+            elif cmd == 'H':
+                current = (ox + values[0], current[1])
+                segments.append(('L', [current]))
+            elif cmd == 'V':
+                current = (current[0], oy + values[0])
+                segments.append(('L', [current]))
+            elif cmd == 'A':
+                end = (ox + values[5], oy + values[6])
+                segments.extend(arc_segments(current, values[0], values[1], values[2], values[3], values[4], end))
+                current = end
+            else:
+                if cmd == 'C':
+                    p1 = (ox + values[0], oy + values[1])
+                    p2 = (ox + values[2], oy + values[3])
+                    end = (ox + values[4], oy + values[5])
+                elif cmd == 'S':
+                    p1 = (2 * current[0] - last_control[0], 2 * current[1] - last_control[1]) \
+                        if last_control else current
+                    p2 = (ox + values[0], oy + values[1])
+                    end = (ox + values[2], oy + values[3])
+                else:
+                    # quadratic curve, elevated to a cubic one
+                    if cmd == 'Q':
+                        q = (ox + values[0], oy + values[1])
+                        end = (ox + values[2], oy + values[3])
+                    else:
+                        q = (2 * current[0] - last_quadratic[0], 2 * current[1] - last_quadratic[1]) \
+                            if last_quadratic else current
+                        end = (ox + values[0], oy + values[1])
+                    p1 = (current[0] + 2.0 / 3 * (q[0] - current[0]), current[1] + 2.0 / 3 * (q[1] - current[1]))
+                    p2 = (end[0] + 2.0 / 3 * (q[0] - end[0]), end[1] + 2.0 / 3 * (q[1] - end[1]))
+                    quadratic = q
+                segments.append(('C', [p1, p2, end]))
+                if cmd in ('C', 'S'):
+                    control = p2
+                current = end
+            last_control, last_quadratic = control, quadratic
+
+    if segments:
+        subpaths.append((start, segments, False))
+    return subpaths
+
+
+def flatten_path(path, tolerance=0.1):
+    """
+        Approximate a path by polylines.
+        - path: SVG path data or a list of [command, params] pairs
+        - return a list of (points, closed) subpaths in absolute coordinates
+    """
+    return [(flatten_segments(start, segments, tolerance), closed)
+            for start, segments, closed in path_segments(path)]
+
+
+def flatten_segments(start, segments, tolerance=0.1):
+    """ Polyline approximating a subpath given as absolute segments """
+    points = [start]
+    for cmd, segment in segments:
+        if cmd == 'L':
+            points.append(segment[0])
+        else:
+            _flatten_cubic(points[-1], segment[0], segment[1], segment[2], tolerance, points)
+    return points
+
+
+def reverse_segments(start, segments):
+    """ Reverse the direction of a subpath, return the new (start, segments) """
+    anchors = [start] + [segment[-1] for cmd, segment in segments]
+    reversed_segments = []
+    for index in range(len(segments) - 1, -1, -1):
+        cmd, segment = segments[index]
+        end = anchors[index]
+        reversed_segments.append((cmd, [end] if cmd == 'L' else [segment[1], segment[0], end]))
+    return anchors[-1], reversed_segments
+
+
+# ---------------------------------------------------------------- #
+#                        BOUNDING BOXES
+# ---------------------------------------------------------------- #
+def _cubic_extrema(a, b, c, d):
+    """
+        Parameters in ]0, 1[ where a coordinate of a cubic bezier curve has a local extremum,
+        the roots of the derivative 3 * (qa * t^2 + 2 * qb * t + qc).
+    """
+    qa = d - a + 3 * (b - c)
+    qb = a - 2 * b + c
+    qc = b - a
+    if abs(qa) < 1e-12:
+        roots = [-qc / (2 * qb)] if abs(qb) > 1e-12 else []
+    else:
+        delta = qb * qb - qa * qc
+        if delta < 0:
+            return []
+        root = math.sqrt(delta)
+        roots = [(-qb + root) / qa, (-qb - root) / qa]
+    return [t for t in roots if 0 < t < 1]
+
+
+def _cubic_point(p0, p1, p2, p3, t):
+    u = 1 - t
+    return (u * u * u * p0[0] + 3 * u * u * t * p1[0] + 3 * u * t * t * p2[0] + t * t * t * p3[0],
+            u * u * u * p0[1] + 3 * u * u * t * p1[1] + 3 * u * t * t * p2[1] + t * t * t * p3[1])
+
+
+def path_bbox(path, matrix=IDENTITY):
+    """
+        Exact bounding box of a path, the extrema of its curves included, unlike
+        points_to_bbox of its points or of its flattened polyline.
+        - path: SVG path data or a list of [command, params] pairs
+        - matrix: transform of the path, the box being the one of the transformed curves
+        - return (x0, y0, x1, y1), or None for an empty path
+    """
+    points = []
+    for start, segments, closed in path_segments(path):
+        current = apply_transform(matrix, [start])[0]
+        points.append(current)
+        for cmd, segment in segments:
+            segment = apply_transform(matrix, segment)
+            if cmd == 'C':
+                p1, p2, end = segment
+                for axis in (0, 1):
+                    for t in _cubic_extrema(current[axis], p1[axis], p2[axis], end[axis]):
+                        points.append(_cubic_point(current, p1, p2, end, t))
+            current = segment[-1]
+            points.append(current)
+    return points_to_bbox(points) if points else None
+
+
+# ---------------------------------------------------------------- #
+#                            OFFSET
+# ---------------------------------------------------------------- #
+def polygon_area(points):
+    """ Signed area of a polygon (positive when counterclockwise in a y-up frame) """
+    area = 0.0
+    x0, y0 = points[-1]
+    for x1, y1 in points:
+        area += x0 * y1 - x1 * y0
+        x0, y0 = x1, y1
+    return area / 2
+
+
+def _clean_polygon(points, epsilon=1e-9):
+    """ Remove duplicated consecutive points, including the closing one """
+    cleaned = []
+    for point in points:
+        if not cleaned or abs(point[0] - cleaned[-1][0]) > epsilon or abs(point[1] - cleaned[-1][1]) > epsilon:
+            cleaned.append(point)
+    while len(cleaned) > 1 and abs(cleaned[0][0] - cleaned[-1][0]) <= epsilon \
+            and abs(cleaned[0][1] - cleaned[-1][1]) <= epsilon:
+        cleaned.pop()
+    return cleaned
+
+
+def _segment_intersection(a, b, c, d):
+    """ Intersection point of the segments [a, b] and [c, d], None if they do not cross """
+    rx, ry = b[0] - a[0], b[1] - a[1]
+    sx, sy = d[0] - c[0], d[1] - c[1]
+    denominator = rx * sy - ry * sx
+    if denominator == 0:
+        return None
+    qx, qy = c[0] - a[0], c[1] - a[1]
+    t = (qx * sy - qy * sx) / denominator
+    u = (qx * ry - qy * rx) / denominator
+    if 0 < t < 1 and 0 < u < 1:
+        return a[0] + t * rx, a[1] + t * ry
+    return None
+
+
+def _remove_loops(points):
+    """
+        Remove the self intersecting loops of a closed raw offset polyline.
+        For every segment, the farthest following segment crossing it is searched
+        and the loop between them is replaced by the intersection point.
+        Segments are first filtered on their bounding boxes.
+    """
+    count = len(points)
+    boxes = []
+    for i in range(count):
+        a, b = points[i], points[(i + 1) % count]
+        boxes.append((min(a[0], b[0]), min(a[1], b[1]), max(a[0], b[0]), max(a[1], b[1])))
+
+    result = []
+    i = 0
+    while i < count:
+        a, b = points[i], points[(i + 1) % count]
+        result.append(a)
+        box = boxes[i]
+        # do not search the segments adjacent to this one, nor wrap around the start
+        last = count - 1 if i > 0 else count - 2
+        for j in range(last, i + 1, -1):
+            other = boxes[j]
+            if other[0] > box[2] or other[2] < box[0] or other[1] > box[3] or other[3] < box[1]:
+                continue
+            crossing = _segment_intersection(a, b, points[j], points[(j + 1) % count])
+            if crossing is not None:
+                result.append(crossing)
+                i = j
+                break
+        i += 1
+    return result
+
+
+def offset_polygon(points, radius, tolerance=0.1):
+    """
+        Outline of a closed polygon at distance radius, outside of it when radius is positive.
+        - convex corners are rounded, as the Inkscape offset does
+        - concave corners are mitered and the resulting loops removed
+    """
+    points = _clean_polygon(points)
+    if len(points) < 3 or radius == 0:
+        return list(points)
+
+    # Start on the leftmost point, which is convex, so that no loop spans the start
+    start = min(range(len(points)), key=lambda k: points[k])
+    points = points[start:] + points[:start]
+
+    # Normal of every edge, pointing outside for a positive radius
+    orientation = 1.0 if polygon_area(points) > 0 else -1.0
+    count = len(points)
+    normals = []
+    for i in range(count):
+        dx = points[(i + 1) % count][0] - points[i][0]
+        dy = points[(i + 1) % count][1] - points[i][1]
+        length = math.hypot(dx, dy)
+        normals.append((orientation * dy / length, -orientation * dx / length))
+
+    step = 2 * math.acos(max(-1.0, 1 - tolerance / abs(radius))) if tolerance < abs(radius) else math.pi / 2
+    raw = []
+    for i in range(count):
+        px, py = points[i]
+        n1, n2 = normals[i - 1], normals[i]
+        cross = n1[0] * n2[1] - n1[1] * n2[0]
+        dot = n1[0] * n2[0] + n1[1] * n2[1]
+        if cross * orientation * radius >= 0 or dot > 1 - 1e-12:
+            # convex corner (seen from the offset side): round join
+            angle = math.atan2(cross, dot)
+            steps = max(1, int(math.ceil(abs(angle) / step)))
+            base = math.atan2(n1[1], n1[0])
+            for k in range(steps + 1):
+                theta = base + angle * k / steps
+                raw.append((px + radius * math.cos(theta), py + radius * math.sin(theta)))
+        elif dot > -0.9:
+            # concave corner: miter on the bisector
+            scale = radius / (1 + dot)
+            raw.append((px + (n1[0] + n2[0]) * scale, py + (n1[1] + n2[1]) * scale))
+        else:
+            # spike: both offset edges are kept, their loop is removed afterwards
+            raw.append((px + radius * n1[0], py + radius * n1[1]))
+            raw.append((px + radius * n2[0], py + radius * n2[1]))
+
+    return _remove_loops(_clean_polygon(raw))
+
+
+def offset_path(path, radius, tolerance=0.1):
+    """
+        Static outline of a closed path at distance radius.
+        - path: SVG path data or a list of [command, params] pairs
+        - return the SVG path data of the outline of every closed subpath
+        Results are cached by (path, radius, tolerance), standard sizes are computed once.
+    """
+    if isinstance(path, list):
+        key = tuple((cmd, tuple(params)) for cmd, params in path)
+    else:
+        key = path
+    key = (key, radius, tolerance)
+    data = _offset_cache.get(key)
+    if data is None:
+        outlines = [offset_polygon(points, radius, tolerance)
+                    for points, closed in flatten_path(path, tolerance) if closed]
+        data = ' '.join(format_points(points) for points in outlines if points)
+        if len(_offset_cache) >= OFFSET_CACHE_SIZE:
+            _offset_cache.clear()
+        _offset_cache[key] = data
+    return data
+
+
+# ---------------------------------------------------------------- #
+#                            WRITING
+# ---------------------------------------------------------------- #
+# Next command of the repetitions of a move
+IMPLICIT_COMMAND = {'M': 'L', 'm': 'l'}
+# Absolute command, number of params and relative flag of each command letter
+COMMANDS = dict((letter, (letter.upper(), PARAMS_COUNT[letter.upper()], letter.islower()))
+                for letter in 'MmLlHhVvCcSsQqTtAaZz')
+# Placeholders of the numbers of a command, after its letter or after the numbers of the previous command
+JOINED = [' '.join(['%s'] * count) for count in range(8)]
+SEPARATED = [' %s' * count for count in range(8)]
+SINGLE = (0,)
+
+# Largest precision written with a table of the fractional parts (10^precision texts)
+TABLE_PRECISION = 4
+
+# round() gives a float in python 2
+_round = round if isinstance(round(0.5), int) else lambda value: int(round(value))
+
+# Scale and texts of the fractional parts by precision, '.25' for 250 at precision 3 and '' for 0
+_fractions = {}
+
+
+def _fraction_table(precision):
+    scale = 10 ** precision
+    table = _fractions[precision] = scale, [''] + [('.%0*d' % (precision, r)).rstrip('0') for r in range(1, scale)]
+    return table
+
+
+def _number_text(value, scale, precision):
+    text = ('%d.%0*d' % (abs(value) // scale, precision, abs(value) % scale)).rstrip('0').rstrip('.')
+    if text.startswith('0.'):
+        text = text[1:]
+    return '-' + text if value < 0 else text
+
+
+def number_texts(values, precision=PRECISION):
+    """
+        Shortest texts of numbers given as integers in units of 10^-precision:
+        no trailing zeros, and no zero before the decimal point ('12', '-.5', '3.25').
+    """
+    if precision > TABLE_PRECISION:
+        scale = 10 ** precision
+        return [_number_text(v, scale, precision) for v in values]
+    scale, fractions = _fractions.get(precision) or _fraction_table(precision)
+    return [str(v // scale) + fractions[v % scale] if v >= scale else fractions[v] or '0' if v >= 0 else
+            '-' + fractions[-v] if v > -scale else '-' + str(-v // scale) + fractions[-v % scale] for v in values]
+
+
+def build_path(path, precision=PRECISION):
+    """
+        Compact SVG path data of a list of [command, params] pairs.
+        - every coordinate is rounded to a fixed number of decimals
+        - each command is written in its absolute or relative form, whichever has
+          the smaller numbers (so the fewer digits), lines parallel to an axis
+          becoming H / V commands
+        - repeated command letters, useless separators and zeros are dropped
+        The coordinates are handled as integers in units of 10^-precision, so that
+        relative commands never accumulate rounding errors, and are written from
+        these integers once the whole path is known.
+    """
+    scale = 10 ** precision
+    rnd = _round
+    formats = []
+    values = []
+    implicit = None
+    cx = cy = sx = sy = 0.0     # current point and subpath start, in user units
+    ex = ey = esx = esy = 0     # the same as written, in units of 10^-precision
+    for command, params in path:
+        try:
+            cmd, count, relative = COMMANDS[command]
+        except KeyError:
+            raise ValueError("Unsupported path command '%s'" % command)
+        if cmd == 'Z':
+            formats.append('z')
+            implicit = None
+            cx, cy, ex, ey = sx, sy, esx, esy
+            continue
+        for i in (SINGLE if len(params) == count else range(0, len(params), count)):
+            if relative:
+                ox, oy = cx, cy
+            else:
+                ox = oy = 0.0
+            if cmd == 'H':
+                x, y = ox + params[i], cy
+            elif cmd == 'V':
+                x, y = cx, oy + params[i]
+            else:
+                x, y = ox + params[i + count - 2], oy + params[i + count - 1]
+            ax, ay = rnd(x * scale), rnd(y * scale)
+            rx, ry = ax - ex, ay - ey
+            shorter = abs(rx) + abs(ry) <= abs(ax) + abs(ay)
+
+            if cmd == 'C':
+                x1, y1 = rnd((ox + params[i]) * scale), rnd((oy + params[i + 1]) * scale)
+                x2, y2 = rnd((ox + params[i + 2]) * scale), rnd((oy + params[i + 3]) * scale)
+                if shorter:
+                    letter, numbers = 'c', (x1 - ex, y1 - ey, x2 - ex, y2 - ey, rx, ry)
+                else:
+                    letter, numbers = 'C', (x1, y1, x2, y2, ax, ay)
+            elif cmd == 'S' or cmd == 'Q':
+                x1, y1 = rnd((ox + params[i]) * scale), rnd((oy + params[i + 1]) * scale)
+                if shorter:
+                    letter, numbers = cmd.lower(), (x1 - ex, y1 - ey, rx, ry)
+                else:
+                    letter, numbers = cmd, (x1, y1, ax, ay)
+            elif cmd == 'A':
+                head = (rnd(params[i] * scale), rnd(params[i + 1] * scale), rnd(params[i + 2] * scale),
+                        int(params[i + 3]) * scale, int(params[i + 4]) * scale)
+                letter, numbers = ('a', head + (rx, ry)) if shorter else ('A', head + (ax, ay))
+            elif cmd == 'T' or (cmd == 'M' and i == 0):
+                letter, numbers = (cmd.lower(), (rx, ry)) if shorter else (cmd, (ax, ay))
+                if cmd == 'M':
+                    sx, sy, esx, esy = x, y, ax, ay
+            # lines, the repetitions of a move included
+            elif ry == 0:
+                letter, numbers = ('h', (rx,)) if abs(rx) <= abs(ax) else ('H', (ax,))
+            elif rx == 0:
+                letter, numbers = ('v', (ry,)) if abs(ry) <= abs(ay) else ('V', (ay,))
+            else:
+                letter, numbers = ('l', (rx, ry)) if shorter else ('L', (ax, ay))
+
+            if letter == implicit:
+                formats.append(SEPARATED[len(numbers)])
+            else:
+                formats.append(letter + JOINED[len(numbers)])
+                implicit = IMPLICIT_COMMAND.get(letter, letter)
+            values += numbers
+            cx, cy, ex, ey = x, y, ax, ay
+    return (''.join(formats) % tuple(number_texts(values, precision))).replace(' -', '-')
+
+
+class PathBuilder(object):
+    """
+        Incremental writer of compact SVG path data, see build_path.
+    """
+
+    def __init__(self, precision=PRECISION):
+        self.precision = precision
+        self.path = []
+
+    def add(self, command, params=()):
+        """ Append a path command, with its params in user units (relative or absolute) """
+        if command not in COMMANDS:
+            raise ValueError("Unsupported path command '%s'" % command)
+        self.path.append((command, params))
+        return self
+
+    def extend(self, path):
+        """ Append a list of [command, params] pairs """
+        for command, params in path:
+            self.add(command, params)
+        return self
+
+    def getvalue(self):
+        return build_path(self.path, self.precision)
+
+
+def format_number(value, precision=PRECISION):
+    """ Shortest text of a number rounded to a fixed precision """
+    return number_texts([_round(value * 10 ** precision)], precision)[0]
+
+
+def format_points(points, closed=True, precision=PRECISION, relative=False):
+    """
+        Compact SVG path data of a polyline, written as a move and relative lines.
+        - relative: the points are moves from the previous point (the first one from the origin)
+    """
+    scale = 10 ** precision
+    rnd = _round
+    values = []
+    append = values.append
+    ex = ey = 0
+    if relative:
+        x = y = 0.0
+        for dx, dy in points:
+            x += dx
+            y += dy
+            ax = rnd(x * scale)
+            ay = rnd(y * scale)
+            append(ax - ex)
+            append(ay - ey)
+            ex = ax
+            ey = ay
+    else:
+        for x, y in points:
+            ax = rnd(x * scale)
+            ay = rnd(y * scale)
+            append(ax - ex)
+            append(ay - ey)
+            ex = ax
+            ey = ay
+    if not values:
+        return ''
+    data = 'm' + ' '.join(number_texts(values, precision)).replace(' -', '-')
+    return data + 'z' if closed else data
+
+
+def format_segments(start, segments, closed=False, precision=PRECISION):
+    """ Compact SVG path data of a subpath given as absolute segments """
+    path = [('M', start)]
+    path.extend((cmd, [value for point in segment for value in point]) for cmd, segment in segments)
+    if closed:
+        path.append(('Z', ()))
+    return build_path(path, precision)
@@ -0,0 +1,314 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Direct HPGL / G-code output of the templates, without Inkscape in the loop.
+
+The paths of a rendered svg document, or of a saved template of 'patron.xml',
+are flattened to polylines within a tolerance, the runs of nearly collinear
+segments are simplified (Ramer-Douglas-Peucker, same tolerance) and the plotter
+commands are streamed to a file or to stdout as soon as each path is ready.
+
+Coordinates are written in millimeters (HPGL: plotter units of 0.025mm) with
+the y axis pointing up and the origin at the bottom left of the drawing.
+
+usage:
+    python patron_plot.py patron.svg -f hpgl -o patron.plt --tolerance 0.1
+    python patron_plot.py fem_38 -f gcode --optimize > fem_38.gcode
+    python patron_plot.py sheets.svg --sheet 2 -o sheet_2.plt
+-----------------------------------------------
+"""
+
+import math
+import optparse
+import os
+import sys
+import time
+import xml.etree.ElementTree as Etree
+
+import patron_nesting
+import patron_path
+import patron_toolpath
+
+__version__ = '1'
+
+TEMPLATES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'patron.xml')
+
+# Scale of the saved templates path data (96dpi pixels)
+STORE_MM_PER_UNIT = 25.4 / 96
+
+
+# ---------------------------------------------------------------- #
+#                       UTILITY FUNCTIONS
+# ---------------------------------------------------------------- #
+def simplify(points, tolerance):
+    """
+        Remove the points closer than tolerance to the line joining their neighbours
+        (Ramer-Douglas-Peucker), the first and last points are always kept.
+    """
+    if len(points) < 3:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x0, y0), (x1, y1) = points[first], points[last]
+        dx, dy = x1 - x0, y1 - y0
+        length = math.hypot(dx, dy)
+        farthest, distance = None, tolerance
+        for k in range(first + 1, last):
+            x, y = points[k]
+            if length > 0:
+                d = abs((x - x0) * dy - (y - y0) * dx) / length
+            else:
+                d = math.hypot(x - x0, y - y0)
+            if d > distance:
+                farthest, distance = k, d
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+# ---------------------------------------------------------------- #
+#                           WRITERS
+# ---------------------------------------------------------------- #
+class PlotWriter(object):
+    """
+        Base plotter output, fed with polylines in millimeters.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.position = None
+        self.commands = 0
+        self.polylines = 0
+
+    def write(self, line):
+        self.stream.write(line + '\n')
+        self.commands += 1
+
+    def polyline(self, points):
+        if len(points) < 2:
+            return
+        self.polylines += 1
+        self.draw(points)
+        self.position = points[-1]
+
+    def header(self):
+        pass
+
+    def footer(self):
+        pass
+
+    def draw(self, points):
+        raise NotImplementedError
+
+
+class HPGLWriter(PlotWriter):
+    """ HPGL output, in plotter units of 0.025mm """
+    UNITS_PER_MM = 40
+
+    def _units(self, point):
+        return '%d,%d' % (int(round(point[0] * self.UNITS_PER_MM)), int(round(point[1] * self.UNITS_PER_MM)))
+
+    def header(self):
+        self.write('IN;SP1;')
+
+    def draw(self, points):
+        if self.position is None or self._units(self.position) != self._units(points[0]):
+            self.write('PU%s;' % self._units(points[0]))
+        self.write('PD%s;' % ','.join(self._units(point) for point in points[1:]))
+
+    def footer(self):
+        self.write('PU;SP0;IN;')
+
+
+class GCodeWriter(PlotWriter):
+    """ G-code output, in millimeters with absolute positioning """
+
+    def __init__(self, stream, feed=1500, pen_up='G0 Z5', pen_down='G1 Z0'):
+        PlotWriter.__init__(self, stream)
+        self.feed = feed
+        self.pen_up = pen_up
+        self.pen_down = pen_down
+
+    @staticmethod
+    def _coords(point):
+        return 'X%s Y%s' % (patron_path.format_number(point[0]), patron_path.format_number(point[1]))
+
+    def header(self):
+        self.write('G21')
+        self.write('G90')
+        self.write(self.pen_up)
+
+    def draw(self, points):
+        if self.position is None or self._coords(self.position) != self._coords(points[0]):
+            if self.position is not None:
+                self.write(self.pen_up)
+            self.write('G0 %s' % self._coords(points[0]))
+            self.write(self.pen_down)
+        self.write('G1 %s F%d' % (self._coords(points[1]), self.feed))
+        for point in points[2:]:
+            self.write('G1 %s' % self._coords(point))
+
+    def footer(self):
+        self.write(self.pen_up)
+        self.write('G0 X0 Y0')
+        self.write('M2')
+
+
+WRITERS = {'hpgl': HPGLWriter, 'gcode': GCodeWriter}
+
+
+# ---------------------------------------------------------------- #
+#                           SOURCES
+# ---------------------------------------------------------------- #
+def svg_toolpaths(path, sheet=None):
+    """
+        Toolpaths of the visible elements of an svg document, in the cut order
+        recorded by patron_toolpath if any.
+        - sheet: number of the nesting sheet layer to plot (see patron_nesting), the whole document if None
+        - return (toolpaths, millimeters per user unit)
+        - raise ValueError for a missing sheet, or when the document has hidden sheets and no sheet is given
+    """
+    root = Etree.parse(path).getroot()
+    sheets = [element for element in root.iter() if patron_nesting.is_sheet(element)]
+    if sheet is not None:
+        label = patron_nesting.SHEET_LABEL % sheet
+        chosen = [element for element in sheets if element.get(patron_nesting.LABEL) == label]
+        if not chosen:
+            raise ValueError("%s has no nesting sheet %d" % (path, sheet))
+        group = chosen[0]
+    else:
+        hidden = [element.get(patron_nesting.LABEL) for element in sheets if patron_toolpath._hidden(element)]
+        if hidden:
+            raise ValueError("%s: the nesting sheets %s are hidden, plot one sheet at a time with --sheet"
+                             % (path, ', '.join(hidden)))
+        group = root
+    toolpaths = patron_toolpath.collect(group, patron_nesting.find_symbols(root), visible=True)
+    if toolpaths and all(toolpath.element.get(patron_toolpath.ORDER) is not None for toolpath in toolpaths):
+        toolpaths.sort(key=lambda toolpath: int(toolpath.element.get(patron_toolpath.ORDER)))
+    return toolpaths, 1.0 / patron_nesting.document_scale(root)
+
+
+def template_toolpaths(template_id, source=TEMPLATES_FILE):
+    """
+        Toolpaths of a saved template, e.g. 'fem_38', or of a graded size, e.g. 'fem_37'.
+        - return (toolpaths, millimeters per user unit)
+    """
+    # numpy is only needed by the grading of the saved templates
+    import patron_grading
+
+    category, size = template_id.split('_')
+    template = patron_grading.get_template(source, category, size)
+    if template is None:
+        raise ValueError("Unknown template '%s'" % template_id)
+
+    toolpaths = []
+    template_matrix = patron_path.parse_transform(template['transform'])
+    for piece in template['pieces']:
+        piece_matrix = patron_path.compose_transform(template_matrix, patron_path.parse_transform(piece['transform']))
+        for part in piece['parts']:
+            matrix = patron_path.compose_transform(piece_matrix, patron_path.parse_transform(part['transform']))
+            for start, segments, closed in patron_path.path_segments(part['path']):
+                start = patron_path.apply_transform(matrix, [start])[0]
+                segments = [(cmd, patron_path.apply_transform(matrix, points)) for cmd, points in segments]
+                if segments:
+                    toolpaths.append(patron_toolpath.Toolpath(None, None, start, segments, closed))
+    return toolpaths, STORE_MM_PER_UNIT
+
+
+# ---------------------------------------------------------------- #
+#                            PLOT
+# ---------------------------------------------------------------- #
+def plot(toolpaths, writer, mm_per_unit=1.0, tolerance=0.1, optimize=False, time_budget=1.0):
+    """
+        Stream the toolpaths to a plotter writer.
+        - tolerance is the flattening and simplification tolerance in millimeters
+        - optimize: reorder the toolpaths to minimise the travel (see patron_toolpath)
+        - return (points before simplification, points written)
+    """
+    order = list(range(len(toolpaths)))
+    entries = [0 if toolpath.closed else False for toolpath in toolpaths]
+    if optimize and toolpaths:
+        order, entries = patron_toolpath.nearest_neighbour(toolpaths)
+        order, entries = patron_toolpath.two_opt(toolpaths, order, entries, deadline=time.time() + time_budget)
+        entries = patron_toolpath.refine_entries(toolpaths, order, entries)
+
+    # The y axis is flipped and the drawing moved so that it sits at the origin
+    left = min([toolpath.bbox[0] for toolpath in toolpaths] or [0.0])
+    bottom = max([toolpath.bbox[3] for toolpath in toolpaths] or [0.0])
+    unit_tolerance = tolerance / mm_per_unit
+    flattened = written = 0
+
+    writer.header()
+    for index, entry in zip(order, entries):
+        toolpath = toolpaths[index]
+        start, segments = toolpath.oriented(entry)
+        points = patron_path.flatten_segments(start, segments, unit_tolerance)
+        flattened += len(points)
+        points = simplify(points, unit_tolerance)
+        written += len(points)
+        writer.polyline([((x - left) * mm_per_unit, (bottom - y) * mm_per_unit) for x, y in points])
+    writer.footer()
+    return flattened, written
+
+
+# ---------------------------------------------------------------- #
+#                             MAIN
+# ---------------------------------------------------------------- #
+def main(argv=None):
+    parser = optparse.OptionParser(usage="usage: %prog [options] (template.svg | saved template id, e.g. fem_38)")
+    parser.add_option("-f", "--format", type="choice", choices=list(WRITERS), dest="format", default='hpgl',
+                      help="Output format: hpgl or gcode")
+    parser.add_option("-o", "--output", type="string", dest="output", default='-',
+                      help="Output file, stdout by default")
+    parser.add_option("-t", "--tolerance", type="float", dest="tolerance", default=0.1,
+                      help="Flattening and simplification tolerance in mm")
+    parser.add_option("--sheet", type="int", dest="sheet", default=None,
+                      help="Number of the nesting sheet to plot, for a document nested on several sheets")
+    parser.add_option("--optimize", action="store_true", dest="optimize", default=False,
+                      help="Reorder the paths to minimise the travel")
+    parser.add_option("--feed", type="int", dest="feed", default=1500,
+                      help="G-code feed rate in mm/min")
+    parser.add_option("--pen-up", type="string", dest="pen_up", default='G0 Z5',
+                      help="G-code command lifting the pen or turning the tool off")
+    parser.add_option("--pen-down", type="string", dest="pen_down", default='G1 Z0',
+                      help="G-code command lowering the pen or turning the tool on")
+    options, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("a single svg file or template id is expected")
+
+    parts = args[0].split('_')
+    if not os.path.exists(args[0]) and (len(parts) != 2 or not all(parts)):
+        parser.error("'%s' is neither an svg file nor a template id such as fem_38" % args[0])
+    try:
+        if os.path.exists(args[0]):
+            toolpaths, mm_per_unit = svg_toolpaths(args[0], options.sheet)
+        else:
+            toolpaths, mm_per_unit = template_toolpaths(args[0])
+    except (ValueError, Etree.ParseError) as error:
+        parser.error(str(error))
+
+    stream = sys.stdout if options.output == '-' else open(options.output, 'w')
+    try:
+        if options.format == 'gcode':
+            writer = GCodeWriter(stream, options.feed, options.pen_up, options.pen_down)
+        else:
+            writer = HPGLWriter(stream)
+        flattened, written = plot(toolpaths, writer, mm_per_unit, options.tolerance, options.optimize)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    sys.stderr.write('%d paths, %d points (%d before simplification), %d commands\n'
+                     % (writer.polylines, written, flattened, writer.commands))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,226 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Opt-in stage profiling of the Patron effect.
+
+The profiled functions and methods are wrapped for the duration of a run only,
+so a normal run pays nothing. For every stage the profiler records:
+ - the number of calls
+ - the inclusive and self time (the time of the nested stages removed)
+ - the net allocated bytes (tracemalloc, python 3 only)
+The report is a json document written to a file or to stderr ('-').
+
+Profiling is asked on the command line or, for the headless runs where the
+extension arguments can not be changed, in the environment:
+    --profile=report.json            PATRON_PROFILE=report.json
+    --profile_cprofile=run.pstats    PATRON_CPROFILE=run.pstats
+The cProfile run is dumped in the pstats format, and next to it as folded
+stacks (run.pstats.folded), the input of flamegraph.pl or speedscope. Alone,
+it profiles the plain effect: with --profile too, the stage wrappers show up
+in it as 'profiled' frames.
+-----------------------------------------------
+"""
+
+import json
+import os
+import sys
+import time
+
+# cProfile, pstats and tracemalloc are only imported by a profiled run (they cost more than the render itself)
+tracemalloc = None
+
+__version__ = '1'
+
+PROFILE_ENV = 'PATRON_PROFILE'
+CPROFILE_ENV = 'PATRON_CPROFILE'
+FOLDED_SUFFIX = '.folded'
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+# ---------------------------------------------------------------- #
+#                       UTILITY FUNCTIONS
+# ---------------------------------------------------------------- #
+def requested(args, environ=os.environ):
+    """
+        Profiling outputs asked by the command line arguments or the environment.
+        - return (report target, cProfile dump target), '' when not asked
+    """
+    targets = {'--profile': environ.get(PROFILE_ENV, ''), '--profile_cprofile': environ.get(CPROFILE_ENV, '')}
+    for arg in args:
+        name, _, value = arg.partition('=')
+        if name in targets and value:
+            targets[name] = value
+    return targets['--profile'], targets['--profile_cprofile']
+
+
+def _label(code):
+    """ Frame label of a cProfile function key """
+    filename, line, name = code
+    return '%s:%d(%s)' % (os.path.basename(filename), line, name) if line else name
+
+
+def folded_stacks(stats, max_depth=64):
+    """
+        Fold a cProfile run into the stacks of a flame graph.
+        cProfile only keeps the caller -> callee edges, so the time of a function
+        is shared between its callers in proportion of the time of each edge.
+        - stats: a pstats.Stats
+        - return a dict of 'root;caller;callee' -> self microseconds
+    """
+    entries = stats.stats
+    callees = {}
+    for code, (cc, nc, tt, ct, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((code, edge[3]))
+    folded = {}
+
+    def walk(code, stack, share):
+        cc, nc, tt, ct, callers = entries[code]
+        stack = stack + [_label(code)]
+        key = ';'.join(stack)
+        folded[key] = folded.get(key, 0) + tt * share * 1e6
+        if len(stack) >= max_depth:
+            return
+        for callee, edge_time in callees.get(code, ()):
+            callee_time = entries[callee][3]
+            if callee_time > 0 and _label(callee) not in stack:
+                walk(callee, stack, share * edge_time / callee_time)
+
+    for code, entry in entries.items():
+        if not entry[4]:
+            walk(code, [], 1.0)
+    return dict((key, int(round(value))) for key, value in folded.items() if value >= 0.5)
+
+
+# ---------------------------------------------------------------- #
+#                            PROFILER
+# ---------------------------------------------------------------- #
+class Profiler(object):
+    """
+        Stage timings, call counts and allocations of a run.
+    """
+
+    def __init__(self, cprofile_target=''):
+        self.stages = {}
+        self.stack = []
+        self.patched = []
+        self.cprofile_target = cprofile_target
+        self.cprofile = None
+        self.tracing = self.started_tracing = False
+        self.start_time = self.total = None
+
+    def enter(self, name):
+        memory = tracemalloc.get_traced_memory()[0] if self.tracing else 0
+        self.stack.append([name, timer(), 0.0, memory])
+
+    def exit(self):
+        name, start, children, memory = self.stack.pop()
+        elapsed = timer() - start
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = {'calls': 0, 'time': 0.0, 'self': 0.0, 'allocated': 0}
+        stage['calls'] += 1
+        if not any(frame[0] == name for frame in self.stack):
+            stage['time'] += elapsed  # the outermost call of a recursion only
+        stage['self'] += elapsed - children
+        if self.tracing:
+            stage['allocated'] += tracemalloc.get_traced_memory()[0] - memory
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    def wrap(self, name, function):
+        """ Wrap a function so every call is recorded as a stage """
+        profiler = self
+
+        def profiled(*args, **kwargs):
+            profiler.enter(name)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.exit()
+        profiled.__name__ = getattr(function, '__name__', name)
+        profiled.__doc__ = getattr(function, '__doc__', None)
+        return profiled
+
+    def instrument(self, owner, names, prefix=None):
+        """
+            Wrap the named functions of a module, class or instance until stop.
+            - prefix: the stage names prefix, the owner name by default
+        """
+        if prefix is None:
+            prefix = getattr(owner, '__name__', type(owner).__name__)
+        for name in names:
+            own = vars(owner).get(name)
+            if isinstance(own, (staticmethod, classmethod)):
+                continue
+            function = own if own is not None else getattr(owner, name, None)
+            if function is None:
+                continue
+            # An inherited attribute (e.g. a method patched on an instance) is deleted on stop
+            self.patched.append((owner, name, own))
+            setattr(owner, name, self.wrap('%s.%s' % (prefix, name), function))
+
+    def start(self):
+        global tracemalloc
+        try:
+            import tracemalloc
+        except ImportError:
+            pass  # python 2, no allocation tracking
+        if tracemalloc is not None:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracing = True
+            self.tracing = True
+        if self.cprofile_target:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        self.start_time = timer()
+
+    def stop(self):
+        self.total = timer() - self.start_time
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        if self.started_tracing:
+            tracemalloc.stop()
+        self.tracing = self.started_tracing = False
+        for owner, name, original in reversed(self.patched):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self.patched = []
+
+    def report(self):
+        """ - return the json-serializable report, the stages by decreasing time """
+        stages = [dict(stage, name=name) for name, stage in self.stages.items()]
+        stages.sort(key=lambda stage: -stage['time'])
+        for stage in stages:
+            stage['time'] = round(stage['time'], 6)
+            stage['self'] = round(stage['self'], 6)
+        return {'version': __version__, 'total': round(self.total or 0.0, 6), 'argv': sys.argv[1:],
+                'allocations': tracemalloc is not None, 'stages': stages}
+
+    def write(self, target):
+        """
+            Write the report to a json file, or to stderr if target is '-',
+            and dump the cProfile run if any.
+        """
+        if target:
+            text = json.dumps(self.report(), indent=2, sort_keys=True)
+            if target == '-':
+                sys.stderr.write(text + '\n')
+            else:
+                with open(target, 'w') as stream:
+                    stream.write(text + '\n')
+        if self.cprofile is not None:
+            import pstats
+            self.cprofile.dump_stats(self.cprofile_target)
+            stacks = folded_stacks(pstats.Stats(self.cprofile))
+            with open(self.cprofile_target + FOLDED_SUFFIX, 'w') as stream:
+                for key in sorted(stacks):
+                    stream.write('%s %d\n' % (key, stacks[key]))
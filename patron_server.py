@@ -0,0 +1,275 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Long running local render server for the Patron extension (Python 3).
+
+Every run of patron.py pays the inkex import, the localization, the options
+parsing and the saved templates loading before doing any work. This server
+pays them once: it keeps a pool of worker processes, each one holding a warm
+Patron effect and the compiled saved templates (see patron_batch.init_worker),
+while an asyncio loop serves many clients concurrently and hands the renders
+over to the pool.
+
+A request is a JSON object of measurements and options, matched against the
+Patron options like the patron_batch rows ({"hip": 92, "chest": 98, ...} or
+{"type": "fem_38"}). Its 'id' is echoed back, and "document": true asks for
+the whole svg document instead of the fragment (<defs> and template group).
+Only the measurements and the rendering options (REQUEST_OPTIONS) are taken
+from a request: the options reaching the file system (cache, profile) or
+bounding the render time (nesting, toolpath) keep their defaults.
+The answer is a JSON object {"id", "svg", "seconds"} or {"id", "error"}.
+
+Two transports are available, together or not:
+ - HTTP on a localhost port: POST /render with the JSON request as body,
+   GET /status for the server statistics (keep-alive connections)
+ - a unix socket speaking JSON Lines: one request per line, one answer per line
+
+usage:
+    python3 patron_server.py --port 8765 -j 4
+    python3 patron_server.py --socket /tmp/patron.sock
+-----------------------------------------------
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import optparse
+import os
+import sys
+import time
+
+import patron_batch
+import patron_core
+
+__version__ = '1'
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                413: 'Payload Too Large', 500: 'Internal Server Error'}
+MAX_BODY = 1 << 20
+
+# Patron options a client can set in a request, by destination
+REQUEST_OPTIONS = frozenset(patron_core.FIELDS + ('type', 'units', 'style', 'grid', 'temp', 'output_mode',
+                                                   'flatness'))
+
+# Tag names of the base document children that are not part of the rendered fragment
+DOCUMENT_ONLY = ('namedview', 'metadata')
+
+
+# ---------------------------------------------------------------- #
+#                           WORKERS
+# ---------------------------------------------------------------- #
+def render_request(request):
+    """
+        Render a JSON request in a worker process (see patron_batch.init_worker).
+        - return the svg text of the fragment, or of the whole document if asked
+    """
+    document = patron_batch.render(request, REQUEST_OPTIONS)
+    etree = patron_batch._worker['etree']
+    root = document.getroot()
+    if request.get('document'):
+        return etree.tostring(root, encoding='unicode')
+    fragment = [etree.tostring(child, encoding='unicode') for child in root
+                if isinstance(child.tag, str) and child.tag.rsplit('}', 1)[-1] not in DOCUMENT_ONLY]
+    if not fragment:
+        raise ValueError("Nothing rendered, unknown template '%s'" % request.get('type'))
+    return ''.join(fragment)
+
+
+# ---------------------------------------------------------------- #
+#                            SERVER
+# ---------------------------------------------------------------- #
+class RenderServer(object):
+    """
+        Render requests dispatcher, shared by the transports.
+    """
+
+    def __init__(self, jobs=None, document=patron_batch.BLANK_DOCUMENT):
+        self.jobs = jobs or os.cpu_count() or 1
+        self.pool = concurrent.futures.ProcessPoolExecutor(self.jobs, initializer=patron_batch.init_worker,
+                                                           initargs=(None, document))
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.busy = 0
+        self.render_seconds = 0.0
+
+    async def warm_up(self):
+        """ Start the workers and load the extension in each of them """
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.pool, render_request, {'temp': False, 'grid': False})
+                               for _ in range(self.jobs)])
+
+    async def render(self, request):
+        """
+            Render a decoded JSON request in the worker pool.
+            - return the answer dict
+        """
+        answer = {'id': request.get('id')} if isinstance(request, dict) else {'id': None}
+        start = time.time()
+        self.requests += 1
+        self.busy += 1
+        try:
+            if not isinstance(request, dict):
+                raise ValueError('A JSON object is expected')
+            answer['svg'] = await asyncio.get_running_loop().run_in_executor(self.pool, render_request, request)
+        except Exception as error:
+            self.errors += 1
+            answer['error'] = '%s: %s' % (type(error).__name__, error)
+        finally:
+            self.busy -= 1
+        answer['seconds'] = round(time.time() - start, 4)
+        self.render_seconds += answer['seconds']
+        return answer
+
+    def status(self):
+        return {'version': __version__, 'workers': self.jobs, 'uptime': round(time.time() - self.started, 1),
+                'requests': self.requests, 'errors': self.errors, 'busy': self.busy,
+                'mean_seconds': round(self.render_seconds / self.requests, 4) if self.requests else None}
+
+    def close(self):
+        self.pool.shutdown()
+
+    # -------------------------------------------------------------- #
+    #                       JSON LINES SOCKET
+    # -------------------------------------------------------------- #
+    async def handle_lines(self, reader, writer):
+        """ One JSON request per line, answered in order on the same connection """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line.decode('utf-8'))
+                except ValueError as error:
+                    answer = {'id': None, 'error': 'ValueError: %s' % error}
+                else:
+                    answer = await self.render(request)
+                writer.write(json.dumps(answer).encode('utf-8') + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # -------------------------------------------------------------- #
+    #                             HTTP
+    # -------------------------------------------------------------- #
+    @staticmethod
+    def http_response(writer, code, answer, keep_alive):
+        body = json.dumps(answer).encode('utf-8')
+        head = ['HTTP/1.1 %d %s' % (code, HTTP_REASONS[code]),
+                'Content-Type: application/json',
+                'Content-Length: %d' % len(body),
+                'Connection: %s' % ('keep-alive' if keep_alive else 'close')]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+
+    async def handle_http(self, reader, writer):
+        """ Minimal HTTP/1.1: POST /render and GET /status, with keep-alive """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    self.http_response(writer, 400, {'error': 'Malformed request line'}, False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY:
+                    self.http_response(writer, 413, {'error': 'Request too large'}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                path = target.split('?', 1)[0]
+                if path == '/status':
+                    code, answer = 200, self.status()
+                elif path != '/render':
+                    code, answer = 404, {'error': 'Unknown path %s' % path}
+                elif method != 'POST':
+                    code, answer = 405, {'error': 'POST the JSON request to /render'}
+                else:
+                    try:
+                        request = json.loads(body.decode('utf-8'))
+                    except ValueError as error:
+                        code, answer = 400, {'id': None, 'error': 'ValueError: %s' % error}
+                    else:
+                        answer = await self.render(request)
+                        code = 200 if 'svg' in answer else 400
+                self.http_response(writer, code, answer, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+# ---------------------------------------------------------------- #
+#                             MAIN
+# ---------------------------------------------------------------- #
+async def serve(server, host, port, socket_path):
+    servers = []
+    if port is not None:
+        servers.append(await asyncio.start_server(server.handle_http, host, port))
+        sys.stderr.write('Patron server listening on http://%s:%d\n' % (host, port))
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        servers.append(await asyncio.start_unix_server(server.handle_lines, socket_path))
+        sys.stderr.write('Patron server listening on %s\n' % socket_path)
+    await server.warm_up()
+    sys.stderr.write('%d workers ready\n' % server.jobs)
+    await asyncio.gather(*[listener.serve_forever() for listener in servers])
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage="usage: %prog [options]")
+    parser.add_option("--host", type="string", dest="host", default='127.0.0.1',
+                      help="HTTP interface, localhost by default")
+    parser.add_option("-p", "--port", type="int", dest="port", default=None,
+                      help="HTTP port")
+    parser.add_option("-s", "--socket", type="string", dest="socket", default=None,
+                      help="Unix socket path, speaking JSON Lines")
+    parser.add_option("-j", "--jobs", type="int", dest="jobs", default=None,
+                      help="Number of worker processes (default: one per cpu)")
+    parser.add_option("--document", type="string", dest="document", default=None,
+                      help="Base svg document used for each template")
+    options, args = parser.parse_args(argv)
+    if options.port is None and not options.socket:
+        parser.error("a --port or a --socket is expected")
+
+    document = patron_batch.BLANK_DOCUMENT
+    if options.document:
+        with open(options.document, 'rb') as stream:
+            document = stream.read()
+
+    server = RenderServer(options.jobs, document)
+    try:
+        asyncio.run(serve(server, options.host, options.port, options.socket))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if options.socket and os.path.exists(options.socket):
+            os.remove(options.socket)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,275 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Size run of the saved templates: every size of a template type (or of all of
+them) rendered in a single run, the sizes being spread over a pool of worker
+processes (see patron_batch.init_worker).
+
+The saved templates are read once: the compiled store of 'patron.xml' (and the
+grading model when needed, see patron_grading) is built or checked by the main
+process before the pool starts, the workers then share its memory mapped file
+instead of parsing 'patron.xml' for each size.
+
+Two outputs:
+ - one svg file per size (patron_fem_36.svg, ...)
+ - a nested overlay per template type (patron_fem_sizes.svg): all the sizes of
+   each piece stacked on a common anchor, the frame of the pieces registered
+   by the grading model (centroid and orientation of their outline), placed
+   like the smallest size. Only the texts of the smallest size are kept.
+
+The sizes are the stored ones by default; sizes between them, or up to one
+size step beyond them, are graded (e.g. --sizes 34-44). A size that renders
+no template is reported as failed and no file is written for it.
+
+usage:
+    python patron_sizes.py fem -o out/ -j 4
+    python patron_sizes.py all --overlay --sizes 34-44 -o out/
+-----------------------------------------------
+"""
+
+import multiprocessing
+import optparse
+import os
+import sys
+import time
+import xml.etree.ElementTree as Etree
+
+import patron_batch
+import patron_nesting
+import patron_path
+import patron_store
+import patron_update
+
+__version__ = '1'
+
+TEMPLATES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'patron.xml')
+LABEL = patron_nesting.LABEL
+
+
+# ---------------------------------------------------------------- #
+#                       UTILITY FUNCTIONS
+# ---------------------------------------------------------------- #
+def parse_sizes(text):
+    """
+        Parse a list of sizes, e.g. '34,36,38' or '34-44' (every integer size of the range).
+        - return a list of size texts
+        - raise ValueError for a size that is not a positive number
+    """
+    sizes = []
+    for item in text.split(','):
+        item = item.strip()
+        if '-' in item.lstrip('-'):
+            first, last = item.split('-', 1)
+            try:
+                sizes.extend(str(size) for size in range(int(first), int(last) + 1))
+            except ValueError:
+                raise ValueError("invalid size range '%s'" % item)
+        elif item:
+            sizes.append(item)
+    for size in sizes:
+        try:
+            valid = 0 < float(size) < float('inf')
+        except ValueError:
+            valid = False
+        if not valid:
+            raise ValueError("invalid size '%s'" % size)
+    return sizes
+
+
+def size_rows(store, categories, sizes=None, options=None):
+    """
+        Rows of the templates to render, as patron_batch rows.
+        - sizes: the sizes to render, the stored sizes of each type if None
+        - options: Patron options added to every row
+    """
+    rows = []
+    for category in categories:
+        for size in sizes or sorted(store.sizes(category), key=float):
+            row = dict(options or {})
+            row['id'] = row['type'] = '%s_%s' % (category, size)
+            rows.append(row)
+    return rows
+
+
+def template_group(root):
+    """ The template group of a rendered document, None if nothing was rendered """
+    for element in root.iter():
+        if element.get(patron_update.TYPE) is not None:
+            return element
+    return None
+
+
+# ---------------------------------------------------------------- #
+#                           WORKERS
+# ---------------------------------------------------------------- #
+def render_size(row):
+    """
+        Render a saved template size in a worker process.
+        - return (template id, svg document text), the text being None on failure
+          or when there is no saved template nor grading for the size
+    """
+    try:
+        document = patron_batch.render(row)
+        if template_group(document.getroot()) is None:
+            raise ValueError("no template rendered for this size")
+        return row['type'], patron_batch._worker['etree'].tostring(document, encoding='UTF-8', xml_declaration=True)
+    except (Exception, SystemExit) as error:
+        sys.stderr.write('%s: %s: %s\n' % (row['type'], type(error).__name__, error))
+        return row['type'], None
+
+
+# ---------------------------------------------------------------- #
+#                           OVERLAY
+# ---------------------------------------------------------------- #
+def overlay(category, documents, model):
+    """
+        Stack all the sizes of each piece of a template type in a single document.
+        - documents: (size, svg document text) pairs, sorted by size
+        - model: the patron_grading model registering the pieces of the sizes
+        - return the overlay document tree, None if no size was rendered
+    """
+    document = root = parent = stack = anchor = None
+    pieces = {}
+    for size, text in documents:
+        size_root = Etree.fromstring(text)
+        group = template_group(size_root)
+        if group is None:
+            continue
+        if root is None:
+            # The first size gives the document, and the place and transform of the overlay
+            root = size_root
+            document = Etree.ElementTree(root)
+            parent = [element for element in root.iter() if group in list(element)][0]
+            stack = Etree.Element(group.tag, {LABEL: 'T-shirt_sizes_%s' % category})
+            if group.get('transform'):
+                stack.set('transform', group.get('transform'))
+            parent.insert(list(parent).index(group), stack)
+            parent.remove(group)
+            anchor = size
+
+        prefix = group.get(LABEL) + '_'
+        for piece in list(group):
+            name = (piece.get(LABEL) or '')[len(prefix):]
+            if name not in pieces:
+                pieces[name] = Etree.SubElement(stack, group.tag, {LABEL: 'T-shirt_sizes_%s_%s' % (category, name)})
+            frame = model.frame(category, size, name, anchor)
+            if frame is not None:
+                matrix = patron_path.compose_transform(frame, patron_path.parse_transform(piece.get('transform')))
+                transform = patron_path.format_transform(matrix)
+                if transform:
+                    piece.set('transform', transform)
+                elif 'transform' in piece.attrib:
+                    del piece.attrib['transform']
+            if size != anchor:
+                for text in [child for child in piece if patron_nesting._local_name(child.tag) == 'text']:
+                    piece.remove(text)
+            pieces[name].append(piece)
+    return document
+
+
+# ---------------------------------------------------------------- #
+#                             MAIN
+# ---------------------------------------------------------------- #
+def run(rows, output_dir, overlay_mode=False, jobs=None, document=patron_batch.BLANK_DOCUMENT, source=TEMPLATES_FILE):
+    """
+        Render the rows of a size run over a pool of worker processes.
+        - return (the list of written files, the list of the template ids that failed)
+    """
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    # Compile (or check) the saved templates once, before the workers start
+    store = patron_store.open_store(source)
+    store.types()
+    model = None
+    graded = [row for row in rows if store.get(*row['type'].split('_')) is None]
+    if overlay_mode or graded:
+        import patron_grading
+        model = patron_grading.open_grading(source)
+        model.types()
+
+    pool = multiprocessing.Pool(jobs, patron_batch.init_worker, (output_dir, document))
+    try:
+        results = pool.map(render_size, rows, 1)
+    finally:
+        pool.close()
+        pool.join()
+    failed = [template_id for template_id, text in results if text is None]
+
+    if not overlay_mode:
+        files = []
+        for template_id, text in results:
+            if text is not None:
+                filename = os.path.join(output_dir, 'patron_%s.svg' % template_id)
+                with open(filename, 'wb') as stream:
+                    stream.write(text)
+                files.append(filename)
+        return files, failed
+
+    for prefix, uri in list(patron_nesting.NSS.items()) + [('patron', patron_update.PATRON_NS)]:
+        Etree.register_namespace('' if prefix == 'svg' else prefix, uri)
+    files = []
+    categories = []
+    for template_id, text in results:
+        category = template_id.split('_')[0]
+        if category not in categories:
+            categories.append(category)
+    for category in categories:
+        documents = [(template_id.split('_', 1)[1], text) for template_id, text in results
+                     if text is not None and template_id.split('_')[0] == category]
+        overlay_document = overlay(category, documents, model)
+        if overlay_document is not None:
+            filename = os.path.join(output_dir, 'patron_%s_sizes.svg' % category)
+            overlay_document.write(filename, encoding='UTF-8', xml_declaration=True)
+            files.append(filename)
+    return files, failed
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage="usage: %prog [options] (type [type ...] | all)")
+    parser.add_option("-o", "--output", type="string", dest="output", default='patrons',
+                      help="Output directory of the rendered svg files")
+    parser.add_option("-s", "--sizes", type="string", dest="sizes", default=None,
+                      help="Sizes to render, e.g. '34,37,40' or '34-44' (default: the stored sizes)")
+    parser.add_option("--overlay", action="store_true", dest="overlay", default=False,
+                      help="Stack all the sizes of each piece in one file per type, instead of one file per size")
+    parser.add_option("-j", "--jobs", type="int", dest="jobs", default=None,
+                      help="Number of worker processes (default: one per cpu)")
+    parser.add_option("--style", type="string", dest="style", default='print',
+                      help="Style of the templates, 'print' or 'cut'")
+    parser.add_option("--output-mode", type="string", dest="output_mode", default='inline',
+                      help="SVG output: 'inline' styles, or 'shared' css classes")
+    parser.add_option("--document", type="string", dest="document", default=None,
+                      help="Base svg document used for each size")
+    options, args = parser.parse_args(argv)
+    if not args:
+        parser.error("a template type (e.g. fem) or 'all' is expected")
+
+    store = patron_store.open_store(TEMPLATES_FILE)
+    categories = store.types() if 'all' in args else args
+    unknown = [category for category in categories if category not in store.types()]
+    if unknown:
+        parser.error("unknown template type(s): %s" % ', '.join(unknown))
+
+    document = patron_batch.BLANK_DOCUMENT
+    if options.document:
+        with open(options.document, 'rb') as stream:
+            document = stream.read()
+
+    try:
+        sizes = parse_sizes(options.sizes) if options.sizes else None
+    except ValueError as error:
+        parser.error(str(error))
+    rows = size_rows(store, categories, sizes, {'style': options.style, 'output_mode': options.output_mode})
+    start = time.time()
+    files, failed = run(rows, options.output, options.overlay, options.jobs, document)
+    sys.stderr.write('%d sizes rendered to %d files in %.2fs (%d failed)\n' % (len(rows) - len(failed), len(files),
+                                                                             time.time() - start, len(failed)))
+    return 1 if failed or not files else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,248 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Compiled template store for the saved templates of 'patron.xml'.
+
+The xml file is compiled once into a binary file, next to it when possible or
+in the temporary directory otherwise, and recompiled automatically as soon as
+the xml modification time or size changes.
+
+The compiled file is memory mapped and made of:
+ - a fixed header (magic, version, source mtime and size, index length)
+ - a small json index giving the position of each (type, size) record
+ - one record per template: its json metadata (names, transforms, path data)
+   followed by the pre-parsed path coordinates as packed float64 values
+
+Reading a template only decodes its own record, whatever the number of
+categories and sizes stored in 'patron.xml'.
+-----------------------------------------------
+"""
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+import xml.etree.ElementTree as Etree
+import zlib
+
+from patron_path import parse_path
+
+__version__ = '1'
+
+MAGIC = b'PTRN'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHdqI')
+LENGTH = struct.Struct('<I')
+
+# Stores already opened in this process, keyed by source path
+_stores = {}
+
+
+# ---------------------------------------------------------------- #
+#                       UTILITY FUNCTIONS
+# ---------------------------------------------------------------- #
+def _child_text(element, tag):
+    child = element.find(tag)
+    return child.text.strip() if child is not None and child.text else ''
+
+
+# ---------------------------------------------------------------- #
+#                           COMPILER
+# ---------------------------------------------------------------- #
+def _compile_template(template):
+    """
+        Build the record of a single template element.
+        - return the json metadata and the flat list of its path coordinates
+    """
+    coords = []
+    meta = {'transform': _child_text(template, 'transform'), 'pieces': []}
+    for piece in template.findall('piece'):
+        piece_meta = {
+            'name': _child_text(piece, 'name'),
+            'info': _child_text(piece, 'info'),
+            'transform': _child_text(piece, 'transform'),
+            'parts': []
+        }
+        for part in piece.findall('part'):
+            d = ' '.join(_child_text(part, 'path').split())
+            path = parse_path(d)
+            piece_meta['parts'].append({
+                'name': _child_text(part, 'name'),
+                'transform': _child_text(part, 'transform'),
+                'd': d,
+                'commands': ''.join(cmd for cmd, params in path),
+                'counts': [len(params) for cmd, params in path],
+                'start': len(coords)
+            })
+            for cmd, params in path:
+                coords.extend(params)
+        meta['pieces'].append(piece_meta)
+    return meta, coords
+
+
+def compile_store(source, target):
+    """
+        Compile the 'patron.xml' source file into the binary store target.
+    """
+    stat = os.stat(source)
+    root = Etree.parse(source).getroot()
+
+    index = {}
+    records = []
+    position = 0
+    for category in root.findall('type'):
+        sizes = index.setdefault(category.get('name'), {})
+        for template in category.findall('template'):
+            meta, coords = _compile_template(template)
+            meta = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+            record = b''.join([LENGTH.pack(len(meta)), meta,
+                               LENGTH.pack(len(coords)), struct.pack('<%dd' % len(coords), *coords)])
+            sizes[template.get('size')] = [position, len(record)]
+            records.append(record)
+            position += len(record)
+
+    index = json.dumps(index, separators=(',', ':')).encode('utf-8')
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, stat.st_mtime, stat.st_size, len(index))
+
+    # Write to a temporary file first so that concurrent readers never see a partial store
+    handle, temp_path = tempfile.mkstemp(prefix='.patron_store_', dir=os.path.dirname(target) or '.')
+    with os.fdopen(handle, 'wb') as stream:
+        stream.write(header)
+        stream.write(index)
+        for record in records:
+            stream.write(record)
+    os.chmod(temp_path, 0o644)
+    try:
+        os.replace(temp_path, target)
+    except AttributeError:
+        # python 2
+        if os.path.exists(target):
+            os.remove(target)
+        os.rename(temp_path, target)
+
+
+# ---------------------------------------------------------------- #
+#                             STORE
+# ---------------------------------------------------------------- #
+class TemplateStore(object):
+    """
+        Read only access to the compiled saved templates, keyed by (type, size).
+    """
+
+    def __init__(self, source, target=None):
+        self.source = os.path.abspath(source)
+        self.target = target or self.default_target(self.source)
+        self._map = None
+        self._index = None
+        self._records_start = 0
+        self._cache = {}
+        self._mtime = None
+
+    @staticmethod
+    def default_target(source):
+        """
+            The store is written next to the source when the directory is writable,
+            in the temporary directory otherwise (e.g. a system wide Inkscape install).
+        """
+        directory, name = os.path.split(source)
+        if os.access(directory, os.W_OK):
+            return os.path.join(directory, '.%s.store' % name)
+        source_hash = zlib.crc32(source.encode('utf-8')) & 0xffffffff
+        return os.path.join(tempfile.gettempdir(), 'patron_%08x_%s.store' % (source_hash, name))
+
+    def _is_stale(self, stat):
+        try:
+            with open(self.target, 'rb') as stream:
+                header = stream.read(HEADER.size)
+        except (IOError, OSError):
+            return True
+        if len(header) != HEADER.size:
+            return True
+        magic, version, mtime, size, index_length = HEADER.unpack(header)
+        return magic != MAGIC or version != FORMAT_VERSION or mtime != stat.st_mtime or size != stat.st_size
+
+    def _load(self):
+        """
+            Map the compiled store, recompiling it first when the source changed.
+        """
+        stat = os.stat(self.source)
+        if self._map is not None and self._mtime == (stat.st_mtime, stat.st_size):
+            return
+        if self._is_stale(stat):
+            compile_store(self.source, self.target)
+        self.close()
+
+        with open(self.target, 'rb') as stream:
+            self._map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, mtime, size, index_length = HEADER.unpack_from(self._map, 0)
+        self._index = json.loads(self._map[HEADER.size:HEADER.size + index_length].decode('utf-8'))
+        self._records_start = HEADER.size + index_length
+        self._mtime = (stat.st_mtime, stat.st_size)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._map = None
+        self._index = None
+        self._cache = {}
+
+    def types(self):
+        """ return the list of the stored template types """
+        self._load()
+        return list(self._index)
+
+    def sizes(self, category):
+        """ return the list of the stored sizes of a template type """
+        self._load()
+        return list(self._index.get(category, {}))
+
+    def get(self, category, size):
+        """
+            Read a single template.
+            - return a dict {'transform', 'pieces': [{'name', 'info', 'transform', 'parts'}]}
+              where each part holds its 'name', 'transform', raw 'd' and parsed 'path'
+            - return None if the template does not exist
+        """
+        self._load()
+        key = (category, str(size))
+        if key in self._cache:
+            return self._cache[key]
+
+        location = self._index.get(category, {}).get(str(size))
+        if location is None:
+            return None
+        offset = self._records_start + location[0]
+        meta_length, = LENGTH.unpack_from(self._map, offset)
+        offset += LENGTH.size
+        template = json.loads(self._map[offset:offset + meta_length].decode('utf-8'))
+        offset += meta_length
+        coords_count, = LENGTH.unpack_from(self._map, offset)
+        coords = struct.unpack_from('<%dd' % coords_count, self._map, offset + LENGTH.size)
+
+        # Rebuild the parsed path of every part from the packed coordinates
+        for piece in template['pieces']:
+            for part in piece['parts']:
+                start = part.pop('start')
+                path = []
+                for command, count in zip(part.pop('commands'), part.pop('counts')):
+                    path.append([command, list(coords[start:start + count])])
+                    start += count
+                part['path'] = path
+
+        self._cache[key] = template
+        return template
+
+
+def open_store(source, target=None):
+    """
+        Return the store of the given 'patron.xml' file, shared in this process.
+    """
+    source = os.path.abspath(source)
+    store = _stores.get(source)
+    if store is None:
+        store = _stores[source] = TemplateStore(source, target)
+    return store
@@ -0,0 +1,140 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Streaming svg output of many templates in a single document.
+
+The templates of a batch are written to the output one after the other, as
+soon as they are rendered, instead of being gathered in a document tree that
+is serialized at the end: the memory use does not depend on the number of
+templates, and the first bytes reach the output (a file or a pipe) right away.
+
+The document is the base document (e.g. patron_batch.BLANK_DOCUMENT), its
+content kept as is, with the serialized template groups inserted before its
+closing tag. Each template group, with the group, piece and part structure
+rendered by the Patron effect, is wrapped in a group translating it to its
+place on the sheet: the templates are laid out in rows of a given number of
+columns, from their bounding boxes. The shared definitions of the templates
+(the <defs> of the 'shared' output mode) are written once.
+
+    with SvgStream(open('sheet.svg', 'wb'), base_document, columns=8) as sheet:
+        for group, defs, bbox in rendered:
+            sheet.write_defs(defs)
+            sheet.write_template(group, bbox)
+-----------------------------------------------
+"""
+
+import hashlib
+import re
+
+__version__ = '1'
+
+CLOSING_TAG = re.compile(br'</(?:svg:)?svg\s*>\s*$')
+SELF_CLOSING = re.compile(br'\s*/>\s*$')
+
+
+# ---------------------------------------------------------------- #
+#                       UTILITY FUNCTIONS
+# ---------------------------------------------------------------- #
+def split_document(document):
+    """
+        Split a serialized svg document around the place of the streamed content.
+        - return (head, tail): the document up to its closing tag, and the closing tag
+    """
+    match = CLOSING_TAG.search(document)
+    if match is not None:
+        return document[:match.start()], document[match.start():]
+    match = SELF_CLOSING.search(document)
+    if match is None:
+        raise ValueError("The base document is not an svg document")
+    return document[:match.start()] + b'>\n', b'</svg>\n'
+
+
+def _number(value):
+    return ('%.3f' % value).rstrip('0').rstrip('.')
+
+
+# ---------------------------------------------------------------- #
+#                            WRITER
+# ---------------------------------------------------------------- #
+class SvgStream(object):
+    """
+        Incremental writer of a multi-template svg document.
+        - columns: number of templates per row
+        - gap: space around the templates, in document user units
+    """
+
+    def __init__(self, stream, document, columns=10, gap=10.0):
+        self.stream = stream
+        self.head, self.tail = split_document(document)
+        self.columns = max(1, columns)
+        self.gap = gap
+        self.defs = set()
+        self.count = 0
+        self.x = self.y = self.row_height = 0.0
+        self.opened = self.closed = False
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        self.close()
+
+    def _write(self, data):
+        self.stream.write(data)
+        self.stream.flush()
+
+    def open(self):
+        """ Write the head of the base document """
+        if not self.opened:
+            self._write(self.head)
+            self.opened = True
+
+    def close(self):
+        """ Write the closing tag of the document """
+        if self.opened and not self.closed:
+            self._write(self.tail)
+            self.closed = True
+
+    def write_defs(self, data):
+        """ Write serialized shared definitions, unless the same ones were already written """
+        if not data:
+            return
+        key = hashlib.sha1(data).digest()
+        if key not in self.defs:
+            self.open()
+            self.defs.add(key)
+            self._write(data)
+
+    def place(self, bbox):
+        """
+            Place of the next template on the sheet.
+            - bbox: bounding box of the template, as given by patron_path.points_to_bbox
+            - return the (dx, dy) translation of the template
+        """
+        if self.count and self.count % self.columns == 0:
+            self.x = 0.0
+            self.y += self.row_height + self.gap
+            self.row_height = 0.0
+        llx, lly, urx, ury = bbox
+        translation = (self.x + self.gap - llx, self.y + self.gap - lly)
+        self.x += urx - llx + self.gap
+        self.row_height = max(self.row_height, ury - lly)
+        self.count += 1
+        return translation
+
+    def write_template(self, data, bbox=None):
+        """
+            Write a serialized template group at its place on the sheet.
+            - bbox: its bounding box, the template is written in place if None
+        """
+        self.open()
+        if bbox is None:
+            self._write(data)
+            return
+        dx, dy = self.place(bbox)
+        self._write(b'<g transform="translate(' + _number(dx).encode('ascii') + b',' +
+                    _number(dy).encode('ascii') + b')">' + data + b'</g>\n')
@@ -0,0 +1,386 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Tiling of a template document onto printable pages (A4 or A3), for the shops
+without a large format plotter.
+
+The drawing is split into overlapping pages: each page shows its printable area
+(the paper size less the unprintable margin), the neighbouring pages sharing a
+band of --overlap mm. Registration marks are drawn at the corners of the page,
+in the middle of the overlap bands, so the marks of two neighbouring pages fall
+on each other once aligned. Every page is labelled with its name (the column
+letter and row number, e.g. 'B1') and its number, in its bottom overlap band.
+
+No path is clipped against every page: the exact bounding box of each drawn
+element is computed once (the curves extrema included, see patron_path.path_bbox)
+and kept in a grid spatial index of the page size, so a page only copies the
+elements which intersect it, clipped by the printer area. The pages are built
+one by one while they are written:
+ - one svg file per page (page_A1.svg, page_B1.svg, ...)
+ - or a single svg document of the page size, each page being a layer (the
+   first one visible), e.g. for a per layer pdf export
+
+usage:
+    python patron_tiling.py patron.svg -p A4 -o pages/
+    python patron_tiling.py patron.svg -p A3 --landscape --layers -o pages.svg
+-----------------------------------------------
+"""
+
+import copy
+import math
+import optparse
+import os
+import sys
+import xml.etree.ElementTree as Etree
+
+import patron_nesting
+import patron_path
+import patron_stream
+
+__version__ = '1'
+
+NSS = patron_nesting.NSS
+LABEL = patron_nesting.LABEL
+GROUPMODE = patron_nesting.GROUPMODE
+SVG = '{%s}' % NSS['svg']
+
+# Paper sizes in mm, portrait
+PAGE_SIZES = {'A4': (210.0, 297.0), 'A3': (297.0, 420.0)}
+MARGIN = 10.0
+OVERLAP = 15.0
+MARK_RADIUS = 3.0
+MARK_STROKE = 0.2
+LABEL_HEIGHT = 4.0
+
+# Elements never drawn by themselves, and the groups walked down to their drawn elements
+SKIPPED = ('defs', 'namedview', 'metadata', 'symbol', 'style', 'clipPath', 'mask', 'title', 'desc', 'script')
+CONTAINERS = ('g', 'a', 'switch')
+# Average advance of a glyph, relative to the font size, to estimate the width of the texts
+GLYPH_WIDTH = 0.6
+
+
+# ---------------------------------------------------------------- #
+#                       UTILITY FUNCTIONS
+# ---------------------------------------------------------------- #
+def column_name(index):
+    """ Spreadsheet-like column letters: A ... Z, AA, AB, ... """
+    name = ''
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        name = chr(ord('A') + rest) + name
+    return name
+
+
+def _presentation(element, name, default=None):
+    """ Value of a presentation property of an element, from its style or its attribute """
+    for declaration in (element.get('style') or '').split(';'):
+        key, _, value = declaration.partition(':')
+        if key.strip() == name:
+            return value.strip()
+    return element.get(name, default)
+
+
+def _hidden(element):
+    return 'display:none' in (element.get('style') or '').replace(' ', '')
+
+
+def drawn_elements(element, matrix=patron_path.IDENTITY):
+    """
+        Drawn elements under element, with the matrix placing them in the document
+        (their own transform included).
+        - yield (element, matrix) pairs, in document order
+    """
+    for child in element:
+        name = patron_nesting._local_name(child.tag)
+        if not name or name in SKIPPED or _hidden(child):
+            continue
+        child_matrix = patron_path.compose_transform(matrix, patron_path.parse_transform(child.get('transform')))
+        if name in CONTAINERS:
+            for drawn in drawn_elements(child, child_matrix):
+                yield drawn
+        else:
+            yield child, child_matrix
+
+
+def _union(boxes):
+    boxes = [box for box in boxes if box is not None]
+    if not boxes:
+        return None
+    return (min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+
+def _corners_bbox(matrix, x0, y0, x1, y1):
+    return patron_path.points_to_bbox(patron_path.apply_transform(matrix, [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]))
+
+
+def element_bbox(element, matrix, symbols=None):
+    """
+        Exact bounding box of a drawn element, in the coordinate system where it has the given matrix.
+        The box of a text is estimated from its font size and number of characters.
+        - symbols: the symbols referenced by <use> elements, by id (see patron_nesting.find_symbols)
+        - return (x0, y0, x1, y1), or None if the element draws nothing
+    """
+    name = patron_nesting._local_name(element.tag)
+    number = lambda attribute: float(element.get(attribute) or 0)
+    if name == 'path':
+        return patron_path.path_bbox(element.get('d'), matrix) if element.get('d') else None
+    if name in ('circle', 'ellipse'):
+        rx = number('r') if name == 'circle' else number('rx')
+        ry = number('r') if name == 'circle' else number('ry')
+        a, b, c, d, e, f = matrix
+        (cx, cy), = patron_path.apply_transform(matrix, [(number('cx'), number('cy'))])
+        # Half extents of the transformed ellipse
+        hx, hy = math.hypot(a * rx, c * ry), math.hypot(b * rx, d * ry)
+        return cx - hx, cy - hy, cx + hx, cy + hy
+    if name == 'rect':
+        x, y = number('x'), number('y')
+        return _corners_bbox(matrix, x, y, x + number('width'), y + number('height'))
+    if name == 'line':
+        return patron_path.points_to_bbox(patron_path.apply_transform(
+            matrix, [(number('x1'), number('y1')), (number('x2'), number('y2'))]))
+    if name in ('polyline', 'polygon'):
+        values = [float(value) for value in patron_path.NUMBER.findall(element.get('points') or '')]
+        points = list(zip(values[0::2], values[1::2]))
+        return patron_path.points_to_bbox(patron_path.apply_transform(matrix, points)) if points else None
+    if name == 'text':
+        text = ''.join(element.itertext())
+        if not text.strip():
+            return None
+        size = patron_path.NUMBER.match(_presentation(element, 'font-size', '12'))
+        size = float(size.group(0)) if size else 12.0
+        width = GLYPH_WIDTH * size * len(text)
+        anchor = {'middle': 0.5, 'end': 1.0}.get(_presentation(element, 'text-anchor'), 0.0)
+        x, y = number('x'), number('y')
+        return _corners_bbox(matrix, x - anchor * width, y - size, x + (1 - anchor) * width, y + 0.25 * size)
+    if name == 'use':
+        target, placement = patron_nesting.use_target(element, symbols)
+        if target is None:
+            return None
+        placed = patron_path.compose_transform(matrix, placement)
+        return _union(element_bbox(child, patron_path.compose_transform(
+            placed, patron_path.parse_transform(child.get('transform'))), symbols) for child in target)
+    return None
+
+
+# ---------------------------------------------------------------- #
+#                            TILING
+# ---------------------------------------------------------------- #
+class Tiling(object):
+    """
+        Pages of a document, over a grid spatial index of its drawn elements.
+        - page: the paper size in mm (width, height)
+        - margin: unprintable margin of the printer in mm
+        - overlap: width of the band shared by neighbouring pages in mm
+    """
+
+    def __init__(self, root, page=PAGE_SIZES['A4'], margin=MARGIN, overlap=OVERLAP):
+        self.root = root
+        self.scale = patron_nesting.document_scale(root)
+        self.paper = (page[0] * self.scale, page[1] * self.scale)
+        self.margin = margin * self.scale
+        self.overlap = overlap * self.scale
+        self.printable = (self.paper[0] - 2 * self.margin, self.paper[1] - 2 * self.margin)
+        self.step = (self.printable[0] - self.overlap, self.printable[1] - self.overlap)
+        if min(self.step) <= 0:
+            raise ValueError("The margins and overlap leave no room on a %gx%gmm page" % tuple(page))
+
+        symbols = patron_nesting.find_symbols(root)
+        self.items = []
+        self.index = patron_nesting.BoxIndex(max(self.step))
+        for element, matrix in drawn_elements(root):
+            try:
+                box = element_bbox(element, matrix, symbols)
+            except ValueError as error:
+                sys.stderr.write('skipped %s %s: %s\n' % (patron_nesting._local_name(element.tag),
+                                                         element.get('id', ''), error))
+                continue
+            if box is not None:
+                self.items.append((element, matrix))
+                self.index.insert(box)
+        self.bbox = _union(self.index.boxes)
+
+        # Pages covering the drawing, the drawing being centered on them
+        self.columns = self.rows = 0
+        self.origin = (0.0, 0.0)
+        if self.bbox is not None:
+            size = (self.bbox[2] - self.bbox[0], self.bbox[3] - self.bbox[1])
+            counts = [max(1, int(math.ceil((size[axis] - self.printable[axis]) / self.step[axis]) + 1))
+                      for axis in (0, 1)]
+            self.columns, self.rows = counts
+            self.origin = tuple(self.bbox[axis] - (self.printable[axis] + (counts[axis] - 1) * self.step[axis] -
+                                                   size[axis]) / 2 for axis in (0, 1))
+
+    def window(self, column, row):
+        """ Printable area of a page, in document units (x0, y0, x1, y1) """
+        x0 = self.origin[0] + column * self.step[0]
+        y0 = self.origin[1] + row * self.step[1]
+        return x0, y0, x0 + self.printable[0], y0 + self.printable[1]
+
+    def page_names(self):
+        """ - return the (name, column, row) of the pages which draw something, in reading order """
+        return [(column_name(column) + str(row + 1), column, row)
+                for row in range(self.rows) for column in range(self.columns)
+                if self.index.query(self.window(column, row))]
+
+    def pages(self):
+        """
+            Build the pages one by one.
+            - yield (name, page group) pairs, the page group being drawn in paper coordinates
+        """
+        names = self.page_names()
+        for number, (name, column, row) in enumerate(names):
+            yield name, self.page(name, column, row, number + 1, len(names))
+
+    def page(self, name, column, row, number=1, count=1):
+        """ Group drawing a page, in paper coordinates: its elements, registration marks and label """
+        x0, y0, x1, y1 = window = self.window(column, row)
+        group = Etree.Element(SVG + 'g', {
+            LABEL: 'Page %s' % name, GROUPMODE: 'layer',
+            'transform': 'translate(%s,%s)' % (_number(self.margin - x0), _number(self.margin - y0))})
+
+        clip_id = 'patron-page-%s' % name
+        clip = Etree.SubElement(Etree.SubElement(group, SVG + 'defs'), SVG + 'clipPath', {'id': clip_id})
+        Etree.SubElement(clip, SVG + 'rect', {'x': _number(x0), 'y': _number(y0), 'width': _number(x1 - x0),
+                                              'height': _number(y1 - y0)})
+        content = Etree.SubElement(group, SVG + 'g', {LABEL: 'Page %s content' % name,
+                                                      'clip-path': 'url(#%s)' % clip_id})
+        for index in self.index.query(window):
+            element, matrix = self.items[index]
+            drawn = copy.deepcopy(element)
+            drawn.tail = None
+            transform = patron_path.format_transform(matrix)
+            if transform:
+                drawn.set('transform', transform)
+            elif 'transform' in drawn.attrib:
+                del drawn.attrib['transform']
+            content.append(drawn)
+
+        # Registration marks in the middle of the overlap bands, at the corners of the page
+        stroke = MARK_STROKE * self.scale
+        radius = MARK_RADIUS * self.scale
+        marks = Etree.SubElement(group, SVG + 'g', {LABEL: 'Page %s marks' % name,
+                                                    'style': 'fill:none;stroke:#000000;stroke-width:%s' %
+                                                             _number(stroke)})
+        half = self.overlap / 2
+        for x in (x0 + half, x1 - half):
+            for y in (y0 + half, y1 - half):
+                Etree.SubElement(marks, SVG + 'circle', {'cx': _number(x), 'cy': _number(y), 'r': _number(radius)})
+                Etree.SubElement(marks, SVG + 'path', {'d': 'M %s,%s H %s M %s,%s V %s' % tuple(_number(v) for v in (
+                    x - 2 * radius, y, x + 2 * radius, x, y - 2 * radius, y + 2 * radius))})
+
+        # Label in the bottom overlap band, between the marks, so that it is printed
+        height = LABEL_HEIGHT * self.scale
+        text = Etree.SubElement(group, SVG + 'text', {
+            LABEL: 'Page %s label' % name, 'x': _number(x0 + self.overlap),
+            'y': _number(min(y1 - half + height / 2, y1)),
+            'style': 'font-size:%spx;font-family:sans-serif;fill:#000000' % _number(height)})
+        text.text = '%s - page %d/%d - column %d/%d, row %d/%d' % (name, number, count, column + 1, self.columns,
+                                                                 row + 1, self.rows)
+        return group
+
+    def document(self, *groups):
+        """ Page size svg document holding the shared definitions of the source and the given page groups """
+        root = Etree.Element(SVG + 'svg', {
+            'width': '%smm' % _number(self.paper[0] / self.scale),
+            'height': '%smm' % _number(self.paper[1] / self.scale),
+            'viewBox': '0 0 %s %s' % (_number(self.paper[0]), _number(self.paper[1])), 'version': '1.1'})
+        for element in self.root:
+            if patron_nesting._local_name(element.tag) == 'defs':
+                root.append(copy.deepcopy(element))
+        for group in groups:
+            root.append(group)
+        return root
+
+
+def _number(value):
+    return ('%.4f' % value).rstrip('0').rstrip('.')
+
+
+# ---------------------------------------------------------------- #
+#                            OUTPUT
+# ---------------------------------------------------------------- #
+def register_namespaces():
+    for prefix, uri in NSS.items():
+        Etree.register_namespace('' if prefix == 'svg' else prefix, uri)
+
+
+def write_pages(tiling, directory):
+    """
+        Write every page to its own svg file, as soon as it is built.
+        - return the list of the written files
+    """
+    register_namespaces()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    files = []
+    for name, group in tiling.pages():
+        filename = os.path.join(directory, 'page_%s.svg' % name)
+        Etree.ElementTree(tiling.document(group)).write(filename, encoding='UTF-8', xml_declaration=True)
+        files.append(filename)
+    return files
+
+
+def write_layers(tiling, stream):
+    """
+        Stream every page to a single svg document, as a layer of the page size (only the first one visible).
+        - return the number of pages
+    """
+    register_namespaces()
+    count = 0
+    with patron_stream.SvgStream(stream, Etree.tostring(tiling.document(), encoding='UTF-8')) as output:
+        for name, group in tiling.pages():
+            if count:
+                group.set('style', 'display:none')
+            output.write_template(Etree.tostring(group) + b'\n')
+            count += 1
+    return count
+
+
+# ---------------------------------------------------------------- #
+#                             MAIN
+# ---------------------------------------------------------------- #
+def main(argv=None):
+    parser = optparse.OptionParser(usage="usage: %prog [options] template.svg")
+    parser.add_option("-o", "--output", type="string", dest="output", default='pages',
+                      help="Output directory of the pages, or svg file with --layers ('-' for stdout)")
+    parser.add_option("-p", "--page", type="string", dest="page", default='A4',
+                      help="Paper size: %s, or WIDTHxHEIGHT in mm" % ', '.join(sorted(PAGE_SIZES)))
+    parser.add_option("--landscape", action="store_true", dest="landscape", default=False,
+                      help="Landscape pages")
+    parser.add_option("--margin", type="float", dest="margin", default=MARGIN,
+                      help="Unprintable margin of the printer in mm")
+    parser.add_option("--overlap", type="float", dest="overlap", default=OVERLAP,
+                      help="Width of the band shared by neighbouring pages in mm")
+    parser.add_option("--layers", action="store_true", dest="layers", default=False,
+                      help="Write a single svg file with one layer per page instead of one file per page")
+    options, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("a single svg file is expected")
+
+    if options.page.upper() in PAGE_SIZES:
+        page = PAGE_SIZES[options.page.upper()]
+    else:
+        page = tuple(float(v) for v in options.page.lower().split('x'))
+    if options.landscape:
+        page = (max(page), min(page))
+
+    tiling = Tiling(Etree.parse(args[0]).getroot(), page, options.margin, options.overlap)
+    if options.layers:
+        if options.output == '-':
+            count = write_layers(tiling, getattr(sys.stdout, 'buffer', sys.stdout))
+        else:
+            with open(options.output, 'wb') as stream:
+                count = write_layers(tiling, stream)
+    else:
+        count = len(write_pages(tiling, options.output))
+    sys.stderr.write('%d pages (%d columns x %d rows)\n' % (count, tiling.columns, tiling.rows))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
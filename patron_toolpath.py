@@ -0,0 +1,315 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Toolpath ordering of the 'cut' style templates.
+
+A laser cutter or a plotter follows the paths in document order, moving with
+the tool off between the end of a path and the start of the next one. This
+module collects every path (and vertex circle) of a group, then reorders them
+to shorten that travel:
+ - a nearest neighbour tour starting from the machine origin, entering every
+   closed path at its nearest vertex and every open path by its nearest end
+ - improved by 2-opt moves until no move helps or the time budget is spent
+ - the start vertex of the closed paths is finally chosen between their neighbours
+
+The reordered paths replace the original ones where they were, so that the
+template keeps its pieces for the update, the nesting and the overlay: one path
+element per subpath, with its transforms applied and its rank in the tour as a
+'patron:order' attribute. The children of every group are then sorted by the
+first rank they contain, which gives the tour in document order as long as it
+cuts the pieces one after the other (patron_plot follows the ranks in any case).
+-----------------------------------------------
+"""
+
+import math
+import time
+
+import patron_nesting
+import patron_path
+import patron_update
+
+__version__ = '1'
+
+SVG_NS = 'http://www.w3.org/2000/svg'
+LABEL = '{http://www.inkscape.org/namespaces/inkscape}label'
+ORDER = '{%s}order' % patron_update.PATRON_NS
+
+# Control points distance of the cubic curves approximating a quarter of circle
+KAPPA = 0.5522847498
+
+
+# ---------------------------------------------------------------- #
+#                       UTILITY FUNCTIONS
+# ---------------------------------------------------------------- #
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else ''
+
+
+def _hidden(element):
+    return 'display:none' in (element.get('style') or '').replace(' ', '')
+
+
+def _distance(a, b):
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+
+def circle_segments(cx, cy, r):
+    """ Closed subpath of a circle made of four cubic curves, starting on its right """
+    k = KAPPA * r
+    return ((cx + r, cy), [
+        ('C', [(cx + r, cy + k), (cx + k, cy + r), (cx, cy + r)]),
+        ('C', [(cx - k, cy + r), (cx - r, cy + k), (cx - r, cy)]),
+        ('C', [(cx - r, cy - k), (cx - k, cy - r), (cx, cy - r)]),
+        ('C', [(cx + k, cy - r), (cx + r, cy - k), (cx + r, cy)])
+    ], True)
+
+
+class Toolpath(object):
+    """
+        A single subpath to cut, in the coordinates of the optimized group.
+        - element is the element to replace, under parent, and styled the element
+          drawing the subpath (a symbol child when element is a <use>)
+        - matrix is the transform from the parent coordinates to the optimized group ones
+    """
+
+    def __init__(self, element, parent, start, segments, closed, styled=None, matrix=patron_path.IDENTITY):
+        self.element = element
+        self.parent = parent
+        self.matrix = matrix
+        self.styled = element if styled is None else styled
+        self.closed = closed
+        if closed and segments and segments[-1][1][-1] != start:
+            # make the closing line explicit so that any vertex can start the path
+            segments = segments + [('L', [start])]
+        self.start = start
+        self.segments = segments
+        self.anchors = [start] + [segment[-1] for cmd, segment in segments]
+        if closed:
+            self.anchors.pop()
+        xs = [x for x, y in self.anchors]
+        ys = [y for x, y in self.anchors]
+        self.bbox = (min(xs), min(ys), max(xs), max(ys))
+
+    @property
+    def end(self):
+        return self.start if self.closed else self.anchors[-1]
+
+    def lower_bound(self, point):
+        """ Distance from point to the bounding box of the path """
+        dx = max(self.bbox[0] - point[0], 0, point[0] - self.bbox[2])
+        dy = max(self.bbox[1] - point[1], 0, point[1] - self.bbox[3])
+        return math.hypot(dx, dy)
+
+    def nearest_entry(self, point):
+        """
+            Best way to enter the path from point.
+            - return (distance, entry) where entry is the starting vertex index
+              of a closed path, or True for a reversed open path
+        """
+        if self.closed:
+            best = min(range(len(self.anchors)), key=lambda k: _distance(point, self.anchors[k]))
+            return _distance(point, self.anchors[best]), best
+        forward, backward = _distance(point, self.anchors[0]), _distance(point, self.anchors[-1])
+        return (forward, False) if forward <= backward else (backward, True)
+
+    def entry_exit(self, entry):
+        """ Entry and exit points of the path entered the given way """
+        if self.closed:
+            return self.anchors[entry], self.anchors[entry]
+        if entry:
+            return self.anchors[-1], self.anchors[0]
+        return self.anchors[0], self.anchors[-1]
+
+    def oriented(self, entry):
+        """ (start, segments) of the path entered the given way """
+        if self.closed:
+            if entry == 0:
+                return self.start, self.segments
+            return self.anchors[entry], self.segments[entry:] + self.segments[:entry]
+        if entry:
+            return patron_path.reverse_segments(self.start, self.segments)
+        return self.start, self.segments
+
+
+# ---------------------------------------------------------------- #
+#                         COLLECTING
+# ---------------------------------------------------------------- #
+def collect(group, symbols=None, visible=False):
+    """
+        Collect the paths and circles under group, with their transforms applied.
+        - symbols: the symbols referenced by <use> elements, by id (see patron_nesting.find_symbols)
+        - visible: skip the hidden ('display:none') elements and their children
+        - return the list of Toolpath in document order
+    """
+    toolpaths = []
+
+    def walk(parent, matrix, use=None):
+        # use is the (element, parent, matrix of the parent) of the <use> being expanded
+        for element in list(parent):
+            name = _local_name(element.tag)
+            if visible and _hidden(element):
+                continue
+            element_matrix = patron_path.compose_transform(matrix,
+                                                           patron_path.parse_transform(element.get('transform')))
+            if name == 'g':
+                walk(element, element_matrix, use)
+                continue
+            if name == 'use' and use is None:
+                target, placement = patron_nesting.use_target(element, symbols)
+                if target is not None:
+                    walk(target, patron_path.compose_transform(element_matrix, placement), (element, parent, matrix))
+                continue
+            if name == 'path' and element.get('d'):
+                subpaths = patron_path.path_segments(element.get('d'))
+            elif name == 'circle':
+                subpaths = [circle_segments(float(element.get('cx', 0)), float(element.get('cy', 0)),
+                                            float(element.get('r', 0)))]
+            else:
+                continue
+            owner, owner_parent, owner_matrix = use if use is not None else (element, parent, matrix)
+            for start, segments, closed in subpaths:
+                start = patron_path.apply_transform(element_matrix, [start])[0]
+                segments = [(cmd, patron_path.apply_transform(element_matrix, points)) for cmd, points in segments]
+                if segments:
+                    toolpaths.append(Toolpath(owner, owner_parent, start, segments, closed, element, owner_matrix))
+
+    walk(group, patron_path.IDENTITY)
+    return toolpaths
+
+
+# ---------------------------------------------------------------- #
+#                           ORDERING
+# ---------------------------------------------------------------- #
+def travel(toolpaths, order, entries, origin=(0.0, 0.0)):
+    """ Total distance travelled with the tool off, from origin """
+    total = 0.0
+    position = origin
+    for index, entry in zip(order, entries):
+        start, end = toolpaths[index].entry_exit(entry)
+        total += _distance(position, start)
+        position = end
+    return total
+
+
+def nearest_neighbour(toolpaths, origin=(0.0, 0.0)):
+    """ Greedy tour, always going to the nearest remaining path """
+    remaining = set(range(len(toolpaths)))
+    order, entries = [], []
+    position = origin
+    while remaining:
+        best = None
+        for index in sorted(remaining, key=lambda i: toolpaths[i].lower_bound(position)):
+            if best is not None and toolpaths[index].lower_bound(position) >= best[0]:
+                break
+            distance, entry = toolpaths[index].nearest_entry(position)
+            if best is None or distance < best[0]:
+                best = (distance, index, entry)
+        distance, index, entry = best
+        remaining.remove(index)
+        order.append(index)
+        entries.append(entry)
+        position = toolpaths[index].entry_exit(entry)[1]
+    return order, entries
+
+
+def two_opt(toolpaths, order, entries, origin=(0.0, 0.0), deadline=None):
+    """
+        Improve a tour by reversing sub-sequences while it shortens the travel.
+        Reversing a sub-sequence also reverses the direction of its open paths.
+    """
+    order, entries = list(order), list(entries)
+    count = len(order)
+    improved = True
+    while improved:
+        improved = False
+        points = [toolpaths[index].entry_exit(entry) for index, entry in zip(order, entries)]
+        for i in range(count - 1):
+            if deadline is not None and time.time() > deadline:
+                return order, entries
+            before = origin if i == 0 else points[i - 1][1]
+            for j in range(i + 1, count):
+                after = points[j + 1][0] if j + 1 < count else None
+                old = _distance(before, points[i][0]) + (_distance(points[j][1], after) if after else 0)
+                new = _distance(before, points[j][1]) + (_distance(points[i][0], after) if after else 0)
+                if new < old - 1e-9:
+                    order[i:j + 1] = order[i:j + 1][::-1]
+                    entries[i:j + 1] = [entry if toolpaths[index].closed else not entry
+                                        for index, entry in zip(order[i:j + 1], entries[i:j + 1][::-1])]
+                    points[i:j + 1] = [(end, start) for start, end in points[i:j + 1][::-1]]
+                    improved = True
+                    before = origin if i == 0 else points[i - 1][1]
+    return order, entries
+
+
+def refine_entries(toolpaths, order, entries, origin=(0.0, 0.0)):
+    """ Choose the start vertex of every closed path between its neighbours """
+    entries = list(entries)
+    for position, index in enumerate(order):
+        toolpath = toolpaths[index]
+        if not toolpath.closed:
+            continue
+        before = origin if position == 0 else toolpaths[order[position - 1]].entry_exit(entries[position - 1])[1]
+        after = None if position + 1 == len(order) else \
+            toolpaths[order[position + 1]].entry_exit(entries[position + 1])[0]
+        entries[position] = min(range(len(toolpath.anchors)), key=lambda k: _distance(
+            before, toolpath.anchors[k]) + (_distance(toolpath.anchors[k], after) if after else 0))
+    return entries
+
+
+def optimize(group, time_budget=1.0, origin=(0.0, 0.0), precision=3, symbols=None):
+    """
+        Reorder the paths under group to minimise the travel of the tool.
+        - symbols: the symbols referenced by <use> elements, by id
+        - return the travel distance (before, after) in the group coordinates
+    """
+    toolpaths = collect(group, symbols)
+    if not toolpaths:
+        return 0.0, 0.0
+    deadline = time.time() + time_budget
+    before = travel(toolpaths, range(len(toolpaths)), [0 if t.closed else False for t in toolpaths], origin)
+
+    order, entries = nearest_neighbour(toolpaths, origin)
+    order, entries = two_opt(toolpaths, order, entries, origin, deadline)
+    entries = refine_entries(toolpaths, order, entries, origin)
+    after = travel(toolpaths, order, entries, origin)
+
+    # Replace the original elements by the ordered paths, in their own parents
+    for rank, (index, entry) in enumerate(zip(order, entries)):
+        toolpath = toolpaths[index]
+        start, segments = toolpath.oriented(entry)
+        inverse = patron_path.invert_transform(toolpath.matrix)
+        start = patron_path.apply_transform(inverse, [start])[0]
+        segments = [(cmd, patron_path.apply_transform(inverse, points)) for cmd, points in segments]
+        attribs = dict((key, value) for key, value in toolpath.styled.attrib.items()
+                       if key in ('style', 'class', LABEL))
+        attribs['d'] = patron_path.format_segments(start, segments, toolpath.closed, precision)
+        attribs[ORDER] = str(rank)
+        toolpath.parent.insert(toolpath.parent.index(toolpath.element),
+                               group.makeelement('{%s}path' % SVG_NS, attribs))
+    for toolpath in toolpaths:
+        if toolpath.element.getparent() is toolpath.parent:
+            toolpath.parent.remove(toolpath.element)
+    sort_by_order(group)
+    return before, after
+
+
+def sort_by_order(element):
+    """
+        Sort the children of element, recursively, by the first cut order they contain.
+        The children without any cut order keep their place.
+        - return the first cut order under element, None if there is none
+    """
+    if element.get(ORDER) is not None:
+        return int(element.get(ORDER))
+    children = list(element)
+    firsts = [sort_by_order(child) for child in children]
+    slots = [position for position, first in enumerate(firsts) if first is not None]
+    ranked = sorted((first, position) for position, first in enumerate(firsts) if first is not None)
+    for position in slots:
+        element.remove(children[position])
+    for slot, (first, position) in zip(slots, ranked):
+        element.insert(slot, children[position])
+    return ranked[0][0] if ranked else None
@@ -0,0 +1,147 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+-----------------------------------------------
+                  DESCRIPTION
+-----------------------------------------------
+Incremental re-render of the Patron templates.
+
+Instead of appending a new template group at every run, the extension renders
+the template in a detached group, then updates in place the template group it
+generated on a previous run, when that group (or one of its elements) is
+selected. Without a selection, a new template is added, so that the template
+of another customer is never overwritten:
+ - the elements are matched by their tag name and label (and rank among the
+   elements sharing both), the labels being taken without the template label
+   prefix which holds some of the measurements
+ - only the attributes and texts that changed are rewritten
+ - the parts that are new are inserted, the parts not rendered anymore removed
+The matched elements keep their identity: ids, Inkscape locks and any other
+attribute the extension does not write are preserved.
+
+The template groups carry the type of template they render and the options
+used, so that they can be recognised whatever their label.
+-----------------------------------------------
+"""
+
+import patron_nesting
+
+__version__ = '1'
+
+PATRON_NS = 'https://github.com/misterjeckyll/TemplateGenerator'
+TYPE = '{%s}type' % PATRON_NS
+PARAMS = '{%s}params' % PATRON_NS
+
+LABEL = patron_nesting.LABEL
+
+# Attributes of the previous render kept even if the new render does not write them
+KEPT_ATTRIBUTES = ('id',)
+KEPT_NAMESPACES = ('{%s}' % patron_nesting.NSS['inkscape'],)
+
+# Template kind of the legacy groups, by label prefix
+KIND_PREFIXES = (('Patron_T-shirt_', 'perso'), ('T-shirt_template_', 'saved'))
+
+
+# ---------------------------------------------------------------- #
+#                       FINDING TEMPLATES
+# ---------------------------------------------------------------- #
+def template_kind(element):
+    """
+        Kind of template rendered by a group: 'perso' (user measurements),
+        'saved' (saved template of 'patron.xml') or None if not a template group.
+    """
+    template_type = element.get(TYPE)
+    if template_type is not None:
+        return 'perso' if template_type == 'perso' else 'saved'
+    label = element.get(LABEL) or ''
+    for prefix, kind in KIND_PREFIXES:
+        if label.startswith(prefix):
+            return kind
+    return None
+
+
+def template_params(options, names):
+    """ Text of the rendering options stored on a template group """
+    return ';'.join('%s=%s' % (name, getattr(options, name)) for name in names)
+
+
+def find_template(selected=()):
+    """
+        Find the template group of a previous run to update: the selected template
+        group, or the template containing a selected element, whatever its kind.
+        - return None if no template is selected
+    """
+    for element in selected:
+        while element is not None:
+            if template_kind(element) is not None:
+                return element
+            element = element.getparent()
+    return None
+
+
+# ---------------------------------------------------------------- #
+#                          RECONCILING
+# ---------------------------------------------------------------- #
+def _update_element(old, new):
+    """
+        Copy the attributes and text of new onto old.
+        - return True if anything changed
+    """
+    changed = False
+    for key, value in new.attrib.items():
+        if old.get(key) != value:
+            old.set(key, value)
+            changed = True
+    for key in list(old.attrib.keys()):
+        if key not in new.attrib and key not in KEPT_ATTRIBUTES and not key.startswith(KEPT_NAMESPACES):
+            del old.attrib[key]
+            changed = True
+    if (old.text or '') != (new.text or ''):
+        old.text = new.text
+        changed = True
+    return changed
+
+
+def _key(element, prefix):
+    """ Matching key of an element: its tag name and its label, less the template label prefix """
+    label = element.get(LABEL)
+    if label and prefix and label.startswith(prefix):
+        label = label[len(prefix):]
+    return patron_nesting._local_name(element.tag), label
+
+
+def reconcile(old, new, old_prefix=None, new_prefix=None):
+    """
+        Update the old element tree in place so that it renders like new.
+        The labels of the template parts start with the template label, which
+        depends on the measurements: they are matched without it.
+        The new tree is consumed: its unmatched elements are moved into old.
+        - return (changed, added, removed) element counts
+    """
+    if old_prefix is None:
+        old_prefix, new_prefix = old.get(LABEL), new.get(LABEL)
+    changed = 1 if _update_element(old, new) else 0
+    added = removed = 0
+
+    # Old children by matching key, in document order
+    remaining = {}
+    for child in old:
+        remaining.setdefault(_key(child, old_prefix), []).append(child)
+
+    for index, child in enumerate(list(new)):
+        candidates = remaining.get(_key(child, new_prefix))
+        if candidates:
+            match = candidates.pop(0)
+            counts = reconcile(match, child, old_prefix, new_prefix)
+            changed, added, removed = changed + counts[0], added + counts[1], removed + counts[2]
+        else:
+            match = child
+            added += 1
+        if index >= len(old) or old[index] is not match:
+            old.insert(index, match)
+
+    for candidates in remaining.values():
+        for child in candidates:
+            old.remove(child)
+            removed += 1
+    return changed, added, removed